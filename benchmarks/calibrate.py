@@ -0,0 +1,92 @@
+"""
+Measures the peak memory and time taken by each solving strategy (and by the
+sparse and flow solvers for unmasked solves) at a few sizes, and saves the per-unit
+costs used by the Planner (to .calibration in the current directory by default,
+where Planner.load() will find it).
+
+Each measurement runs in a fresh process so the peak memory is its own.
+
+    python -m benchmarks.calibrate [output path]
+"""
+import multiprocessing
+import resource
+import sys
+from datetime import datetime as dt
+
+import numpy as np
+
+from linnaeus import Builder, config
+from linnaeus.planner import Planner
+from .helpers import random_components, random_reference
+
+sizes = {
+    'dense': [(500, 2500), (1000, 5000), (2000, 10000)],
+    'masked': [(500, 2500), (1000, 5000), (2000, 10000)],
+    'top_k': [(5000, 25000), (10000, 50000), (20000, 100000)],
+    'tiled': [(1000, 5000), (2000, 10000), (3000, 15000)],
+    # unmasked solves use the sparse solver above dense_solver_limit (1e8 cells by
+    # default), so the largest of these is above it; it peaks at about 4.5 GB
+    'sparse': [(2000, 10000), (2500, 20000), (2500, 42000)],
+    'flow': [(500, 2500), (1000, 5000), (2000, 10000)]
+    }
+top_k = 20
+tiles = 4
+
+
+def measure(strategy, rows, cols):
+    config.silence()
+    ref_map = random_reference(rows)
+    comp_map = random_components(cols)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = dt.now()
+    if strategy == 'dense':
+        Builder.solve(ref_map, comp_map, use_mask=False)
+    elif strategy == 'masked':
+        Builder.solve(ref_map, comp_map, use_mask=True)
+    elif strategy == 'top_k':
+        Builder.solve(ref_map, comp_map, top_k=top_k)
+    elif strategy == 'tiled':
+        Builder.solve_tiled(ref_map, comp_map, tiles=tiles, workers=1)
+    else:
+        Builder.solve(ref_map, comp_map, use_mask=False, backend=strategy)
+    elapsed = (dt.now() - start).total_seconds()
+    # ru_maxrss is in KB on Linux
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * 1024
+    return peak, elapsed
+
+
+def fit(units, measured):
+    """
+    Fits measured = base + rate * units by least squares.
+    :return: base, rate (neither negative)
+    """
+    a = np.c_[np.ones(len(units)), units]
+    base, rate = np.linalg.lstsq(a, np.array(measured, dtype=float), rcond=None)[0]
+    return max(float(base), 0.0), max(float(rate), 0.0)
+
+
+def main(path='.calibration'):
+    context = multiprocessing.get_context('spawn')
+    calibration = {}
+    for strategy in Planner.strategies + Planner.solvers:
+        memory_units, time_units, peaks, times = [], [], [], []
+        for rows, cols in sizes[strategy]:
+            with context.Pool(1) as pool:
+                peak, elapsed = pool.apply(measure, (strategy, rows, cols))
+            m, t = Planner.units(strategy, rows, cols, top_k=top_k, tiles=tiles)
+            memory_units.append(m)
+            time_units.append(t)
+            peaks.append(peak)
+            times.append(elapsed)
+            print(f'{strategy:8}{rows}x{cols}  {peak / 2 ** 20:8.1f} MB  '
+                  f'{elapsed:8.3f}s')
+        calibration[strategy] = dict(zip(('base_bytes', 'bytes'),
+                                         fit(memory_units, peaks)),
+                                     **dict(zip(('base_seconds', 'seconds'),
+                                                fit(time_units, times))))
+    Planner(calibration).dump(path)
+    print(f'saved to {path}')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
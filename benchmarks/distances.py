@@ -0,0 +1,51 @@
+"""
+Compares calculating the normalised cost matrix with sparse matrices and sklearn's
+pairwise_distances (the old method) against the numba kernel in Builder.distances.
+
+    python -m benchmarks.distances [rows] [cols]
+"""
+import sys
+from datetime import datetime as dt
+
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import pairwise_distances
+
+from linnaeus import Builder
+
+
+def sparse_costs(ref_colours, comp_colours):
+    xy = pairwise_distances(sparse.csr_matrix(ref_colours),
+                            sparse.csr_matrix(comp_colours))
+    return (xy.T - xy.min(axis=1)).T.astype(int)
+
+
+def main(rows=2000, cols=20000):
+    rng = np.random.default_rng(0)
+    ref_colours = rng.integers(0, 256, (rows, 3))
+    comp_colours = rng.integers(0, 256, (cols, 3))
+    # compile the kernel first so that isn't timed
+    Builder.distances(ref_colours[:1], comp_colours[:1])
+    Builder.distances(ref_colours[:1].astype(np.uint8),
+                      comp_colours[:1].astype(np.uint8))
+
+    print(f'{rows}x{cols}')
+    start = dt.now()
+    expected = sparse_costs(ref_colours, comp_colours)
+    print(f'  {"sparse":24}{(dt.now() - start).total_seconds():8.3f}s')
+    methods = [
+        ('kernel (float32)', ref_colours, comp_colours, False),
+        ('kernel (uint8)', ref_colours.astype(np.uint8),
+         comp_colours.astype(np.uint8), False),
+        ('kernel (circular hue)', ref_colours, comp_colours, True)
+        ]
+    for label, ref, comp, circular_hue in methods:
+        start = dt.now()
+        costs = Builder.distances(ref, comp, circular_hue)
+        elapsed = (dt.now() - start).total_seconds()
+        print(f'  {label:24}{elapsed:8.3f}s  '
+              f'differences: {(costs != expected).sum()}')
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
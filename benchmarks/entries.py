@@ -0,0 +1,47 @@
+"""
+Measures how quickly map entries are hashed, compared and looked up: sorting the
+records of a reference map, sorting its keys, looking up every record by key, and
+counting the keys that share a hash.
+
+    python -m benchmarks.entries [records]
+"""
+import random
+import sys
+from datetime import datetime as dt
+
+from linnaeus import config
+from linnaeus.models import CoordinateEntry, HsvEntry
+from .helpers import random_reference
+
+
+def timed(label, n, fn):
+    start = dt.now()
+    result = fn()
+    elapsed = (dt.now() - start).total_seconds()
+    print(f'  {label:24}{elapsed:8.3f}s  {n / elapsed:12,.0f}/s')
+    return result
+
+
+def main(n=100000):
+    config.silence()
+    ref_map = random_reference(n)
+    print(f'{n} records')
+    keys = [CoordinateEntry(x, y) for x, y in ref_map.column('xy').tolist()]
+    values = [HsvEntry(*hsv) for hsv in ref_map.column('hsv').tolist()]
+    records = list(ref_map.records)
+    # the map's records are already sorted
+    rng = random.Random(0)
+    for entries in (keys, values, records):
+        rng.shuffle(entries)
+    timed('make entries', n,
+          lambda: [HsvEntry(*hsv) for hsv in ref_map.column('hsv').tolist()])
+    timed('sort values', n, lambda: sorted(values))
+    timed('sort keys', n, lambda: sorted(keys))
+    timed('sort records', n, lambda: sorted(records))
+    timed('look up records', n, lambda: [ref_map[k] for k in keys])
+    timed('set of keys', n, lambda: set(keys))
+    print(f'  {n - len({hash(k) for k in keys})} keys share a hash')
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
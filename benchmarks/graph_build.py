@@ -0,0 +1,59 @@
+"""
+Compares the time taken to build the min cost flow network one arc at a time (the
+old method) against adding the arcs in blocks with FlowSolver.network.
+
+    python -m benchmarks.graph_build [rows] [cols]
+"""
+import sys
+from datetime import datetime as dt
+
+from ortools.graph.python import min_cost_flow
+
+from linnaeus import Builder, config
+from linnaeus.solvers import FlowSolver
+from .helpers import random_components, random_reference
+
+
+def loop_network(cost_matrix, rows, cols, use_mask):
+    solver = min_cost_flow.SimpleMinCostFlow()
+    last_node = rows + cols + 1
+    for i in range(1, rows + 1):
+        solver.add_arc_with_capacity_and_unit_cost(0, i, 1, 0)
+    if use_mask:
+        for r, c, cost in cost_matrix.tolist():
+            solver.add_arc_with_capacity_and_unit_cost(r, c, 1, cost)
+    else:
+        costs = cost_matrix[:, 0].tolist()
+        for r in range(rows):
+            for c in range(cols):
+                solver.add_arc_with_capacity_and_unit_cost(r + 1, rows + c + 1, 1,
+                                                           costs[r * cols + c])
+    for i in range(rows + 1, last_node):
+        solver.add_arc_with_capacity_and_unit_cost(i, last_node, 1, 0)
+    solver.set_node_supply(0, rows)
+    solver.set_node_supply(last_node, -rows)
+    return solver
+
+
+def timed(fn, *args):
+    start = dt.now()
+    fn(*args)
+    return (dt.now() - start).total_seconds()
+
+
+def main(rows=1000, cols=5000):
+    config.silence()
+    ref_map = random_reference(rows)
+    comp_map = random_components(cols)
+    for use_mask in (True, False):
+        cost_matrix, r, c = Builder.cost_matrix(ref_map, comp_map, use_mask=use_mask,
+                                                mask_tolerance=-1)
+        loop = timed(loop_network, cost_matrix, r, c, use_mask)
+        bulk = timed(FlowSolver.network, cost_matrix, r, c, use_mask)
+        print(f'{"masked" if use_mask else "unmasked"}: {r}x{c}, '
+              f'{cost_matrix.shape[0]} cost arcs')
+        print(f'  loop: {loop:.3f}s  bulk: {bulk:.3f}s  ({loop / bulk:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,35 @@
+import numpy as np
+
+from linnaeus.models import (ComponentMap, CoordinateEntry, HsvEntry, LocationEntry,
+                             ReferenceMap)
+
+
+def random_reference(n, seed=0):
+    """
+    Makes a roughly square ReferenceMap with n pixels of random colours.
+    :param n: the number of pixels
+    :param seed: seed for the random generator
+    :return: ReferenceMap
+    """
+    rng = np.random.default_rng(seed)
+    w = int(np.ceil(np.sqrt(n)))
+    hsv = rng.integers(0, 256, (n, 3))
+    with ReferenceMap() as ref_map:
+        for i, (h, s, v) in enumerate(hsv.tolist()):
+            ref_map.add(CoordinateEntry(i % w, i // w), HsvEntry(h, s, v))
+    return ref_map
+
+
+def random_components(n, seed=1):
+    """
+    Makes a ComponentMap with n components of random colours.
+    :param n: the number of components
+    :param seed: seed for the random generator
+    :return: ComponentMap
+    """
+    rng = np.random.default_rng(seed)
+    hsv = rng.integers(0, 256, (n, 3))
+    with ComponentMap() as comp_map:
+        for i, (h, s, v) in enumerate(hsv.tolist()):
+            comp_map.add(LocationEntry(f'specimens/{i}.jpg'), HsvEntry(h, s, v))
+    return comp_map
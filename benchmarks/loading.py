@@ -0,0 +1,60 @@
+"""
+Compares the time taken and peak memory used to load a large component map: reading
+the whole file and parsing it twice (once to identify the map type, the old method),
+parsing it a chunk at a time, and loading the binary (.npz) version. Most of the
+peak memory is the loaded map itself (mainly its paths), which is the same for all
+three.
+
+    python -m benchmarks.loading [components]
+"""
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime as dt
+
+from linnaeus import MapFactory, config
+from .helpers import random_components
+
+
+def whole(path):
+    with open(path, 'r') as f:
+        txt = f.read()
+    json.loads(txt)
+    return MapFactory.component().deserialise(txt)
+
+
+def measure(label, fn, path, size):
+    start = dt.now()
+    loaded_map = fn(path)
+    elapsed = (dt.now() - start).total_seconds()
+    # tracing slows everything down, so it's timed and traced separately
+    tracemalloc.start()
+    fn(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'  {label:24}{elapsed:8.3f}s  {peak / 2 ** 20:8.1f} MB peak '
+          f'({peak / size:.1f}x the JSON file)')
+    return loaded_map
+
+
+def main(components=300000):
+    config.silence()
+    comp_map = random_components(components)
+    with tempfile.TemporaryDirectory() as d:
+        json_path = os.path.join(d, 'components.json')
+        npz_path = os.path.join(d, 'components.npz')
+        MapFactory.save(json_path, comp_map)
+        MapFactory.save(npz_path, comp_map)
+        size = os.path.getsize(json_path)
+        print(f'{components} components, {size / 2 ** 20:.1f} MB of JSON, '
+              f'{os.path.getsize(npz_path) / 2 ** 20:.1f} MB binary')
+        expected = measure('whole file, two parses', whole, json_path, size)
+        loaded_map = measure('chunked', MapFactory.load, json_path, size)
+        assert loaded_map.serialise() == expected.serialise()
+        measure('binary', MapFactory.load, npz_path, size)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,69 @@
+"""
+Compares reducing a component map by uniform random sampling with reducing it for a
+reference (ComponentMap.reduce with a reference map), showing the total cost of an
+unmasked solve with each reduced pool and whether a masked solve is feasible.
+
+Only the top rows of the reference are used, so the unmasked solves are quick.
+
+    python -m benchmarks.reduce [pixels] [reference map] [component map]
+"""
+import copy
+import sys
+from datetime import datetime as dt
+
+import numpy as np
+
+from linnaeus import Builder, MapFactory, config
+from linnaeus.models import ComponentMap, ReferenceMap
+
+pool_factors = [1.05, 1.25, 1.5, 2]
+
+
+def uniform(comp_map, target, seed):
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(comp_map), target, replace=False)
+    return ComponentMap._from_columns({
+        'path': comp_map.column('path')[rows],
+        'hsv': comp_map.column('hsv')[rows]
+        }, paths=comp_map._paths)
+
+
+def for_reference(comp_map, target, seed, ref_map):
+    reduced = copy.deepcopy(comp_map)
+    reduced.reduce(target, ref_map, seed)
+    return reduced
+
+
+def crop(ref_map, pixels):
+    cropped = ReferenceMap()
+    with cropped as m:
+        for r in sorted(ref_map.records, key=lambda x: (x.key.y, x.key.x))[:pixels]:
+            m.add(r.key, r.value)
+    return cropped
+
+
+def main(pixels=2000, ref_path='example/maps/ref.json',
+         comp_path='example/maps/specimens.json'):
+    config.silence()
+    ref_map = crop(MapFactory.reference().deserialise(MapFactory.load_text(ref_path)),
+                   int(pixels))
+    comp_map = MapFactory.component().deserialise(MapFactory.load_text(comp_path))
+    print(f'{len(ref_map)} pixels, {len(comp_map)} components')
+    cost = Builder.total_cost(Builder.solve(ref_map, comp_map, use_mask=False))
+    print(f'  {"all components":28}cost: {cost:.0f}')
+
+    for factor in pool_factors:
+        target = min(int(len(ref_map) * factor), len(comp_map))
+        for label, method in [('uniform', uniform), ('for reference', for_reference)]:
+            start = dt.now()
+            reduced = method(comp_map, target, 0, ref_map) \
+                if method is for_reference else method(comp_map, target, 0)
+            elapsed = (dt.now() - start).total_seconds()
+            cost = Builder.total_cost(Builder.solve(ref_map, reduced, use_mask=False))
+            feasible = Builder.feasible(*Builder.cost_matrix(ref_map, reduced))
+            print(f'  {f"{target} {label}":28}cost: {cost:.0f}  '
+                  f'masked feasible: {feasible}  ({elapsed:.3f}s to reduce)')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,49 @@
+"""
+Compares building a ReferenceMap from an image one pixel at a time (the old method)
+against building it from the pixel arrays in one step, for a 10 megapixel image
+resized to about 20,000 cells.
+
+    python -m benchmarks.reference [cells]
+"""
+import sys
+from datetime import datetime as dt
+
+import numpy as np
+from PIL import Image
+
+from linnaeus import config
+from linnaeus.factories.map import ReferenceMapFactory
+from linnaeus.models import CoordinateEntry, HsvEntry, ReferenceMap
+
+
+def loop_build(hsv_pixels):
+    with ReferenceMap() as new_map:
+        for pixel in hsv_pixels:
+            rk = CoordinateEntry(pixel[1].item(), pixel[0].item())
+            rv = HsvEntry(*[i.item() for i in pixel[2:]])
+            new_map.add(rk, rv)
+        return new_map
+
+
+def main(cells=20000):
+    config.silence()
+    rng = np.random.default_rng(0)
+    w, h = 3872, 2592
+    img = Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+    scale = np.sqrt(cells / (w * h))
+    start = dt.now()
+    img = img.resize((int(w * scale), int(h * scale))).convert(mode='RGBA')
+    print(f'resize {w}x{h} to {img.size[0]}x{img.size[1]}: '
+          f'{(dt.now() - start).total_seconds():.3f}s')
+
+    start = dt.now()
+    expected = loop_build(ReferenceMapFactory.get_hsv_pixels(np.array(img)))
+    print(f'  {"one pixel at a time":24}{(dt.now() - start).total_seconds():8.3f}s')
+    start = dt.now()
+    ref_map = ReferenceMapFactory.from_image_pil(img, resize=False)
+    print(f'  {"from arrays":24}{(dt.now() - start).total_seconds():8.3f}s  '
+          f'same: {ref_map.serialise() == expected.serialise()}')
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
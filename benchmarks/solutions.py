@@ -0,0 +1,70 @@
+"""
+Compares the size of a serialised SolutionMap and the time taken to load it in the
+old format (every record has the full path and colours of its component) and with a
+component table, for solutions where each component is used once and where each one
+is used several times.
+
+    python -m benchmarks.solutions [pixels]
+"""
+import hashlib
+import io
+import json
+import sys
+from datetime import datetime as dt
+
+import numpy as np
+
+from linnaeus import MapFactory, config
+from linnaeus.models import SolutionMap
+
+
+def random_solution(n, reuse, seed=0):
+    """
+    Makes a roughly square SolutionMap with n pixels, using each of n // reuse
+    components (with paths like the example's) reuse times.
+    :param n: the number of pixels
+    :param reuse: how many times each component is used
+    :param seed: seed for the random generator
+    :return: SolutionMap
+    """
+    rng = np.random.default_rng(seed)
+    w = int(np.ceil(np.sqrt(n)))
+    components = max(n // reuse, 1)
+    paths = [f'./specimens/{hashlib.sha1(str(i).encode()).hexdigest()}.jpg' for i in
+             range(components)]
+    ix = rng.permutation(np.arange(n) % components)
+    src = rng.integers(0, 256, (components, 3))
+    return SolutionMap.from_arrays({
+        'xy': np.c_[np.arange(n) % w, np.arange(n) // w],
+        'path': [paths[i] for i in ix.tolist()],
+        'target': rng.integers(0, 256, (n, 3)),
+        'src': src[ix]
+        })
+
+
+def load(txt):
+    return MapFactory.read(io.StringIO(txt))
+
+
+def measure(label, txt):
+    start = dt.now()
+    loaded_map = load(txt)
+    elapsed = (dt.now() - start).total_seconds()
+    print(f'  {label:24}{len(txt) / 2 ** 20:8.1f} MB  {elapsed:8.3f}s')
+    return loaded_map
+
+
+def main(pixels=100000):
+    config.silence()
+    for reuse in (1, 10):
+        sol_map = random_solution(pixels, reuse)
+        old_txt = json.dumps(dict(zip(sol_map._serialised_keys(),
+                                      sol_map._serialised_values())))
+        print(f'{pixels} pixels, each component used {reuse} time(s)')
+        expected = measure('full records', old_txt)
+        loaded_map = measure('component table', sol_map.serialise())
+        assert loaded_map.serialise() == expected.serialise()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,54 @@
+"""
+Times each solver backend on dense and top-k cost matrices of a few sizes, and shows
+which backend Solver.choose would pick. Used to set the dense_solver_limit and
+auction_solver_density config values.
+
+    python -m benchmarks.solvers
+"""
+from datetime import datetime as dt
+
+import numpy as np
+
+from linnaeus import Builder, config
+from linnaeus.solvers import SolveError, Solver
+from .helpers import random_components, random_reference
+
+sizes = [(200, 1000), (1000, 5000), (2000, 20000), (8000, 80000)]
+
+
+def total_cost(cost_matrix, rows, cols, use_mask, pixels, comps):
+    r, c, cost = Solver.backends['flow'].triplets(cost_matrix, rows, cols, use_mask)
+    order = np.lexsort((c, r))
+    ix = np.searchsorted(r[order] * cols + c[order], pixels * cols + comps)
+    return int(cost[order][ix].sum())
+
+
+def main(max_cells=4e7):
+    config.silence()
+    for rows, cols in sizes:
+        ref_map = random_reference(rows)
+        comp_map = random_components(cols)
+        problems = [('top-20', *Builder.nearest_cost_matrix(ref_map, comp_map, 20),
+                     True)]
+        if rows * cols <= max_cells:
+            problems.append(('dense', *Builder.cost_matrix(ref_map, comp_map,
+                                                           use_mask=False), False))
+        for label, cost_matrix, r, c, use_mask in problems:
+            chosen = Solver.choose(r, c, cost_matrix.shape[0]).name
+            print(f'{r}x{c} {label} ({cost_matrix.shape[0]} arcs, auto: {chosen})')
+            for name in Solver.backends:
+                if name == 'dense' and r * c > max_cells:
+                    continue
+                start = dt.now()
+                try:
+                    pixels, comps = Solver.assign(cost_matrix, r, c, use_mask, name)
+                    elapsed = (dt.now() - start).total_seconds()
+                    cost = total_cost(cost_matrix, r, c, use_mask, pixels, comps)
+                except SolveError as e:
+                    elapsed = (dt.now() - start).total_seconds()
+                    cost = e.reason
+                print(f'  {name:8}{elapsed:8.3f}s  cost: {cost}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Compares tiled solves (Builder.solve_tiled) with a single global solve, showing the
+time taken and how much worse the total cost of each tiled solution is.
+
+    python -m benchmarks.tiles [rows] [cols] [top_k]
+"""
+import sys
+from datetime import datetime as dt
+
+from linnaeus import Builder, config
+from .helpers import random_components, random_reference
+
+tile_counts = [1, 4, 9, 16]
+worker_counts = [1, None]
+
+
+def main(rows=20000, cols=100000, top_k=20):
+    config.silence()
+    ref_map = random_reference(rows)
+    comp_map = random_components(cols)
+    print(f'{rows}x{cols}, top-{top_k}')
+
+    start = dt.now()
+    optimum = Builder.total_cost(Builder.solve(ref_map, comp_map, top_k=top_k))
+    elapsed = (dt.now() - start).total_seconds()
+    print(f'  {"global":20}{elapsed:8.3f}s  cost: {optimum:.0f}')
+
+    for tiles in tile_counts:
+        for workers in worker_counts:
+            start = dt.now()
+            solution = Builder.solve_tiled(ref_map, comp_map, tiles=tiles,
+                                           workers=workers, top_k=top_k)
+            elapsed = (dt.now() - start).total_seconds()
+            cost = Builder.total_cost(solution)
+            label = f'{tiles} tiles, {workers or "all"} workers'
+            print(f'  {label:20}{elapsed:8.3f}s  cost: {cost:.0f} '
+                  f'(+{(cost - optimum) / optimum:.2%})')
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -1,183 +1,1003 @@
+import math
+import multiprocessing
+from concurrent import futures
+
 import numpy as np
 from PIL import Image
-from numba import njit
-from ortools.graph.python import min_cost_flow
+from numba import njit, prange
 from scipy import sparse
+from scipy.sparse.csgraph import maximum_bipartite_matching
+from scipy.spatial import cKDTree
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.metrics.pairwise import pairwise_distances
 
-from .config import ProgressLogger, TimeLogger, constants, logger
-from .models import CombinedEntry, Component, HsvEntry, SolutionMap
+from .config import ProgressLogger, Size, TimeLogger, constants, logger
+from .models import Component, SolutionMap
+from .solvers import FlowSolver, SolveError, Solver
 
 
-@njit
-def plus(i, j):
-    return i + j
+@njit(cache=True)
+def greedy(order, groups, candidates, used, assignment):
+    """
+    Assigns each pixel, in the given order, the first unused component in its
+    group's row of candidates (pixels with identical colours share a row). Pixels
+    whose candidates are all used are left as -1. Updates used and assignment in
+    place.
+    """
+    # candidates before this in each row are already used
+    start = np.zeros(len(candidates), dtype=np.int64)
+    for i in order:
+        g = groups[i]
+        j = start[g]
+        while j < candidates.shape[1]:
+            c = candidates[g, j]
+            j += 1
+            if not used[c]:
+                used[c] = True
+                assignment[i] = c
+                break
+        start[g] = j
 
 
-@njit
-def minus(i, j):
-    return i - j
+@njit(cache=True)
+def hsv_distance(h1, s1, v1, h2, s2, v2, circular_hue):
+    dh = abs(h1 - h2)
+    if circular_hue and dh > 128:
+        dh = 256 - dh
+    ds = s1 - s2
+    dv = v1 - v2
+    return np.sqrt(dh * dh + ds * ds + dv * dv)
 
 
-@njit
-def multiply(i, j):
-    return i * j
+@njit(parallel=True, cache=True)
+def cost_kernel(ref_colours, comp_colours, circular_hue):
+    """
+    Calculates the distance from each pixel colour to each component colour, minus
+    the distance to the pixel's closest component, truncated to an int32. Rows are
+    calculated in parallel. Distances are calculated twice rather than stored, as
+    that's cheaper than holding a float array the size of the output.
+    :param ref_colours: contiguous (rows, 3) float32 or uint8 array of HSV colours
+    :param comp_colours: contiguous (cols, 3) array of the same type
+    :param circular_hue: if True, hue differences wrap around (e.g. 250 and 5 are 11
+                         apart); otherwise this is the plain Euclidean distance
+    :return: (rows, cols) int32 array
+    """
+    rows, cols = ref_colours.shape[0], comp_colours.shape[0]
+    comp = comp_colours.astype(np.float32)
+    costs = np.empty((rows, cols), dtype=np.int32)
+    for i in prange(rows):
+        h = np.float32(ref_colours[i, 0])
+        s = np.float32(ref_colours[i, 1])
+        v = np.float32(ref_colours[i, 2])
+        row_min = np.float32(np.inf)
+        for j in range(cols):
+            d = hsv_distance(h, s, v, comp[j, 0], comp[j, 1], comp[j, 2], circular_hue)
+            if d < row_min:
+                row_min = d
+        for j in range(cols):
+            d = hsv_distance(h, s, v, comp[j, 0], comp[j, 1], comp[j, 2], circular_hue)
+            costs[i, j] = np.int32(d - row_min)
+    return costs
 
 
-@njit
-def get_ints(*x):
-    return x
+def solve_tile(ref_colours, comp_colours, top_k=None, backend=None):
+    """
+    Finds the optimal assignment for one tile of a tiled solve. This is a module-level
+    function so it can be run in a worker process.
+    :param ref_colours: (rows, 3) array of the tile's pixel colours
+    :param comp_colours: (cols, 3) array of the colours of the tile's components
+    :param top_k: if set, only consider the k closest components for each pixel; if
+                  that has no solution, the tile is solved without a mask
+    :param backend: the name of the solver backend to use
+    :return: arrays of pixel and component indices into the given colour arrays
+    """
+    if top_k:
+        cost_matrix, rows, cols = Builder.nearest_arcs(ref_colours,
+                                                       cKDTree(comp_colours), top_k)
+        if Builder.feasible(cost_matrix, rows, cols):
+            return Solver.assign(cost_matrix, rows, cols, True, backend)
+        # tiles are small, so considering every component is cheap
+        logger.debug('no solution with top_k: solving tile without a mask')
+    cost_matrix = Builder.distances(ref_colours, comp_colours)
+    rows, cols = cost_matrix.shape
+    return Solver.assign(cost_matrix.reshape(-1, 1), rows, cols, False, backend)
 
 
 class Builder(object):
+    # approximate bytes held per cell of a block in stream_cost_matrix: the int32
+    # cost plus the int64 partition indices
+    bytes_per_cost = 12
+
+    @staticmethod
+    def colours(hsv_map):
+        """
+        Gets the HSV values of a map's records as an array.
+        :param hsv_map: a ReferenceMap or ComponentMap
+        :return: an (n, 3) uint8 array in the same order as the map's records
+        """
+        return hsv_map.column('hsv')
+
+    @staticmethod
+    def coordinates(ref_map):
+        """
+        Gets the x, y coordinates of a map's records as an array.
+        :param ref_map: a ReferenceMap
+        :return: an (n, 2) array in the same order as the map's records
+        """
+        return ref_map.column('xy').astype(np.int64)
+
+    @staticmethod
+    def distances(ref_colours, comp_colours, circular_hue=False):
+        """
+        Calculates the cost of matching each pixel with each component: the distance
+        between their colours minus the distance to the pixel's closest component,
+        truncated to an integer.
+        :param ref_colours: (rows, 3) array of pixel colours
+        :param comp_colours: (cols, 3) array of component colours
+        :param circular_hue: treat hue as an angle, so the hues at either end of the
+                             range are close together
+        :return: (rows, cols) int32 array
+        """
+        dtype = np.uint8 if (ref_colours.dtype == np.uint8 and
+                             comp_colours.dtype == np.uint8) else np.float32
+        return cost_kernel(np.ascontiguousarray(ref_colours, dtype=dtype),
+                           np.ascontiguousarray(comp_colours, dtype=dtype),
+                           circular_hue)
+
     @classmethod
-    def cost_matrix(cls, ref_map, comp_map, use_mask=True, mask_tolerance=0):
-        logger.debug('building arrays')
-        ref_records = sparse.csr_matrix([r.value.array for r in ref_map.records])
-        comp_records = sparse.csr_matrix([r.value.array for r in comp_map.records])
-        logger.debug('calculating cost matrix')
-        xy = pairwise_distances(ref_records, comp_records)
-        logger.debug('normalising cost matrix')
-        cm = (xy.T - xy.min(axis=1)).T.astype(int)
-        r, c = cm.shape
+    def cost_matrix(cls, ref_map, comp_map, use_mask=True, mask_tolerance=0,
+                    circular_hue=False):
+        costs = cls.costs(ref_map, comp_map, circular_hue)
         if use_mask:
-            logger.debug('masking cost matrix')
-            logger.info('calculating distance from mean')
-            deviance = np.ma.array(cm).anom(axis=1)
-            logger.info('adjusting distance matrix')
-            deviance = (deviance.T - (deviance.std(axis=1) * mask_tolerance)).T
-            logger.info('masking items')
-            cm_mask = np.ma.masked_less_equal(deviance, 0).mask
-            if not (cm_mask.sum(axis=1) > 0).all():
-                raise SolveError(None, masked=True, msg='Mask tolerance too low.')
-            cm_nonzero = cm_mask.nonzero()
-            logger.info('applying mask to cost matrix')
-            masked = cm[cm_nonzero]
-            row, col = cm_nonzero
-            logger.info('adjusting row/col indices')
-            row = row + 1
-            col = col + r + 1
-            logger.info('grouping')
-            cm = np.dstack((row, col, masked))[0]
+            cm, r, c = cls.mask(costs, mask_tolerance)
         else:
-            cm = cm.reshape(-1, 1)
+            r, c = costs.shape
+            cm = costs.reshape(-1, 1)
         logger.debug('finished calculating cost matrix')
         return cm, r, c
 
     @classmethod
-    def solve(cls, ref_map, comp_map, use_mask=True, mask_tolerance=0):
+    def costs(cls, ref_map, comp_map, circular_hue=False):
+        """
+        Calculates the full (unmasked) cost of matching every pixel with every
+        component. This can be reused for several calls to mask() or solve().
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param circular_hue: treat hue as an angle (see distances())
+        :return: (rows, cols) int32 array
+        """
+        logger.debug('building arrays')
+        ref_records = cls.colours(ref_map)
+        comp_records = cls.colours(comp_map)
+        logger.debug('calculating cost matrix')
+        return cls.distances(ref_records, comp_records, circular_hue)
+
+    @classmethod
+    def mask(cls, costs, mask_tolerance=0):
+        """
+        Removes the components that are much further than average from each pixel.
+        :param costs: the full cost array from costs()
+        :param mask_tolerance: higher values mask fewer components
+        :return: an array of (row, col, cost) arcs for the components that are left,
+                 the number of rows, and the number of columns
+        """
+        r, c = costs.shape
+        logger.debug('masking cost matrix')
+        logger.info('calculating distance from mean')
+        deviance = np.ma.array(costs).anom(axis=1)
+        logger.info('adjusting distance matrix')
+        deviance = (deviance.T - (deviance.std(axis=1) * mask_tolerance)).T
+        logger.info('masking items')
+        cm_mask = np.ma.masked_less_equal(deviance, 0).mask
+        if not (cm_mask.sum(axis=1) > 0).all():
+            raise SolveError(None, masked=True, msg='Mask tolerance too low.')
+        cm_nonzero = cm_mask.nonzero()
+        logger.info('applying mask to cost matrix')
+        masked = costs[cm_nonzero]
+        row, col = cm_nonzero
+        logger.info('adjusting row/col indices')
+        row = row + 1
+        col = col + r + 1
+        logger.info('grouping')
+        return np.dstack((row, col, masked))[0], r, c
+
+    @staticmethod
+    def feasible(cost_matrix, rows, cols, reuse=1):
+        """
+        Checks whether every pixel can be given a component using only the arcs in a
+        masked cost matrix, by finding a maximum matching (Hopcroft-Karp). This is
+        much quicker than finding out from the solver.
+        :param cost_matrix: an array of (row, col, cost) arcs as returned by mask()
+        :param rows: the number of reference pixels
+        :param cols: the number of components
+        :param reuse: the number of times each component can be used
+        :return: True if there's a solution
+        """
+        if rows > cols * reuse:
+            return False
+        # each use of a component is a separate column in the matching
+        heads = (cost_matrix[:, 1] - rows - 1) * reuse
+        graph = sparse.csr_matrix((np.ones(len(cost_matrix) * reuse, dtype=np.int8),
+                                   (np.repeat(cost_matrix[:, 0] - 1, reuse),
+                                    (heads[:, np.newaxis] +
+                                     np.arange(reuse)).ravel())),
+                                  shape=(rows, cols * reuse))
+        matching = maximum_bipartite_matching(graph, perm_type='column')
+        return bool((matching >= 0).all())
+
+    @classmethod
+    def stream_cost_matrix(cls, ref_map, comp_map, top_k, memory_budget=None,
+                           circular_hue=False):
+        """
+        Builds a sparse cost matrix containing only the top_k cheapest components for
+        each reference pixel. Pixels are processed in blocks sized to fit the memory
+        budget, so the full rows x cols matrix is never held in memory at once.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param top_k: the number of candidate components to keep for each pixel
+        :param memory_budget: max bytes to use for each block; defaults to
+                              constants.memory_budget (in MB)
+        :param circular_hue: treat hue as an angle (see distances())
+        :return: an array of (row, col, cost) arcs in the same format as a masked
+                 cost_matrix(), the number of rows, and the number of columns
+        """
+        memory_budget = memory_budget or constants.memory_budget * 2 ** 20
+        logger.debug('building arrays')
+        ref_records = cls.colours(ref_map)
+        comp_records = cls.colours(comp_map)
+        r, c = len(ref_records), len(comp_records)
+        k = min(top_k, c)
+        block_size = max(memory_budget // (c * cls.bytes_per_cost), 1)
+        logger.debug(f'calculating top {k} costs in blocks of {block_size} rows')
+        arcs = np.empty((r * k, 3), dtype=np.int64)
+        with ProgressLogger(math.ceil(r / block_size), 10) as p:
+            for start in range(0, r, block_size):
+                # already relative to each row's cheapest component
+                xy = cls.distances(ref_records[start:start + block_size],
+                                   comp_records, circular_hue)
+                n = xy.shape[0]
+                cols = np.argpartition(xy, k - 1, axis=1)[:, :k]
+                costs = np.take_along_axis(xy, cols, axis=1)
+                block = arcs[start * k:(start + n) * k]
+                block[:, 0] = np.repeat(np.arange(start + 1, start + n + 1), k)
+                block[:, 1] = cols.ravel() + r + 1
+                block[:, 2] = costs.ravel()
+                p.next()
+        logger.debug('finished calculating cost matrix')
+        return arcs, r, c
+
+    @classmethod
+    def nearest_cost_matrix(cls, ref_map, comp_map, top_k):
+        """
+        Builds a sparse cost matrix containing the top_k nearest components for each
+        reference pixel by querying the component map's colour index, without
+        calculating the distance to every component.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param top_k: the number of candidate components to keep for each pixel
+        :return: an array of (row, col, cost) arcs in the same format as a masked
+                 cost_matrix(), the number of rows, and the number of columns
+        """
+        logger.debug('building arrays')
+        ref_records = cls.colours(ref_map)
+        return cls.nearest_arcs(ref_records, comp_map.colour_index, top_k)
+
+    @staticmethod
+    def nearest_arcs(ref_colours, comp_index, top_k):
+        """
+        Builds a sparse cost matrix from the top_k nearest components for each pixel.
+        :param ref_colours: (rows, 3) array of pixel colours
+        :param comp_index: a cKDTree of the component colours
+        :param top_k: the number of candidate components to keep for each pixel
+        :return: an array of (row, col, cost) arcs in the same format as a masked
+                 cost_matrix(), the number of rows, and the number of columns
+        """
+        r, c = len(ref_colours), comp_index.n
+        k = min(top_k, c)
+        logger.debug(f'querying colour index for {k} nearest components')
+        with TimeLogger():
+            xy, cols = comp_index.query(ref_colours, k=list(range(1, k + 1)),
+                                        workers=-1)
+        arcs = np.empty((r * k, 3), dtype=np.int64)
+        arcs[:, 0] = np.repeat(np.arange(1, r + 1), k)
+        arcs[:, 1] = cols.ravel() + r + 1
+        # distances are returned in ascending order, so the first is the minimum
+        arcs[:, 2] = (xy.T - xy[:, 0]).T.astype(int).ravel()
+        logger.debug('finished calculating cost matrix')
+        return arcs, r, c
+
+    @classmethod
+    def limit(cls, comp_map, ref_map=None, seed=None):
+        """
+        Reduces the component map to constants.max_components if it is larger.
+        :param comp_map: the ComponentMap
+        :param ref_map: the ReferenceMap; if given, the components closest to its
+                        colours are kept
+        :param seed: a seed for choosing the components to keep
+        """
         if len(comp_map) > constants.max_components:
             logger.debug(
                 f'trying to use {len(comp_map)} components will likely result in a '
                 f'memory error: reducing to {constants.max_components}')
-            comp_map.reduce(constants.max_components)
-        cost_matrix, rows, cols = cls.cost_matrix(ref_map, comp_map, use_mask,
-                                                  mask_tolerance)
-        cost_arcs = cost_matrix.shape[0]
-        arc_count = rows + cols + cost_arcs
-        supplies = np.concatenate(([rows], np.zeros(rows + cols), [-rows])).astype(int)
-        logger.debug(f'adding {arc_count} arcs to solver ')
-        solver = min_cost_flow.SimpleMinCostFlow()
-        logger.debug(f'section 1: {rows} items')
-        with ProgressLogger(rows, 2) as p:
-            last_node = rows + cols + 1
-            # section one
-            for i in range(1, rows + 1):
-                solver.add_arc_with_capacity_and_unit_cost(0,
-                                                     i,
-                                                     1,
-                                                     0)
-                p.next()
-        logger.debug(f'section 2: {cost_arcs} items')
-        with ProgressLogger(cost_arcs, 20) as p:
-            # section two
+            comp_map.reduce(constants.max_components, ref_map, seed)
+
+    @classmethod
+    def solve(cls, ref_map, comp_map, use_mask=True, mask_tolerance=0, top_k=None,
+              use_index=True, backend=None, clusters=None, costs=None, reuse=None,
+              reuse_distance=None, circular_hue=False):
+        """
+        Finds the optimal assignment of components to reference pixels.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param use_mask: ignore components that are much further than average from
+                         each pixel
+        :param mask_tolerance: higher values mask fewer components
+        :param top_k: if set, only consider the k closest components for each pixel;
+                      the full component map is used (use_mask and mask_tolerance are
+                      ignored)
+        :param use_index: find the top_k components with the component map's colour
+                          index; if False, stream the full cost matrix in blocks instead
+        :param backend: the name of the solver backend to use (see Solver.backends);
+                        chosen from the size and density of the problem if None
+        :param clusters: if set, solve approximately by quantising the colours into
+                         this many clusters (see solve_quantised); all other options
+                         are ignored
+        :param costs: the full cost array from costs(), to avoid calculating it again
+                      when retrying with a different mask; the component map should
+                      already be limit()ed
+        :param reuse: the number of times each component can be used; defaults to
+                      constants.reuse_limit. More than 1 always uses the flow solver.
+        :param reuse_distance: the minimum distance between pixels using the same
+                               component; defaults to constants.reuse_distance
+        :param circular_hue: treat hue as an angle (see distances()); the colour
+                             index can't, so top_k streams the cost matrix instead
+        :return: SolutionMap
+        """
+        reuse = reuse or constants.reuse_limit
+        if reuse_distance is None:
+            reuse_distance = constants.reuse_distance
+        if clusters:
+            return cls.solve_quantised(ref_map, comp_map, clusters)
+        if top_k and use_index and not circular_hue:
+            cost_matrix, rows, cols = cls.nearest_cost_matrix(ref_map, comp_map, top_k)
+            use_mask = True
+        elif top_k:
+            cost_matrix, rows, cols = cls.stream_cost_matrix(ref_map, comp_map, top_k,
+                                                             circular_hue=circular_hue)
+            use_mask = True
+        else:
+            if costs is None:
+                cls.limit(comp_map, ref_map)
+                costs = cls.costs(ref_map, comp_map, circular_hue)
+            rows, cols = costs.shape
             if use_mask:
-                for n in cost_matrix:
-                    r, c, cost = get_ints(*n)
-                    solver.add_arc_with_capacity_and_unit_cost(r,
-                                                         c,
-                                                         1,
-                                                         cost)
+                cost_matrix, rows, cols = cls.mask(costs, mask_tolerance)
+            else:
+                cost_matrix = costs.reshape(-1, 1)
+        try:
+            if use_mask and not cls.feasible(cost_matrix, rows, cols, reuse):
+                raise SolveError(SolveError.infeasible, use_mask)
+            if reuse > 1:
+                logger.debug(f'using each component up to {reuse} times')
+                if rows > cols * reuse:
+                    raise SolveError(None, use_mask, msg='Not enough components.')
+                pixels, comps, _ = FlowSolver.solve(cost_matrix, rows, cols, use_mask,
+                                                    capacity=np.full(cols, reuse))
+            else:
+                pixels, comps = Solver.assign(cost_matrix, rows, cols, use_mask,
+                                              backend)
+        except SolveError as e:
+            if top_k:
+                raise SolveError(e.error_code, use_mask,
+                                 msg=f'Failed to solve: {e.reason}. Try increasing '
+                                     f'"top_k".')
+            raise
+        if reuse > 1 and reuse_distance > 0:
+            pixels, comps = cls.separate(ref_map, comp_map, pixels, comps, reuse,
+                                         reuse_distance)
+        logger.debug('building solution map')
+        solution = cls.assign(ref_map, comp_map, pixels, comps)
+        cls._log_solution(comp_map, solution)
+        return solution
+
+    @classmethod
+    def separate(cls, ref_map, comp_map, pixels, comps, reuse, min_distance,
+                 attempts=5):
+        """
+        Moves pixels so that no two pixels closer together than min_distance use the
+        same component. The pixels that are too close to an earlier use of their
+        component are re-solved against the components with uses left, excluding any
+        already used nearby; this is repeated until there are no clashes.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param pixels: array of indices into ref_map.records
+        :param comps: array of indices into comp_map.records
+        :param reuse: the number of times each component can be used
+        :param min_distance: the minimum distance between repeats of a component
+        :param attempts: the maximum number of times to re-solve
+        :return: an array of pixel indices and an array of component indices
+        """
+        rows, cols = len(ref_map), len(comp_map)
+        assignment = np.empty(rows, dtype=np.int64)
+        assignment[pixels] = comps
+        xy = cls.coordinates(ref_map)
+        ref_colours = cls.colours(ref_map)
+        comp_colours = cls.colours(comp_map)
+        tree = cKDTree(xy)
+        # query_pairs includes pairs exactly min_distance apart
+        radius = np.nextafter(min_distance, 0)
+        for attempt in range(attempts + 1):
+            pairs = tree.query_pairs(radius, output_type='ndarray')
+            pairs = pairs[assignment[pairs[:, 0]] == assignment[pairs[:, 1]]]
+            if len(pairs) == 0:
+                return np.arange(rows), assignment
+            if attempt == attempts:
+                break
+            moving = np.unique(pairs.max(axis=1))
+            logger.debug(f'moving {moving.size} pixels too close to a repeat of their '
+                         f'component')
+            kept = np.ones(rows, dtype=bool)
+            kept[moving] = False
+            spare = reuse - np.bincount(assignment[kept], minlength=cols)
+            allowed = np.repeat((spare > 0)[np.newaxis, :], moving.size, axis=0)
+            near = tree.query_ball_point(xy[moving], radius)
+            near_rows = np.repeat(np.arange(moving.size), [len(n) for n in near])
+            near_pixels = np.concatenate(near).astype(np.int64)
+            near_kept = kept[near_pixels]
+            allowed[near_rows[near_kept], assignment[near_pixels[near_kept]]] = False
+            arc_rows, arc_cols = np.nonzero(allowed)
+            costs = cls.distances(ref_colours[moving], comp_colours)
+            cost_matrix = np.c_[arc_rows + 1, arc_cols + moving.size + 1,
+                                costs[arc_rows, arc_cols]]
+            moved, new_comps, _ = FlowSolver.solve(cost_matrix, moving.size, cols, True,
+                                                   capacity=np.maximum(spare, 0))
+            assignment[moving[moved]] = new_comps
+        raise SolveError(None, True,
+                         msg=f'Could not keep repeated components {min_distance} apart. '
+                             f'Try a lower "reuse_distance" or a higher "reuse".')
+
+    @classmethod
+    def solve_grouped(cls, ref_map, comp_map):
+        """
+        Finds the optimal assignment by solving between groups of identical colours
+        rather than individual pixels and components, then expanding the result. The
+        total cost is the same as solve() without a mask, but the network is much
+        smaller when the reference or the components have many repeated colours.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :return: SolutionMap
+        """
+        cls.limit(comp_map, ref_map)
+        logger.debug('grouping colours')
+        ref_colours, ref_groups, ref_counts = np.unique(cls.colours(ref_map), axis=0,
+                                                        return_inverse=True,
+                                                        return_counts=True)
+        comp_colours, comp_groups, comp_counts = np.unique(cls.colours(comp_map),
+                                                           axis=0,
+                                                           return_inverse=True,
+                                                           return_counts=True)
+        rows, cols = len(ref_colours), len(comp_colours)
+        logger.debug(f'{len(ref_map)} pixels in {rows} groups, {len(comp_map)} '
+                     f'components in {cols} groups')
+        if len(comp_map) < len(ref_map):
+            raise SolveError(None, False, msg='Not enough components.')
+        logger.debug('calculating cost matrix')
+        cost_matrix = cls.distances(ref_colours, comp_colours).reshape(-1, 1)
+        arc_rows, arc_cols, flows = FlowSolver.solve(cost_matrix, rows, cols, False,
+                                                     supply=ref_counts,
+                                                     capacity=comp_counts)
+        logger.debug('building solution map')
+        pixels, comps = cls.ungroup(ref_groups, comp_groups, arc_rows, arc_cols, flows)
+        solution = cls.assign(ref_map, comp_map, pixels, comps)
+        cls._log_solution(comp_map, solution)
+        return solution
+
+    @classmethod
+    def solve_tiled(cls, ref_map, comp_map, tiles=4, workers=None, top_k=None,
+                    backend=None):
+        """
+        Splits the reference into a grid of spatial tiles and solves each one
+        separately, in parallel. The components are partitioned between the tiles
+        first, so none are used twice; each tile gets enough components close to its
+        own colours, plus a share of the spare components. The result is usually
+        slightly worse than a single solve, but each network is much smaller.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param tiles: the approximate number of tiles
+        :param workers: the number of worker processes; defaults to the number of
+                        CPUs, and 1 solves the tiles one after another in this process
+        :param top_k: if set, only consider the k closest components for each pixel
+                      within each tile; otherwise (or if that has no solution) each
+                      tile is solved without a mask
+        :param backend: the name of the solver backend to use for each tile
+        :return: SolutionMap
+        """
+        if len(comp_map) < len(ref_map):
+            raise SolveError(None, False, msg='Not enough components.')
+        logger.debug('building arrays')
+        ref_colours = cls.colours(ref_map).astype(float)
+        comp_colours = cls.colours(comp_map).astype(float)
+        tile_ids = cls.tiles(ref_map, tiles)
+        logger.debug('partitioning components between tiles')
+        comp_tiles = cls.partition(ref_colours, comp_colours, comp_map.colour_index,
+                                   tile_ids)
+        jobs = [(np.flatnonzero(tile_ids == t), np.flatnonzero(comp_tiles == t)) for t
+                in np.unique(tile_ids)]
+        logger.debug(f'solving {len(jobs)} tiles')
+        results = [None] * len(jobs)
+        with ProgressLogger(len(jobs), len(jobs)) as p:
+            if workers == 1:
+                for i, (px, cp) in enumerate(jobs):
+                    results[i] = solve_tile(ref_colours[px], comp_colours[cp], top_k,
+                                            backend)
                     p.next()
             else:
-                colblock = np.arange(rows + 1, rows + cols + 1).reshape(-1, 1)
-                for r in range(rows):
-                    rn = plus(r, 1)
-                    block_start = multiply(r, cols)
-                    block_end = plus(block_start, cols)
-                    block = np.concatenate((colblock,
-                                            cost_matrix[block_start:block_end]), axis=1)
-                    for block_row in block:
-                        c, cost = get_ints(*block_row)
-                        solver.add_arc_with_capacity_and_unit_cost(rn,
-                                                             c,
-                                                             1,
-                                                             cost)
+                # forked workers can deadlock if numba's threads are already running
+                context = multiprocessing.get_context('spawn')
+                with futures.ProcessPoolExecutor(max_workers=workers,
+                                                 mp_context=context) as executor:
+                    submitted = {executor.submit(solve_tile, ref_colours[px],
+                                                 comp_colours[cp], top_k, backend): i
+                                 for i, (px, cp) in enumerate(jobs)}
+                    for f in futures.as_completed(submitted):
+                        results[submitted[f]] = f.result()
                         p.next()
-        logger.debug(f'section 3: {cols} items')
-        with ProgressLogger(cols, 3) as p:
-            # section three
-            for i in range(rows + 1, last_node):
-                solver.add_arc_with_capacity_and_unit_cost(
-                    i,
-                    last_node,
-                    1,
-                    0)
+        pixels = np.concatenate([px[r] for (px, _), (r, _) in zip(jobs, results)])
+        comps = np.concatenate([cp[c] for (_, cp), (_, c) in zip(jobs, results)])
+        if np.unique(comps).size != comps.size:
+            raise SolveError(None, False, msg='Components were used more than once.')
+        logger.debug('building solution map')
+        solution = cls.assign(ref_map, comp_map, pixels, comps)
+        cls._log_solution(comp_map, solution)
+        return solution
+
+    @classmethod
+    def solve_hierarchical(cls, ref_map, comp_map, fraction=1 / 16, groups=256,
+                           top_k=16, backend=None, seed=None):
+        """
+        Solves at two resolutions. The reference is first downsampled to a grid of
+        coarse cells and the components are clustered into colour groups; the coarse
+        problem decides how many pixels from each cell go to each group. Each cell's
+        pixels are then split between its groups, and each group is solved on its own,
+        so one huge problem becomes a sequence of small ones. The result is not
+        optimal, as pixels can only use components from their assigned groups.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param fraction: the area of the coarse grid as a fraction of the reference's
+        :param groups: the number of component colour groups; more groups means
+                       smaller (faster) fine problems but a coarser first step
+        :param top_k: only consider the k closest components in the group for each
+                      pixel; if that has no solution, all of them are considered
+        :param backend: the name of the solver backend to use for each group
+        :param seed: seed for clustering the components
+        :return: SolutionMap
+        """
+        if len(comp_map) < len(ref_map):
+            raise SolveError(None, False, msg='Not enough components.')
+        logger.debug('building arrays')
+        ref_colours = cls.colours(ref_map).astype(float)
+        comp_colours = cls.colours(comp_map).astype(float)
+        rows, cols = len(ref_colours), len(comp_colours)
+        xy = cls.coordinates(ref_map)
+
+        logger.debug('downsampling reference')
+        w, h = ref_map.bounds
+        coarse_size = Size(constants.pixel_size, area=f'{max(int(w * h * fraction), 1)}c')
+        cw, ch = [max(i, 1) for i in coarse_size.dimensions(w, h)]
+        cells = (xy[:, 1] * ch // h) * cw + xy[:, 0] * cw // w
+        _, cell_ix, cell_counts = np.unique(cells, return_inverse=True,
+                                            return_counts=True)
+        logger.debug(f'clustering {cols} components into {groups} groups')
+        centres, comp_groups = cls.cluster(comp_colours, groups, seed)
+        group_counts = np.bincount(comp_groups, minlength=len(centres))
+
+        logger.debug(f'solving coarse level: {len(cell_counts)} cells, '
+                     f'{len(centres)} groups')
+        # the average distance from each cell's pixels to each group, rather than the
+        # distance from its average colour, so cells with mixed colours aren't grey
+        cell_matrix = sparse.csr_matrix((np.ones(rows), (cell_ix, np.arange(rows))))
+        xy = cell_matrix @ pairwise_distances(ref_colours, centres)
+        xy = xy / cell_counts[:, np.newaxis]
+        cost_matrix = (xy.T - xy.min(axis=1)).T.astype(int).reshape(-1, 1)
+        arc_cells, arc_groups, flows = FlowSolver.solve(cost_matrix, len(cell_counts),
+                                                        len(centres), False,
+                                                        supply=cell_counts,
+                                                        capacity=group_counts)
+
+        logger.debug('splitting cells between groups')
+        # one column per (cell, group) pair with flow, with that flow as its capacity
+        pair_flows = np.bincount(arc_cells * len(centres) + arc_groups,
+                                 weights=flows).astype(np.int64)
+        pairs = np.flatnonzero(pair_flows)
+        pair_cells, pair_groups = np.divmod(pairs, len(centres))
+        by_cell = np.argsort(pair_cells, kind='stable')
+        cell_starts = np.searchsorted(pair_cells[by_cell], np.arange(len(cell_counts)))
+        n_pairs = np.bincount(pair_cells, minlength=len(cell_counts))[cell_ix]
+        arc_rows = np.repeat(np.arange(rows), n_pairs)
+        offsets = np.arange(arc_rows.size) - np.repeat(np.cumsum(n_pairs) - n_pairs,
+                                                       n_pairs)
+        arc_pairs = by_cell[cell_starts[cell_ix[arc_rows]] + offsets]
+        distances = np.linalg.norm(ref_colours[arc_rows] -
+                                   centres[pair_groups[arc_pairs]], axis=1)
+        cost_matrix = np.c_[arc_rows + 1, arc_pairs + rows + 1, distances.astype(int)]
+        split_rows, split_pairs, _ = FlowSolver.solve(cost_matrix, rows, pairs.size,
+                                                      True,
+                                                      capacity=pair_flows[pairs])
+        pixel_groups = np.empty(rows, dtype=np.int64)
+        pixel_groups[split_rows] = pair_groups[split_pairs]
+
+        logger.debug('solving fine level')
+        by_group = np.argsort(comp_groups, kind='stable')
+        group_starts = np.concatenate(([0], np.cumsum(group_counts)))
+        pixels, comps = [], []
+        fine_groups = np.unique(pixel_groups)
+        with ProgressLogger(len(fine_groups), 10) as p:
+            for g in fine_groups:
+                members = by_group[group_starts[g]:group_starts[g + 1]]
+                group_pixels = np.flatnonzero(pixel_groups == g)
+                r, c = solve_tile(ref_colours[group_pixels], comp_colours[members],
+                                  top_k, backend)
+                pixels.append(group_pixels[r])
+                comps.append(members[c])
                 p.next()
-        logger.debug('adding node supply')
-        for i in range(supplies.size):
-            solver.set_node_supply(i, supplies[i].item())
-        logger.debug('solving')
-        with TimeLogger():
-            status = solver.solve()
-        if status == solver.OPTIMAL:
-            logger.debug('building solution map')
-            logger.debug(f'processing {solver.num_arcs()} arcs')
-            with ProgressLogger(solver.num_arcs(), 20) as p, SolutionMap() as solution:
-                ref_map_len = len(ref_map)
-                for arc in range(solver.num_arcs()):
-                    t = solver.tail(arc)
-                    h = solver.head(arc)
-                    f = solver.flow(arc)
-                    if 0 < t <= ref_map_len and h != arc_count and f > 0:
-                        pixel = ref_map.worker(t)
-                        comp = comp_map.task(h, ref_map_len)
-                        combined_value = CombinedEntry(path=comp.key,
-                                                       target=pixel.value,
-                                                       src=comp.value)
-                        solution.add(pixel.key, combined_value)
-                    p.next()
-                logger.debug('finished solving')
-                logger.debug(f'assigned {len(solution)} pixels from a pool of '
-                             f'{constants.max_components} specimen images')
-                return solution
-        else:
-            raise SolveError(status, use_mask)
+        pixels = np.concatenate(pixels)
+        comps = np.concatenate(comps)
+        logger.debug('building solution map')
+        solution = cls.assign(ref_map, comp_map, pixels, comps)
+        cls._log_solution(comp_map, solution)
+        return solution
+
+    @staticmethod
+    def cluster(colours, k, seed=None):
+        """
+        Groups colours into k clusters with (mini-batch) k-means.
+        :param colours: (n, 3) array of colours
+        :param k: the number of clusters; if there are no more than k distinct
+                  colours, each is its own cluster
+        :param seed: seed for the initial cluster centres
+        :return: the (k, 3) array of cluster centres and the cluster index of each
+                 colour; some clusters may be empty
+        """
+        distinct, inverse = np.unique(colours, axis=0, return_inverse=True)
+        if len(distinct) <= k:
+            return distinct, inverse.ravel()
+        kmeans = MiniBatchKMeans(n_clusters=k, random_state=seed, n_init=1,
+                                 batch_size=4096).fit(colours)
+        return kmeans.cluster_centers_, kmeans.labels_
 
     @classmethod
-    def silhouette(cls, ref_map, comp_map):
+    def tiles(cls, ref_map, tiles):
+        """
+        Divides a reference map into a grid of roughly equal rectangular tiles.
+        :param ref_map: the ReferenceMap
+        :param tiles: the approximate number of tiles; the grid is as close to square
+                      as possible, so this may be rounded up
+        :return: the tile index of each record in ref_map.records
+        """
+        xy = cls.coordinates(ref_map)
+        nx = math.ceil(math.sqrt(tiles))
+        ny = math.ceil(tiles / nx)
+        ids = []
+        for axis, n in enumerate((nx, ny)):
+            span = xy[:, axis] - xy[:, axis].min()
+            ids.append(np.minimum(span * n // (span.max() + 1), n - 1))
+        return ids[1] * nx + ids[0]
+
+    @classmethod
+    def partition(cls, ref_colours, comp_colours, comp_index, tile_ids, top_k=16):
+        """
+        Partitions the components between tiles according to their colour demand.
+        Each pixel is first given its nearest available component (see greedy_assign),
+        which goes to that pixel's tile so every tile has enough well-matched
+        components. The rest go to the tile of the pixel closest to them in colour.
+        :param ref_colours: (rows, 3) array of pixel colours
+        :param comp_colours: (cols, 3) array of component colours; cols >= rows
+        :param comp_index: a cKDTree of comp_colours
+        :param tile_ids: the tile index of each pixel
+        :param top_k: the number of nearest components to consider for each pixel
+        :return: the tile index of each component
+        """
+        assignment, _ = cls.greedy_assign(ref_colours, comp_colours, comp_index, top_k)
+        comp_tiles = np.full(len(comp_colours), -1, dtype=np.int64)
+        comp_tiles[assignment] = tile_ids
+        spare = np.flatnonzero(comp_tiles < 0)
+        if spare.size > 0:
+            _, nearest = cKDTree(ref_colours).query(comp_colours[spare], workers=-1)
+            comp_tiles[spare] = tile_ids[nearest]
+        return comp_tiles
+
+    @classmethod
+    def solve_quantised(cls, ref_map, comp_map, clusters=64, seed=None):
+        """
+        Solves approximately by clustering the pixel and component colours into bins
+        with k-means and solving the (much smaller) transportation problem between
+        the bins. Components are then given to pixels arbitrarily within each pair of
+        bins, as they're all close to equal. Fewer clusters is faster but less
+        accurate; the total cost and the most it can be above the optimum are logged.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param clusters: the number of bins for each of the pixels and the components
+        :param seed: seed for the clustering
+        :return: SolutionMap
+        """
+        if len(comp_map) < len(ref_map):
+            raise SolveError(None, False, msg='Not enough components.')
         logger.debug('building arrays')
-        comp_records = np.c_[
-            np.arange(len(comp_map)), [r.value.array for r in comp_map.records]]
-        logger.debug('choosing random sample')
-        parsort = np.random.choice(comp_records[:,0], len(ref_map), replace=False)
-        comp_records = comp_records[parsort]
-        if len(comp_records) < len(ref_map):
-            raise SolveError
-        np.random.shuffle(comp_records)
+        ref_colours = cls.colours(ref_map).astype(float)
+        comp_colours = cls.colours(comp_map).astype(float)
+        logger.debug(f'clustering colours into {clusters} bins')
+        ref_centres, ref_bins = cls.cluster(ref_colours, clusters, seed)
+        comp_centres, comp_bins = cls.cluster(comp_colours, clusters, seed)
+        # drop any empty bins
+        ref_used, ref_bins, ref_counts = np.unique(ref_bins, return_inverse=True,
+                                                   return_counts=True)
+        comp_used, comp_bins, comp_counts = np.unique(comp_bins, return_inverse=True,
+                                                      return_counts=True)
+        ref_centres, comp_centres = ref_centres[ref_used], comp_centres[comp_used]
+        rows, cols = len(ref_centres), len(comp_centres)
+
+        logger.debug(f'solving {rows}x{cols} transportation problem')
+        xy = pairwise_distances(ref_centres, comp_centres)
+        cost_matrix = (xy.T - xy.min(axis=1)).T.astype(int).reshape(-1, 1)
+        arc_rows, arc_cols, flows = FlowSolver.solve(cost_matrix, rows, cols, False,
+                                                     supply=ref_counts,
+                                                     capacity=comp_counts)
+        pixels, comps = cls.ungroup(ref_bins, comp_bins, arc_rows, arc_cols, flows)
+
+        # no assignment can cost less than every pixel getting its nearest component,
+        # or (by the triangle inequality) than the centres' cost minus the distance
+        # from every pixel and component to its centre
+        estimate = (xy[arc_rows, arc_cols] * flows).sum()
+        ref_error = np.linalg.norm(ref_colours - ref_centres[ref_bins], axis=1)
+        comp_error = np.linalg.norm(comp_colours[comps] -
+                                    comp_centres[comp_bins[comps]], axis=1)
+        bound = max(cls.lower_bound(ref_map, comp_map),
+                    estimate - ref_error.sum() - comp_error.sum())
+        cost = np.linalg.norm(ref_colours[pixels] - comp_colours[comps], axis=1).sum()
+        logger.debug(f'mean distance to bin centre: {ref_error.mean():.1f} for pixels, '
+                     f'{comp_error.mean():.1f} for components')
+        logger.debug(cls.describe_cost(cost, bound))
+
         logger.debug('building solution map')
-        logger.debug(f'assigning {len(ref_map)} pixels')
-        with ProgressLogger(len(ref_map), 20) as p, SolutionMap() as solution:
-            for i, pixel in enumerate(ref_map.records):
-                comp = comp_map.records[comp_records[i, 0]]
-                combined_value = CombinedEntry(path=comp.key,
-                                               target=HsvEntry(0, 0, 0),
-                                               src=comp.value)
-                solution.add(pixel.key, combined_value)
-                p.next()
+        solution = cls.assign(ref_map, comp_map, pixels, comps)
+        cls._log_solution(comp_map, solution)
+        return solution
+
+    @classmethod
+    def lower_bound(cls, ref_map, comp_map):
+        """
+        A cheap lower bound on the total cost of any solution: no assignment can cost
+        less than every pixel getting its nearest component.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :return: float, comparable with total_cost()
+        """
+        colours, counts = np.unique(cls.colours(ref_map), axis=0, return_counts=True)
+        nearest, _ = comp_map.colour_index.query(colours.astype(float), workers=-1)
+        return (nearest * counts).sum()
+
+    @staticmethod
+    def describe_cost(cost, bound):
+        """
+        Describes the total cost of an approximate solution and how far it could be
+        from the optimum.
+        :param cost: the total cost of the solution
+        :param bound: a lower bound on the optimal total cost, e.g. from lower_bound()
+        :return: str
+        """
+        return f'total cost: {cost:.0f}, at most {cost - bound:.0f} ' \
+               f'(+{(cost - bound) / max(bound, 1):.1%}) above the optimum'
+
+    @classmethod
+    def ungroup(cls, ref_groups, comp_groups, arc_rows, arc_cols, flows):
+        """
+        Expands the flows between groups of identical colours back into pairs of
+        individual pixel and component indices. Every pixel must be assigned.
+        :param ref_groups: the group index of each reference pixel
+        :param comp_groups: the group index of each component
+        :param arc_rows: the reference group index of each arc with flow
+        :param arc_cols: the component group index of each arc with flow
+        :param flows: the flow along each arc
+        :return: an array of pixel indices and an array of component indices
+        """
+        unit_rows = np.repeat(arc_rows, flows)
+        unit_cols = np.repeat(arc_cols, flows)
+        # pixels ordered by group line up with the units ordered by reference group
+        pixels = np.argsort(ref_groups, kind='stable')
+        unit_cols = unit_cols[np.argsort(unit_rows, kind='stable')]
+        # then the nth unit sent to a component group takes the nth component in it
+        by_col = np.argsort(unit_cols, kind='stable')
+        sorted_cols = unit_cols[by_col]
+        rank = np.arange(sorted_cols.size) - np.searchsorted(sorted_cols, sorted_cols)
+        comp_order = np.argsort(comp_groups, kind='stable')
+        comp_starts = np.concatenate(([0], np.cumsum(np.bincount(comp_groups))[:-1]))
+        comps = np.empty_like(pixels)
+        comps[by_col] = comp_order[comp_starts[sorted_cols] + rank]
+        return pixels, comps
+
+    @classmethod
+    def assign(cls, ref_map, comp_map, pixels, comps):
+        """
+        Builds a SolutionMap from pairs of indices into the sorted records of the
+        reference and component maps.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param pixels: array of indices into ref_map.records
+        :param comps: array of indices into comp_map.records, the same length as pixels
+        :return: SolutionMap
+        """
+        pixels = np.asarray(pixels, dtype=np.int64)
+        comps = np.asarray(comps, dtype=np.int64)
+        return SolutionMap._from_columns({
+            'xy': ref_map.column('xy')[pixels],
+            'path': comp_map.column('path')[comps],
+            'target': ref_map.column('hsv')[pixels],
+            'src': comp_map.column('hsv')[comps],
+            'has_src': np.ones(len(pixels), dtype=bool)
+            }, paths=comp_map._paths)
+
+    @staticmethod
+    def _log_solution(comp_map, solution):
+        """
+        Logs the end of a solve, for every solve method.
+        """
         logger.debug('finished solving')
         logger.debug(f'assigned {len(solution)} pixels from a pool of '
                      f'{len(comp_map)} specimen images')
+
+    @classmethod
+    def solve_fast(cls, ref_map, comp_map, top_k=16, passes=10, seed=None):
+        """
+        Finds a good (but not optimal) assignment quickly. The most constrained pixels
+        (those furthest from their nearest components) are assigned first, each taking
+        its nearest available component, then a few passes of pairwise swaps improve
+        the result. The total cost and the most it can be above the optimum are logged.
+        :param ref_map: the ReferenceMap
+        :param comp_map: the ComponentMap
+        :param top_k: the number of nearest components to consider for each pixel
+        :param passes: the maximum number of swap passes
+        :param seed: seed for the random pairing of pixels in the swap passes
+        :return: SolutionMap
+        """
+        if len(comp_map) < len(ref_map):
+            raise SolveError(None, False, msg='Not enough components.')
+        ref_colours = cls.colours(ref_map).astype(float)
+        comp_colours = cls.colours(comp_map).astype(float)
+        rows = len(ref_colours)
+        assignment, candidates = cls.greedy_assign(ref_colours, comp_colours,
+                                                   comp_map.colour_index, top_k)
+        cost = cls.swap(ref_colours, comp_colours, assignment, candidates, passes,
+                        np.random.default_rng(seed))
+        logger.debug(cls.describe_cost(cost, cls.lower_bound(ref_map, comp_map)))
+        logger.debug('building solution map')
+        solution = cls.assign(ref_map, comp_map, np.arange(rows), assignment)
+        cls._log_solution(comp_map, solution)
+        return solution
+
+    @classmethod
+    def greedy_assign(cls, ref_colours, comp_colours, comp_index, top_k):
+        """
+        Assigns each pixel its nearest available component, starting with the most
+        constrained pixels (those furthest from their k-th nearest component).
+        :param ref_colours: (rows, 3) array of pixel colours
+        :param comp_colours: (cols, 3) array of component colours; cols >= rows
+        :param comp_index: a cKDTree of comp_colours
+        :param top_k: the number of nearest components to consider for each pixel
+        :return: the component index for each pixel, and the (rows, k) array of
+                 candidate component indices that was used
+        """
+        rows, cols = len(ref_colours), len(comp_colours)
+        k = min(top_k, cols)
+        # pixels with the same colour have the same candidates, so only look them up
+        # once
+        colours, groups = np.unique(ref_colours, axis=0, return_inverse=True)
+        groups = groups.ravel()
+        logger.debug(f'finding {k} nearest components for {len(colours)} colours')
+        xy, candidates = comp_index.query(colours, k=list(range(1, k + 1)),
+                                          workers=-1)
+        # distance to the furthest candidate: the further, the fewer good options
+        order = np.argsort(-xy[groups, -1], kind='stable')
+        used = np.zeros(cols, dtype=bool)
+        assignment = np.full(rows, -1, dtype=np.int64)
+        logger.debug('assigning greedily')
+        with TimeLogger():
+            greedy(order, groups, candidates, used, assignment)
+            while (assignment < 0).any():
+                # the candidates of these pixels were all taken: look again among the
+                # components still available, further away each time
+                missing = order[assignment[order] < 0]
+                free = np.flatnonzero(~used)
+                k = min(k * 2, free.size)
+                missing_colours, missing_groups = np.unique(ref_colours[missing],
+                                                            axis=0,
+                                                            return_inverse=True)
+                _, free_candidates = cKDTree(comp_colours[free]).query(
+                    missing_colours, k=list(range(1, k + 1)), workers=-1)
+                free_candidates = free[free_candidates.reshape(len(missing_colours), k)]
+                remaining_groups = np.zeros(rows, dtype=np.int64)
+                remaining_groups[missing] = missing_groups.ravel()
+                greedy(missing, remaining_groups, free_candidates, used, assignment)
+        candidates = candidates.reshape(len(colours), -1)[groups]
+        return assignment, candidates
+
+    @classmethod
+    def swap(cls, ref_colours, comp_colours, assignment, candidates, passes, rng):
+        """
+        Improves an assignment in place. In each pass, every pixel picks one of its
+        candidate components at random: if it's unused the pixel takes it when that's
+        cheaper, and if another pixel has it the two swap when that's cheaper overall.
+        Conflicting moves are dropped, keeping the ones with the largest gains.
+        :param ref_colours: (rows, 3) array of pixel colours
+        :param comp_colours: (cols, 3) array of component colours
+        :param assignment: the component index for each pixel
+        :param candidates: (rows, k) array of candidate component indices for each pixel
+        :param passes: the maximum number of passes; stops early if nothing changes
+        :param rng: a numpy random Generator
+        :return: the total cost (sum of distances) after the passes
+        """
+        rows = len(ref_colours)
+        pixels = np.arange(rows)
+
+        def dist(p, c):
+            return np.linalg.norm(ref_colours[p] - comp_colours[c], axis=1)
+
+        for n in range(passes):
+            owner = np.full(len(comp_colours), -1, dtype=np.int64)
+            owner[assignment] = pixels
+            wanted = candidates[pixels, rng.integers(0, candidates.shape[1], rows)]
+            other = owner[wanted]
+            current = dist(pixels, assignment)
+            free = other < 0
+            swapped = ~free & (other != pixels)
+            gain = np.zeros(rows)
+            gain[free] = current[free] - dist(pixels[free], wanted[free])
+            a, b = pixels[swapped], other[swapped]
+            gain[swapped] = (current[a] + current[b] - dist(a, assignment[b]) -
+                             dist(b, assignment[a]))
+            moves = np.flatnonzero(gain > 0)
+            moves = moves[np.argsort(-gain[moves], kind='stable')]
+            # each pixel and each wanted component can only be in one move
+            nodes = np.concatenate((moves, rows + wanted[moves],
+                                    np.where(free[moves], -1, other[moves])))
+            first = np.zeros(nodes.size, dtype=bool)
+            first[np.unique(nodes, return_index=True)[1]] = True
+            first[nodes == -1] = True
+            moves = moves[first.reshape(3, -1).all(axis=0)]
+            if moves.size == 0:
+                break
+            swaps = moves[~free[moves]]
+            assignment[other[swaps]] = assignment[swaps]
+            assignment[moves] = wanted[moves]
+            logger.debug(f'swap pass {n + 1}: {moves.size} changes')
+        return dist(pixels, assignment).sum()
+
+    @classmethod
+    def total_cost(cls, solution_map):
+        """
+        The total distance between the target and component colours of a solution.
+        :param solution_map: a SolutionMap
+        :return: float
+        """
+        target = solution_map.column('target').astype(float)
+        src = solution_map.column('src').astype(float)
+        return np.linalg.norm(target - src, axis=1).sum()
+
+    @classmethod
+    def silhouette(cls, ref_map, comp_map):
+        if len(comp_map) < len(ref_map):
+            raise SolveError
+        logger.debug('choosing random sample')
+        comps = np.random.choice(len(comp_map), len(ref_map), replace=False)
+        logger.debug('building solution map')
+        logger.debug(f'assigning {len(ref_map)} pixels')
+        solution = SolutionMap._from_columns({
+            'xy': ref_map.column('xy'),
+            'path': comp_map.column('path')[comps],
+            'target': np.zeros((len(ref_map), 3), dtype=np.uint8),
+            'src': comp_map.column('hsv')[comps],
+            'has_src': np.ones(len(ref_map), dtype=bool)
+            }, paths=comp_map._paths)
+        cls._log_solution(comp_map, solution)
         return solution
 
     @classmethod
@@ -185,7 +1005,7 @@ class Builder(object):
         logger.debug('building image')
         canvas = Canvas(solution_map.bounds)
         with ProgressLogger(len(solution_map), 10) as p:
-            for record in solution_map.records:
+            for record in solution_map.iter_records():
                 entries = record.value.entries
                 colour = entries.get('src', None)
                 component = Component(entries['path'].get(prefix),
@@ -229,24 +1049,3 @@ class Canvas(object):
             self.composite = self.composite.convert(mode='RGB')
         self.composite.save(fn)
 
-
-class SolveError(Exception):
-    def __init__(self, error_code, masked, msg=None):
-        self.error_code = error_code
-        self.reason = self.codes(error_code)
-        self.masked = masked
-        if msg is None:
-            msg = f'Failed to solve: {self.reason}.'
-            if self.masked:
-                msg += ' Try passing "use_mask=False" into the build method, ' \
-                       'or increase "mask_tolerance".'
-        super(SolveError, self).__init__(msg)
-
-    @staticmethod
-    def codes(error_code):
-        solve_cls = min_cost_flow.SimpleMinCostFlow
-        codes = {getattr(solve_cls, i): i for i in dir(solve_cls) if
-                 not callable(getattr(solve_cls, i)) and isinstance(
-                     getattr(solve_cls, i),
-                     int)}
-        return codes.get(error_code, 'UNKNOWN ERROR')
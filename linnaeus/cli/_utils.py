@@ -61,7 +61,7 @@ def deserialise(ctx, path, factory, callback=None, saveas=None):
     """
     from linnaeus import MapFactory
     try:
-        read_map = factory.deserialise(MapFactory.load_text(path))
+        read_map = factory.load(path)
         return read_map
     except (json.JSONDecodeError, UnicodeDecodeError, IsADirectoryError):
         if callback is None:
@@ -72,9 +72,11 @@ def deserialise(ctx, path, factory, callback=None, saveas=None):
                 if saveas is None:
                     saveas = path + '.json'
                 mp = callback(path)
-                MapFactory.save_text(saveas, mp.serialise())
+                MapFactory.save(saveas, mp)
+                return mp
             except Exception as e:
-                echo(ctx, f'Unable to create map from {path} ({e.__name__}).', err=True)
+                echo(ctx, f'Unable to create map from {path} ({type(e).__name__}).',
+                     err=True)
                 raise click.Abort
 
 
@@ -1,5 +1,6 @@
 import base64
 import click
+import json
 import os
 
 from linnaeus import MapFactory
@@ -12,22 +13,66 @@ import re
 
 @cli.command(short_help='Displays some details about a serialised map file.')
 @decorators.inputfiles()
+@click.option('--validate', is_flag=True, default=False,
+              help='Load the whole map and check it against the details in its header.')
 @click.pass_context
-def readmap(ctx, inputs):
+def readmap(ctx, inputs, validate):
     """
-    Displays some details about the given serialised map file. Can also act as a sort
-    of validator for serialised map files in that if it can load them, they're valid.
+    Displays some details about the given serialised map file. These are read from
+    the file's header, so the rest of the file isn't loaded unless the file doesn't
+    have one (it was saved by an older version) or --validate is used. With
+    --validate, it acts as a validator for serialised map files: if it can load them
+    and their contents match the header, they're valid.
     """
     from linnaeus import MapFactory
     from linnaeus.models import ReferenceMap
-    read_map = utils.deserialise(ctx, inputs, MapFactory)
+    try:
+        header = MapFactory.read_header(inputs)
+    except (json.JSONDecodeError, UnicodeDecodeError, IsADirectoryError):
+        header = None
+    read_map = None
+    if validate or header is None or 'hash' not in header:
+        read_map = utils.deserialise(ctx, inputs, MapFactory)
     utils.echo(ctx, click.style(inputs, bold=True))
-    utils.echo(ctx, f'{type(read_map).__name__} with {len(read_map)} items')
-    if isinstance(read_map, ReferenceMap):
-        w, h = read_map.bounds
+    details = read_map.header() if read_map is not None else header
+    utils.echo(ctx, f'{details["type"]} with {details["records"]} items')
+    if 'bounds' in details:
+        w, h = details['bounds']
         utils.echo(ctx, f'{w} "pixels" wide, {h} "pixels" tall')
+    if header is not None and 'config' in header:
+        current = 'the current' if header['config'] == constants.fingerprint else \
+            'a different'
+        utils.echo(ctx, f'Saved with a pixel size of {header["pixel_size"]} and '
+                        f'{current} config ({header["config"]})')
+    if isinstance(read_map, ReferenceMap) and len(read_map) > 0:
         utils.echo(ctx, 'An example record:')
         utils.echo(ctx, read_map.records[0])
+    if validate:
+        if header is None or 'hash' not in header:
+            utils.echo(ctx, 'No header to check the contents against.')
+        elif [header[k] for k in ('type', 'records', 'hash')] != [
+                details[k] for k in ('type', 'records', 'hash')]:
+            utils.echo(ctx, 'The contents do not match the header.', err=True)
+            raise click.Abort
+        else:
+            utils.echo(ctx, 'The contents match the header.')
+
+
+@cli.command(short_help='Convert a map file between JSON and binary (.npz).')
+@decorators.inputfiles()
+@decorators.outputfile
+@click.pass_context
+def convert(ctx, inputs, output):
+    """
+    Converts a serialised map file from JSON to binary, or from binary to JSON. Binary
+    (.npz) maps are smaller and much quicker to load; JSON maps are easier to use with
+    other programs. All the commands that read maps can read either format, and maps
+    are saved as binary if the output path ends in .npz.
+    """
+    read_map = utils.deserialise(ctx, inputs, MapFactory)
+    output = output or utils.new_filename(
+        inputs, new_ext='json' if inputs.endswith('.npz') else 'npz')
+    return utils.final(ctx, output, lambda x: MapFactory.save(x, read_map))
 
 
 @cli.command(short_help='Generate a .config file.')
@@ -55,7 +100,7 @@ def textmap(ctx, text, font, output, colour, size):
     reference_map = MapFactory.reference().from_text(text, font, size, colour)
 
     return utils.final(ctx, output,
-                       lambda x: MapFactory.save_text(x, reference_map.serialise()))
+                       lambda x: MapFactory.save(x, reference_map))
 
 
 @cli.command(short_help='Create a reference map of a QR code.')
@@ -76,7 +121,7 @@ def qr(ctx, data, output, colour, size):
     reference_map = MapFactory.reference().from_qr_data(data, colour, size)
 
     return utils.final(ctx, output,
-                       lambda x: MapFactory.save_text(x, reference_map.serialise()))
+                       lambda x: MapFactory.save(x, reference_map))
 
 
 @cli.command(
@@ -102,8 +147,77 @@ def addsrc(ctx, inputs, components):
     for path in inputs:
         if os.path.isdir(path):
             files = [os.path.join(path, f) for f in os.listdir(path) if
-                     f.endswith('.json')]
+                     f.endswith('.json') or f.endswith('.npz')]
             for f in files:
                 _update(f)
         else:
             _update(path)
+
+
+@cli.command(short_help='Plan a solve within a memory budget without running it.')
+@decorators.inputfiles(nargs=-1)
+@click.option('--memory-budget', type=click.INT,
+              help='The memory (in MB) to solve within. Defaults to the memory_budget '
+                   'config value.')
+@click.option('--top-k', type=click.INT,
+              help='The top-k to plan a --top-k solve with. Defaults to 20.')
+@click.option('--tiles', type=click.INT,
+              help='The number of tiles to plan a --tiles solve with. Defaults to 4.')
+@click.option('--workers', type=click.INT,
+              help='The number of processes to plan a --tiles solve with. Defaults to '
+                   'the number of CPUs.')
+@click.option('--reuse', type=click.INT,
+              help='The number of times each component can be used. Defaults to the '
+                   'reuse_limit config value.')
+@click.pass_context
+def plan(ctx, inputs, memory_budget, top_k, tiles, workers, reuse):
+    """
+    Estimates the peak memory and time taken to solve the given reference and
+    components with each strategy, and shows the one the solve command would use with
+    the same --memory-budget. Estimates use calibration data from a .calibration file
+    in the current directory if there is one (see benchmarks/calibrate.py).
+
+    The inputs are the same as for the solve command, but images are not loaded or
+    made into maps: the reference size is taken from the image dimensions and the
+    number of components from the number of files. Maps are only read as far as their
+    header.
+    """
+    from PIL import Image
+    from linnaeus.planner import Planner
+    ref, *comps = inputs
+
+    try:
+        rows = _records(ref)
+    except (ValueError, UnicodeDecodeError):
+        w, h = constants.size.dimensions(*Image.open(ref).size)
+        rows = w * h
+
+    count = 0
+    for i in comps:
+        if os.path.isdir(i):
+            count += sum(len(files) for _, _, files in os.walk(i))
+        else:
+            try:
+                count += _records(i)
+            except (ValueError, UnicodeDecodeError):
+                count += 1
+
+    plans = Planner.load().plan(rows, count, (memory_budget or 0) * 2 ** 20,
+                                top_k=top_k, tiles=tiles, workers=workers, reuse=reuse)
+    utils.echo(ctx, f'{rows} pixels, {count} components')
+    for i, p in enumerate(plans):
+        marker = '*' if i == 0 and p.fits else ' '
+        utils.echo(ctx, f'{marker} {p}' + ('' if p.fits else ' (does not fit)'))
+
+
+def _records(path):
+    """
+    The number of records in a map file, from its header so the map isn't loaded
+    (unless it was saved by an older version without one).
+    :param path: the path to the map file
+    :return: int
+    """
+    header = MapFactory.read_header(path)
+    if header is not None and 'records' in header:
+        return header['records']
+    return len(MapFactory.load(path))
@@ -38,9 +38,11 @@ from . import _decorators as decorators, _utils as utils, addtl, core, preproces
               help='Watch the folder(s) for new files.')
 @click.option('--convert', is_flag=True, default=False,
               help='Convert images to JPEG as a final step to minimise file space.')
+@click.option('--fast', is_flag=True, default=False,
+              help='Use a quick approximate solve instead of the optimal one.')
 @click.pass_context
 def go(ctx, inputs, components, silhouette, prefix, combine_with,
-       combine_gravity, combine_offset, greenscreen, cleanup, watch, convert):
+       combine_gravity, combine_offset, greenscreen, cleanup, watch, convert, fast):
     """
     Runs a sequence of CLI functions to transform an input image into a composite with
     minimal user input. Can also be used over a set of images (e.g. a folder),
@@ -93,8 +95,7 @@ def go(ctx, inputs, components, silhouette, prefix, combine_with,
                     'gravity': combine_gravity,
                     'offset': combine_offset
                     }
-                if MapFactory.identify(MapFactory.load_text(
-                        combine_with)) == MapFactory.reference().product_class:
+                if MapFactory.identify_file(combine_with) is MapFactory.reference():
                     combined_map = ctx.invoke(core.combine,
                                               inputs=[combine_with, subject_ref],
                                               **combine_kwargs)
@@ -102,11 +103,11 @@ def go(ctx, inputs, components, silhouette, prefix, combine_with,
                     completed_sol = ctx.invoke(core.solve,
                                                inputs=[combined_map, components],
                                                output=output,
-                                               silhouette=False)
+                                               silhouette=False, fast=fast)
                 else:
                     subject_sol = ctx.invoke(core.solve,
                                              inputs=[subject_ref, components],
-                                             silhouette=silhouette)
+                                             silhouette=silhouette, fast=fast)
                     cleaning_list.append(subject_sol)
                     completed_sol = ctx.invoke(core.combine,
                                                inputs=[combine_with, subject_sol],
@@ -114,7 +115,8 @@ def go(ctx, inputs, components, silhouette, prefix, combine_with,
                                                **combine_kwargs)
             else:
                 completed_sol = ctx.invoke(core.solve, inputs=[subject_ref, components],
-                                           output=output, silhouette=silhouette)
+                                           output=output, silhouette=silhouette,
+                                           fast=fast)
 
             png_img_path = ctx.invoke(core.render, inputs=completed_sol, prefix=prefix)
             if convert:
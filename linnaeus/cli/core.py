@@ -60,7 +60,7 @@ def makemap(ctx, inputs, output, resize):
                 utils.echo(ctx, f'Ignoring {i}')
         component_map = MapFactory.component().from_local(**kwargs)
         return utils.final(ctx, output,
-                           lambda x: MapFactory.save_text(x, component_map.serialise()))
+                           lambda x: MapFactory.save(x, component_map))
     elif os.path.isfile(inputs[0]):
         inputs = inputs[0]
         try:
@@ -71,7 +71,7 @@ def makemap(ctx, inputs, output, resize):
         output = output or MapFactory.reference().defaultpath(iden)
         reference_map = MapFactory.reference().from_image_local(inputs, resize)
         return utils.final(ctx, output,
-                           lambda x: MapFactory.save_text(x, reference_map.serialise()))
+                           lambda x: MapFactory.save(x, reference_map))
     else:
         utils.echo(ctx, 'Cannot identify target type.', err=True)
         raise click.Abort
@@ -84,11 +84,62 @@ def makemap(ctx, inputs, output, resize):
               help='Use masking to ignore components that are unlikely to match - this '
                    'is much faster but more likely to fail. Lower tolerance = more '
                    'components removed.')
+@click.option('-k', '--top-k', type=click.INT,
+              help='Only consider the k closest components for each pixel, found '
+                   'with a colour index rather than by comparing every pixel with every '
+                   'component. Much faster, uses far less memory and allows much larger '
+                   'component sets. Ignores --tolerance.')
 @click.option('--silhouette', is_flag=True, help='Create a silhouette image, i.e. not '
                                                  'matched on colour. Only really works '
                                                  'with references with transparency.')
+@click.option('--solver', type=click.Choice(['auto', 'flow', 'dense', 'sparse',
+                                            'auction']), default='auto',
+              help='The assignment solver to use. By default this is chosen based on the '
+                   'size and density of the problem.')
+@click.option('--circular-hue', is_flag=True,
+              help='Treat hue as an angle, so hues at either end of the range (e.g. '
+                   'reds) count as close together. Only for unmasked, masked and '
+                   '--top-k solves.')
+@click.option('--group', is_flag=True,
+              help='Solve between groups of identical colours instead of individual '
+                   'pixels and components. Gives the same result as an unmasked solve, '
+                   'but is much faster for references with few colours (e.g. text and '
+                   'QR codes). Ignores --tolerance and --top-k.')
+@click.option('--fast', is_flag=True,
+              help='Find a good but not optimal solution quickly by assigning the '
+                   'closest available components and then swapping pairs to improve '
+                   'it. Ignores --tolerance and --solver.')
+@click.option('--tiles', type=click.INT,
+              help='Split the reference into this many spatial tiles and solve them '
+                   'separately, in parallel. Much faster for large references, but the '
+                   'result may be slightly worse. Ignores --tolerance.')
+@click.option('--workers', type=click.INT,
+              help='The number of processes to use with --tiles. Defaults to the '
+                   'number of CPUs.')
+@click.option('--hierarchical', is_flag=True,
+              help='Solve a downsampled reference against groups of similar '
+                   'components first, then use that to solve each group separately. '
+                   'Uses much less memory for large references, but the result may be '
+                   'slightly worse. Ignores --tolerance.')
+@click.option('--clusters', type=click.INT,
+              help='Solve approximately by grouping the pixel and component colours '
+                   'into this many clusters. Much faster; fewer clusters is faster '
+                   'but less accurate. Ignores --tolerance, --top-k and --solver.')
+@click.option('--reuse', type=click.INT,
+              help='The number of times each component can be used, so fewer '
+                   'components are needed. Defaults to the reuse_limit config value.')
+@click.option('--reuse-distance', type=click.FLOAT,
+              help='The minimum distance (in components) between repeats of the same '
+                   'component. Defaults to the reuse_distance config value.')
+@click.option('--memory-budget', type=click.INT,
+              help='The memory (in MB) to solve within. Picks the largest pool of '
+                   'components and the best of an unmasked, masked, --top-k or --tiles '
+                   'solve that should fit, instead of using max_components. Use the '
+                   'plan command to see the options without solving.')
 @click.pass_context
-def solve(ctx, inputs, output, tolerance, silhouette):
+def solve(ctx, inputs, output, tolerance, top_k, silhouette, solver, circular_hue,
+          group, fast, tiles, workers, hierarchical, clusters, reuse, reuse_distance,
+          memory_budget):
     """
     Attempts to create a solution map for the given reference and component set.
 
@@ -122,7 +173,7 @@ def solve(ctx, inputs, output, tolerance, silhouette):
     saveas = MapFactory.component().defaultpath(comps[0].split(os.path.sep)[-1])
     if len(comps) > 1:
         comp_map = MapFactory.component().from_local(**kwargs)
-        MapFactory.save_text(saveas, comp_map.serialise())
+        MapFactory.save(saveas, comp_map)
     else:
         comps = comps[0]
         comp_map = utils.deserialise(ctx, comps, MapFactory.component(),
@@ -130,40 +181,106 @@ def solve(ctx, inputs, output, tolerance, silhouette):
                                          **kwargs),
                                      saveas=saveas)
 
-    solution_map = None
-    if silhouette:
-        try:
-            solution_map = Builder.silhouette(ref_map, comp_map)
-        except SolveError as e:
-            utils.echo(ctx, f'Something went wrong: {e}', err=True)
+    use_mask = True
+    plans = [None]
+    if memory_budget:
+        from linnaeus.planner import Planner
+        plans = Planner.load().plan(len(ref_map), len(comp_map), memory_budget * 2 ** 20,
+                                    top_k=top_k, tiles=tiles, workers=workers,
+                                    backend=solver, reuse=reuse)
+        if not plans[0].fits:
+            utils.echo(ctx, f'Nothing fits in {memory_budget} MB: {plans[0]}', err=True)
             raise click.Abort
-    else:
-        tol = float(tolerance)
-        use_mask = True
-        attempts = 0
-        while solution_map is None and attempts < 5:
-            attempts += 1
+        # if a plan has no solution, the next one that fits is tried (pools only get
+        # smaller, so reducing the components again is fine)
+        plans = [p for p in plans if p.fits]
+
+    solution_map = None
+    for plan in plans:
+        if plan is not None:
+            utils.echo(ctx, f'Using {plan}')
+            if plan.pool < len(comp_map):
+                comp_map.reduce(plan.pool, ref_map)
+            use_mask = plan.strategy != 'dense'
+            top_k = plan.top_k
+            tiles = plan.tiles
+        if silhouette or group or fast or tiles or hierarchical:
             try:
-                solution_map = Builder.solve(ref_map, comp_map,
-                                             mask_tolerance=tol, use_mask=use_mask)
-                break
+                if silhouette:
+                    solution_map = Builder.silhouette(ref_map, comp_map)
+                elif fast:
+                    solution_map = Builder.solve_fast(ref_map, comp_map,
+                                                      top_k=top_k or 16)
+                    cost = Builder.describe_cost(Builder.total_cost(solution_map),
+                                                 Builder.lower_bound(ref_map, comp_map))
+                    utils.echo(ctx, f'{cost.capitalize()}.')
+                elif tiles:
+                    solution_map = Builder.solve_tiled(ref_map, comp_map, tiles=tiles,
+                                                       workers=workers, top_k=top_k,
+                                                       backend=solver)
+                elif hierarchical:
+                    solution_map = Builder.solve_hierarchical(ref_map, comp_map,
+                                                              top_k=top_k or 16,
+                                                              backend=solver)
+                else:
+                    solution_map = Builder.solve_grouped(ref_map, comp_map)
             except SolveError as e:
-                utils.echo(ctx, e, err=True)
-                if not use_mask or attempts >= 5:
-                    utils.echo(ctx, 'Nothing more to be done. Aborting.', err=True)
+                utils.echo(ctx, f'Something went wrong: {e}', err=True)
+                if not memory_budget:
                     raise click.Abort
-                elif use_mask and tol < -0.5 and utils.confirm(ctx,
-                                                               f'Increase tolerance to '
-                                                               f'{tol/2}?',
-                                                               default=True):
-                    tol /= 2
-                else:
-                    utils.confirm(ctx, 'Disable mask?', abort=True, default=True)
-                    use_mask = False
+        else:
+            tol = float(tolerance)
+            attempts = 0
+            # calculated on the first attempt and only re-masked on the others
+            costs = None
+            while solution_map is None and attempts < 5:
+                attempts += 1
+                try:
+                    if costs is None and not (top_k or clusters):
+                        if not memory_budget:
+                            Builder.limit(comp_map, ref_map)
+                        costs = Builder.costs(ref_map, comp_map, circular_hue)
+                    solution_map = Builder.solve(ref_map, comp_map,
+                                                 mask_tolerance=tol, use_mask=use_mask,
+                                                 top_k=top_k, backend=solver,
+                                                 clusters=clusters, costs=costs,
+                                                 reuse=reuse,
+                                                 reuse_distance=reuse_distance,
+                                                 circular_hue=circular_hue)
+                    break
+                except SolveError as e:
+                    utils.echo(ctx, e, err=True)
+                    if top_k and attempts < 5 and not memory_budget:
+                        utils.confirm(ctx, f'Increase top-k to {top_k * 2}?',
+                                      abort=True, default=True)
+                        top_k *= 2
+                    elif top_k or not use_mask or attempts >= 5:
+                        # nothing more to try with this plan (under a memory budget,
+                        # a larger top-k would use more memory than planned)
+                        break
+                    elif tol < -0.5 and utils.confirm(ctx,
+                                                      f'Increase tolerance to {tol / 2}?',
+                                                      default=True):
+                        tol /= 2
+                    elif memory_budget:
+                        # an unmasked solve would use more memory than planned
+                        break
+                    else:
+                        utils.confirm(ctx, 'Disable mask?', abort=True, default=True)
+                        use_mask = False
+            if solution_map is None and not memory_budget:
+                utils.echo(ctx, 'Nothing more to be done. Aborting.', err=True)
+                raise click.Abort
+        if solution_map is not None:
+            break
+    else:
+        utils.echo(ctx, f'Unable to solve within {memory_budget} MB. Aborting.',
+                   err=True)
+        raise click.Abort
 
     if solution_map is not None:
         return utils.final(ctx, output,
-                           lambda x: MapFactory.save_text(x, solution_map.serialise()))
+                           lambda x: MapFactory.save(x, solution_map))
 
 
 @cli.command(short_help='Generate an image from a solution map.')
@@ -202,10 +319,10 @@ def render(ctx, inputs, output, adjust, soft_adjust, prefix):
               help='(Solution/Reference maps only): C(enter), N(orth), S(outh), '
                    'E(ast), or W(est). Can also combine NSEW (e.g. NE for top right '
                    'corner).')
-@click.option('--position', nargs=2,
+@click.option('--position', nargs=2, type=click.INT,
               help='(Solution/Reference maps only): Manually define x, y position for '
                    'new map. Cannot use with --gravity.')
-@click.option('--offset', nargs=2, default=(0, 0),
+@click.option('--offset', nargs=2, type=click.INT, default=(0, 0),
               help='(Solution/Reference maps only): An x, y offset from the position ('
                    'whether specified manually via --position or calculated with '
                    '--gravity).')
@@ -228,7 +345,7 @@ def combine(ctx, inputs, output, **kwargs):
             'prefix': kwargs.get('prefix', '.')
             }
     else:
-        if 'position' not in kwargs or len(kwargs['position']) != 2:
+        if not kwargs.get('position') or len(kwargs['position']) != 2:
             kwargs['position'] = kwargs['gravity']
         del kwargs['gravity']
         del kwargs['prefix']
@@ -237,4 +354,4 @@ def combine(ctx, inputs, output, **kwargs):
     output = output or utils.new_filename(inputs[0], new_folder='maps',
                                           suffix='combined')
     return utils.final(ctx, output,
-                       lambda x: MapFactory.save_text(x, combined_map.serialise()))
+                       lambda x: MapFactory.save(x, combined_map))
@@ -13,16 +13,15 @@ def hsv_pixels(img):
 
 
 def hsv_pixels_with_xy(img):
-    hsv = []
-    r = 0
-    for row in convert_to_hsv(img):
-        c = 0
-        for col in row:
-            hsv.append(np.append(col, np.array([c, r])))
-            c += 1
-        r += 1
-    hsv = np.array(hsv).astype(int)
-    return hsv.reshape((-1, hsv.shape[-1]))
+    """
+    The HSV values of every pixel in an image, followed by its x and y coordinates.
+    :param img: a PIL image
+    :return: an array of [h, s, v, x, y] rows, in row order
+    """
+    hsv = convert_to_hsv(img)
+    rows, cols = np.indices(hsv.shape[:2])
+    return np.c_[hsv.reshape((-1, hsv.shape[-1])), cols.ravel(), rows.ravel()].astype(
+        int)
 
 
 def tryint(i):
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import math
 
 import click
@@ -17,6 +19,12 @@ class Config(object):
         else:
             config_dict = {}
         self.max_components = config_dict.get('max_components', 80000)
+        self.arc_chunk_size = config_dict.get('arc_chunk_size', 1000000)
+        self.memory_budget = config_dict.get('memory_budget', 1024)
+        self.dense_solver_limit = config_dict.get('dense_solver_limit', 100000000)
+        self.auction_solver_density = config_dict.get('auction_solver_density', 0.01)
+        self.reuse_limit = config_dict.get('reuse_limit', 1)
+        self.reuse_distance = config_dict.get('reuse_distance', 0)
         self.pixel_size = config_dict.get('pixel_size', 50)
         self.size = Size(self.pixel_size,
                          **{k: v for k, v in config_dict.items() if k in Size.keys})
@@ -33,9 +41,26 @@ class Config(object):
     def log_level(self, level: str):
         self._log_level = level.upper()
 
+    @property
+    def fingerprint(self):
+        """
+        A short hash of the settings that change how maps are made, for telling if a
+        saved map was made with different settings.
+        :return: str
+        """
+        settings = [self.pixel_size, str(self.size), self.max_components,
+                    self.dominant_colour_method, self.reuse_limit, self.reuse_distance]
+        return hashlib.sha1(json.dumps(settings).encode()).hexdigest()[:12]
+
     def dump(self, path):
         config_dict = {
             'max_components': self.max_components,
+            'arc_chunk_size': self.arc_chunk_size,
+            'memory_budget': self.memory_budget,
+            'dense_solver_limit': self.dense_solver_limit,
+            'auction_solver_density': self.auction_solver_density,
+            'reuse_limit': self.reuse_limit,
+            'reuse_distance': self.reuse_distance,
             'pixel_size': self.pixel_size,
             'saturation_threshold': self.saturation_threshold,
             'log_level': self._log_level,
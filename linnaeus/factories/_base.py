@@ -1,7 +1,11 @@
 import abc
+import itertools
 import os
 
-from linnaeus.models.maps import BaseMap
+import numpy as np
+
+from linnaeus.models.maps import BaseMap, PathTable
+from . import _binary, _json
 
 
 class BaseMapFactory(abc.ABC):
@@ -15,6 +19,134 @@ class BaseMapFactory(abc.ABC):
         """
         pass
 
+    @classmethod
+    def deserialise_arrays(cls, header, arrays):
+        """
+        Makes a Map from the arrays in a binary map file.
+        :param header: the file's header
+        :param arrays: a dict of name: array, as from BaseMap.to_arrays()
+        :return: Map
+        """
+        cls._check_header(header)
+        product_class = cls.product_class
+        paths = None
+        if 'paths' in arrays:
+            paths = PathTable()
+            paths.ids(p.decode() for p in arrays['paths'].tolist())
+        return product_class._from_columns(
+            {name: arrays[name] for name in product_class.columns}, paths=paths)
+
+    @classmethod
+    def load(cls, filepath):
+        """
+        Loads a Map from a file, either JSON or binary (.npz). Binary map columns are
+        memory-mapped rather than read into memory.
+        :param filepath: the path to the file
+        :return: Map
+        """
+        if _binary.is_binary(filepath):
+            return cls.deserialise_arrays(*_binary.load(filepath))
+        with open(filepath, 'r') as f:
+            return cls.read(f)
+
+    @classmethod
+    def read_header(cls, filepath):
+        """
+        Reads the header of a map file (see BaseMap.header()) without loading the rest
+        of the file. JSON maps saved by older versions don't have one.
+        :param filepath: the path to the file
+        :return: dict, or None if the file doesn't have a header
+        """
+        if _binary.is_binary(filepath):
+            return _binary.header(filepath)
+        with open(filepath, 'r') as f:
+            first = next(_json.records(f), None)
+        if first is not None and first[0] == BaseMap.header_key:
+            return first[1]
+        return None
+
+    @classmethod
+    def read(cls, f):
+        """
+        Deserialises JSON from a file a chunk at a time, so the whole file is never in
+        memory at once (as text or as JSON objects).
+        :param f: a file opened in text mode
+        :return: Map
+        """
+        return cls._from_records(_json.records(f))
+
+    @classmethod
+    def _from_records(cls, records, chunk_size=2 ** 16, columns=None, paths=None):
+        """
+        Makes a Map from serialised records, converting them to arrays a chunk at a
+        time and then making the map from all the arrays at once.
+        :param records: an iterable of serialised (key, value) pairs
+        :param chunk_size: the number of records to convert at once
+        :param columns: a function converting a dict of records to arrays, if not
+                        cls._columns
+        :param paths: the PathTable that a 'path' column from columns refers to, if it
+                      holds indices rather than path strings
+        :return: Map
+        """
+        records = cls._without_header(records)
+        columns = columns or cls._columns
+        indexed = paths is not None
+        if not indexed:
+            paths = PathTable()
+        chunks = []
+        while True:
+            chunk = dict(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            arrays = columns(chunk)
+            if 'path' in arrays and not indexed:
+                arrays['path'] = paths.ids(arrays['path'])
+            chunks.append({k: np.asarray(v) for k, v in arrays.items()})
+        if not chunks:
+            return cls.product_class()
+        return cls.product_class.from_arrays(
+            {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}, paths=paths)
+
+    @classmethod
+    def _without_header(cls, records):
+        """
+        Checks and removes the header from the start of serialised records, if there
+        is one.
+        :param records: an iterable of serialised (key, value) pairs
+        :return: an iterator of the rest of the records
+        """
+        records = iter(records)
+        first = next(records, None)
+        if first is None:
+            return records
+        if first[0] == BaseMap.header_key:
+            cls._check_header(first[1])
+            return records
+        return itertools.chain([first], records)
+
+    @classmethod
+    def _check_header(cls, header):
+        """
+        Checks that a map file's header (if it has one) is for this type of map.
+        :param header: the header, or None
+        """
+        if header is None:
+            return
+        product_class = cls.product_class
+        map_type = header.get('type') if isinstance(header, dict) else None
+        if map_type != product_class.__name__:
+            raise TypeError(f'Expected a {product_class.__name__}, not a {map_type}.')
+
+    @classmethod
+    @abc.abstractmethod
+    def _columns(cls, content):
+        """
+        Arrays of column values from deserialised JSON, for BaseMap.from_arrays().
+        :param content: a dict of serialised key: serialised value
+        :return: a dict of column name: array
+        """
+        pass
+
     @classmethod
     @abc.abstractmethod
     def defaultpath(cls, identifier):
@@ -0,0 +1,94 @@
+import json
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+extension = '.npz'
+
+
+def is_binary(path):
+    """
+    Checks if a file is a binary map (an .npz file) by its first few bytes, so it
+    doesn't matter what it's called.
+    :param path: the path to the file
+    :return: bool
+    """
+    with open(path, 'rb') as f:
+        return f.read(4) == b'PK\x03\x04'
+
+
+def save(path, header, arrays):
+    """
+    Saves a map's arrays to an uncompressed .npz file, so that they can be
+    memory-mapped when they're loaded.
+    :param path: the path to save to
+    :param header: a dict of details about the map, e.g. its type
+    :param arrays: a dict of name: array
+    """
+    # written to a temporary file first: the arrays might be mapped from the file
+    # being replaced, and truncating a mapped file breaks the mapping
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez(f, header=np.array(json.dumps(header)), **arrays)
+    os.replace(temp_path, path)
+
+
+def load(path, mmap=True):
+    """
+    Loads the arrays saved by save(). np.load() doesn't memory-map arrays in .npz
+    files, so this finds each array's data inside the file and maps that instead.
+    Arrays are mapped copy-on-write, so changing them doesn't change the file.
+    :param path: the path to the file
+    :param mmap: False to read the arrays into memory instead
+    :return: the header, and a dict of name: array
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as z, open(path, 'rb') as f:
+        for info in z.infolist():
+            name = info.filename[:-len('.npy')]
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                arrays[name] = _map(path, f, info)
+            else:
+                with z.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+    header = json.loads(arrays.pop('header').item())
+    return header, arrays
+
+
+def header(path):
+    """
+    Reads just the header saved by save(), without any of the arrays.
+    :param path: the path to the file
+    :return: the header
+    """
+    with zipfile.ZipFile(path) as z, z.open('header.npy') as member:
+        return json.loads(np.lib.format.read_array(member).item())
+
+
+def _map(path, f, info):
+    """
+    Memory-maps one array in an uncompressed .npz file.
+    :param path: the path to the file
+    :param f: the open file
+    :param info: the ZipInfo for the array
+    :return: an array
+    """
+    # the data starts after the local file header: 30 bytes, then the file name and
+    # an extra field with lengths given at the end of those 30 bytes
+    f.seek(info.header_offset + 26)
+    name_length, extra_length = struct.unpack('<HH', f.read(4))
+    start = info.header_offset + 30 + name_length + extra_length
+    f.seek(start)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if dtype.hasobject or dtype.kind in 'SU' or np.prod(shape) == 0:
+        # strings are small and read into lists anyway, and empty arrays can't be mapped
+        f.seek(start)
+        return np.lib.format.read_array(f)
+    return np.memmap(path, dtype=dtype, mode='c', offset=f.tell(), shape=shape,
+                     order='F' if fortran_order else 'C')
@@ -0,0 +1,77 @@
+import json
+import re
+
+_scan = json.JSONDecoder().scan_once
+_start = re.compile(r'\s*{\s*')
+_space = re.compile(r'\s*')
+_colon = re.compile(r'\s*:\s*')
+# the end of a record: a comma or the end of the object
+_end = re.compile(r'\s*([,}])')
+
+
+def records(f, chunk_size=2 ** 16):
+    """
+    Yields the key, value pairs of a JSON object (i.e. the records of a serialised map)
+    one at a time from a file, reading it a chunk at a time rather than all at once.
+    :param f: a file opened in text mode
+    :param chunk_size: the number of characters to read at once
+    :return: a generator of (key, value) tuples
+    """
+    buffer = f.read(chunk_size)
+    eof = buffer == ''
+    start = _start.match(buffer)
+    while start is None or start.end() == len(buffer):
+        if eof:
+            raise json.JSONDecodeError('Expecting an object', buffer, 0)
+        chunk = f.read(chunk_size)
+        eof = chunk == ''
+        buffer += chunk
+        start = _start.match(buffer)
+    pos = start.end()
+    if buffer[pos] == '}':
+        _check_end(f, buffer[pos + 1:])
+        return
+    while True:
+        # a record is only used once the comma or brace after it has been found, so a
+        # record (or number) cut off at the end of the buffer is never used
+        try:
+            pos = _space.match(buffer, pos).end()
+            if buffer[pos] != '"':
+                raise StopIteration
+            key, end = _scan(buffer, pos)
+            colon = _colon.match(buffer, end)
+            value, end = _scan(buffer, colon.end())
+            match = _end.match(buffer, end)
+            if match is None:
+                raise StopIteration
+        except (StopIteration, AttributeError, IndexError, ValueError):
+            if eof:
+                raise json.JSONDecodeError('Invalid record', buffer, pos)
+            # reading at least as much again as is left, so a record much larger
+            # than a chunk (e.g. a component table) isn't rescanned for every chunk
+            chunk = f.read(max(chunk_size, len(buffer) - pos))
+            eof = chunk == ''
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield key, value
+        if match.group(1) == '}':
+            _check_end(f, buffer[match.end():])
+            return
+        pos = match.end()
+
+
+def _check_end(f, rest):
+    """
+    Checks that there's nothing but whitespace after the end of the object, reading
+    the rest of the file.
+    :param f: the file
+    :param rest: the text already read from after the end of the object
+    """
+    while True:
+        extra = _space.match(rest).end()
+        if extra < len(rest):
+            raise json.JSONDecodeError('Extra data', rest, extra)
+        rest = f.read(2 ** 16)
+        if rest == '':
+            return
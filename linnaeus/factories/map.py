@@ -1,21 +1,42 @@
 import cv2
 import filetype
+import io
+import itertools
 import json
 import numpy as np
 import os
 import qrcode
 import requests
+import warnings
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
 
 from linnaeus.common import tryint
-from linnaeus.config import ProgressLogger, constants
-from linnaeus.models import (Component, ComponentMap, CoordinateEntry,
-                             HsvEntry, LocationEntry, ReferenceMap, SolutionMap)
+from linnaeus.config import constants
+from linnaeus.models import Component, ComponentMap, ReferenceMap, SolutionMap
+from linnaeus.models.maps import BaseMap, PathTable
 from linnaeus.utils import portal
+from . import _binary, _json
 from ._base import BaseMapFactory
 
 
+# for removing numbers from strings with str.translate()
+_numbers = str.maketrans('', '', '0123456789+- ')
+
+
+def numbers(values):
+    """
+    Converts lists of numbers to an array, including any numbers stored as strings
+    by older versions.
+    :param values: a list of lists of numbers
+    :return: an array
+    """
+    a = np.array(values)
+    if a.dtype.kind in 'USO':
+        a = np.array([[tryint(i) for i in v] for v in values])
+    return a
+
+
 class SolutionMapFactory(BaseMapFactory):
     product_class = SolutionMap
 
@@ -67,18 +88,24 @@ class SolutionMapFactory(BaseMapFactory):
         y += offset[1]
         w = max(new_w + x, base_w) - min(x, 0)
         h = max(new_h + y, base_h) - min(y, 0)
-        with cls.product_class() as combined_map, ProgressLogger(
-                len(basemap) + len(newmap), 10) as p:
-            def add_to_map(ox, oy, itermap):
-                for r in itermap.records:
-                    rx, ry = r.key.entry
-                    rk = CoordinateEntry(rx + ox, ry + oy)
-                    combined_map[rk] = r.value
-                    p.next()
-
-            add_to_map(abs(min(x, 0)), abs(min(y, 0)), basemap)
-            add_to_map(max(x, 0), max(y, 0), newmap)
-            return combined_map
+        offsets = [(abs(min(x, 0)), abs(min(y, 0))), (max(x, 0), max(y, 0))]
+        arrays = {}
+        for name in cls.product_class.columns:
+            arrays[name] = np.concatenate([m.column(name) for m in (basemap, newmap)])
+        arrays['xy'] = arrays['xy'].astype(np.int64) + np.repeat(
+            offsets, [len(basemap), len(newmap)], axis=0)
+        paths = None
+        if 'path' in arrays:
+            paths = PathTable()
+            arrays['path'] = paths.ids(basemap.paths + newmap.paths)
+        # where the maps overlap, the new map's records replace the base map's
+        packed = arrays['xy'][:, 0] * (h + 1) + arrays['xy'][:, 1]
+        _, first = np.unique(packed, return_index=True)
+        _, last = np.unique(packed[::-1], return_index=True)
+        last = len(packed) - 1 - last
+        order = np.argsort(first)
+        arrays = {name: a[last[order]] for name, a in arrays.items()}
+        return cls.product_class.from_arrays(arrays, paths=paths)
 
     @classmethod
     def defaultpath(cls, identifier):
@@ -89,23 +116,114 @@ class SolutionMapFactory(BaseMapFactory):
     @classmethod
     def deserialise(cls, txt):
         content = json.loads(txt)
-        with cls.product_class() as new_map, ProgressLogger(len(content), 10) as p:
-            for k, v in content.items():
-                rk = cls._deserialisekey(k)
-                rv = cls._deserialisevalue(v)
-                new_map.add(rk, rv)
-                p.next()
-            return new_map
+        cls._check_header(content.pop(SolutionMap.header_key, None))
+        components = content.pop(SolutionMap.components_key, None)
+        if components is None:
+            return cls.product_class.from_arrays(cls._columns(content))
+        paths, components = cls._components(components)
+        return cls.product_class.from_arrays(cls._encoded_columns(content, components),
+                                             paths=paths)
+
+    @classmethod
+    def _from_records(cls, records, chunk_size=2 ** 16):
+        records = cls._without_header(records)
+        first = next(records, None)
+        if first is None or first[0] != SolutionMap.components_key:
+            records = itertools.chain([first] if first is not None else [], records)
+            return super(SolutionMapFactory, cls)._from_records(records, chunk_size)
+        paths, components = cls._components(first[1])
+        return super(SolutionMapFactory, cls)._from_records(
+            records, chunk_size,
+            columns=lambda content: cls._encoded_columns(content, components),
+            paths=paths)
+
+    @classmethod
+    def _components(cls, table):
+        """
+        Reads the component table from a serialised map (see SolutionMap.serialise()).
+        Each path is added to a PathTable once, so every record using it shares the
+        same LocationEntry.
+        :param table: the deserialised component table
+        :return: the PathTable, and a dict of path, src and has_src arrays for each
+                 component
+        """
+        try:
+            prefix, suffix = table.get('prefix', ''), table.get('suffix', '')
+            paths = PathTable()
+            ids = paths.ids(prefix + p + suffix for p in table['path'])
+            src = table['src']
+            if len(src) != len(ids):
+                raise ValueError
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError('Invalid component table.')
+        return paths, {
+            'path': ids,
+            'src': numbers([i if i is not None else (0, 0, 0) for i in src]).reshape(
+                -1, 3),
+            'has_src': np.array([i is not None for i in src], dtype=bool)
+            }
 
     @classmethod
-    def _deserialisekey(cls, k):
-        return cls.product_class.key_type(*[tryint(i) for i in k.split('|')])
+    def _encoded_columns(cls, content, components):
+        """
+        Arrays of column values from records that refer to a component table, i.e.
+        with values of [component index, h, s, v].
+        :param content: a dict of serialised key: serialised value
+        :param components: the component arrays from _components()
+        :return: a dict of column name: array
+        """
+        values = np.array(list(content.values()))
+        if len(values) == 0:
+            values = np.zeros((0, 4), dtype=np.int64)
+        if values.shape[1:] != (4,) or not np.issubdtype(values.dtype, np.integer):
+            raise ValueError('Invalid values.')
+        ix = values[:, 0]
+        if len(ix) > 0 and (ix.min() < 0 or ix.max() >= len(components['path'])):
+            raise ValueError('Invalid component index.')
+        return {
+            'xy': cls._deserialisekeys(content),
+            'path': components['path'][ix],
+            'target': values[:, 1:],
+            'src': components['src'][ix],
+            'has_src': components['has_src'][ix]
+            }
 
     @classmethod
-    def _deserialisevalue(cls, v):
-        return cls.product_class.value_type(**{
-            ek: cls.product_class.combined_types[ek](*ev) if isinstance(ev, list) else
-            cls.product_class.combined_types[ek](ev) for ek, ev in v.items()})
+    def _columns(cls, content):
+        values = list(content.values())
+        src = [v.get('src') for v in values]
+        return {
+            'xy': cls._deserialisekeys(content),
+            'path': [v['path'] for v in values],
+            'target': numbers([v['target'] for v in values]),
+            'src': numbers([i if i is not None else (0, 0, 0) for i in src]),
+            'has_src': [i is not None for i in src]
+            }
+
+    @classmethod
+    def _deserialisekeys(cls, keys):
+        """
+        Converts serialised coordinate keys to an array of x, y values.
+        :param keys: an iterable of 'x|y' strings
+        :return: an (n, 2) array
+        """
+        keys = list(keys)
+        if len(keys) == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+        # parsing all the keys as one string is much quicker than splitting each one
+        joined = ','.join(keys)
+        if joined.translate(_numbers) != '|,' * (len(keys) - 1) + '|':
+            raise KeyError('Invalid coordinates.')
+        try:
+            with warnings.catch_warnings():
+                # numpy warns (and stops) rather than raising if it can't parse a value
+                warnings.simplefilter('error', DeprecationWarning)
+                xy = np.fromstring(joined.replace('|', ','), dtype=np.int64, sep=',')
+        except (DeprecationWarning, ValueError):
+            raise KeyError('Invalid coordinates.')
+        if len(xy) != 2 * len(keys):
+            raise KeyError('Invalid coordinates.')
+        return xy.reshape(-1, 2)
 
 
 class ReferenceMapFactory(SolutionMapFactory):
@@ -117,8 +235,11 @@ class ReferenceMapFactory(SolutionMapFactory):
                             f'{identifier}_ref_{str(constants.size)}.json')
 
     @classmethod
-    def _deserialisevalue(cls, v):
-        return cls.product_class.value_type(*[tryint(i) for i in v])
+    def _columns(cls, content):
+        return {
+            'xy': cls._deserialisekeys(content),
+            'hsv': numbers(list(content.values()))
+            }
 
     @classmethod
     def get_hsv_pixels(cls, pixels):
@@ -129,15 +250,12 @@ class ReferenceMapFactory(SolutionMapFactory):
         :return: a numpy array of [row, col, h, s, v] entries
         """
         assert pixels.shape[-1] == 4
-        rn = pixels.shape[0]
-        cn = pixels.shape[1]
-        rows = np.repeat(np.arange(rn), cn).reshape(rn, cn, 1)
-        cols = np.tile(np.arange(cn), rn).reshape(rn, cn, 1)
-        hsv_pixels = cv2.cvtColor(pixels, cv2.COLOR_RGB2HSV_FULL)
-        hsv_pixels = np.c_[rows, cols, hsv_pixels]
-        transparent_mask = pixels[..., 3] > 0
-        hsv_pixels = hsv_pixels[transparent_mask]
-        return hsv_pixels
+        # transparent pixels are left out
+        mask = pixels[..., 3] > 0
+        rows, cols = np.nonzero(mask)
+        hsv_pixels = cv2.cvtColor(np.ascontiguousarray(pixels[..., :3]),
+                                  cv2.COLOR_RGB2HSV_FULL)[mask]
+        return np.c_[rows, cols, hsv_pixels]
 
     @classmethod
     def _build(cls, img, resize=True):
@@ -151,16 +269,11 @@ class ReferenceMapFactory(SolutionMapFactory):
             w, h = img.size
             img = img.resize(constants.size.dimensions(w, h))
         img = img.convert(mode='RGBA')
-        pixels = np.array(img)
-        hsv_pixels = cls.get_hsv_pixels(pixels)
-        with ReferenceMap() as new_map:
-            with ProgressLogger(len(hsv_pixels), 10) as p:
-                for pixel in hsv_pixels:
-                    rk = CoordinateEntry(pixel[1].item(), pixel[0].item())
-                    rv = HsvEntry(*[i.item() for i in pixel[2:]])
-                    new_map.add(rk, rv)
-                    p.next()
-            return new_map
+        hsv_pixels = cls.get_hsv_pixels(np.array(img))
+        return ReferenceMap.from_arrays({
+            'xy': hsv_pixels[:, [1, 0]],
+            'hsv': hsv_pixels[:, 2:]
+            })
 
     @classmethod
     def from_image_local(cls, filepath, resize=True):
@@ -266,14 +379,14 @@ class ComponentMapFactory(BaseMapFactory):
                 if filename in files:
                     addtl_prefix = d
                     break
-        with basemap, ProgressLogger(len(newmap), 10) as p:
-            for r in newmap.records:
-                try:
-                    rk = LocationEntry(os.path.join(addtl_prefix, r.key.path))
-                    basemap.add(rk, r.value)
-                except KeyError:
-                    pass
-                p.next()
+        paths = [os.path.join(addtl_prefix, p) for p in newmap._serialised_keys()]
+        # components that are already in the base map are skipped
+        new = np.array([p not in basemap._index for p in paths], dtype=bool)
+        with basemap:
+            basemap.extend({
+                'path': [p for p, n in zip(paths, new) if n],
+                'hsv': newmap._store['hsv'][new]
+                })
         return basemap
 
     @classmethod
@@ -285,13 +398,15 @@ class ComponentMapFactory(BaseMapFactory):
     @classmethod
     def deserialise(cls, txt):
         content = json.loads(txt)
-        with ComponentMap() as new_map, ProgressLogger(len(content), 10) as p:
-            for k, v in content.items():
-                rk = LocationEntry(k)
-                rv = HsvEntry(*[tryint(i) for i in v])
-                new_map.add(rk, rv)
-                p.next()
-            return new_map
+        cls._check_header(content.pop(ComponentMap.header_key, None))
+        return ComponentMap.from_arrays(cls._columns(content))
+
+    @classmethod
+    def _columns(cls, content):
+        return {
+            'path': list(content.keys()),
+            'hsv': numbers(list(content.values()))
+            }
 
     @classmethod
     def _build(cls, components):
@@ -300,13 +415,10 @@ class ComponentMapFactory(BaseMapFactory):
         :param components: list of Component objects
         :return: ComponentMap
         """
-        with ComponentMap() as new_map, ProgressLogger(len(components), 10) as p:
-            for c in components:
-                rk = LocationEntry(c.location)
-                rv = HsvEntry(*c.dominant)
-                new_map.add(rk, rv)
-                p.next()
-            return new_map
+        return ComponentMap.from_arrays({
+            'path': [c.location for c in components],
+            'hsv': numbers([c.dominant for c in components])
+            })
 
     @classmethod
     def from_local(cls, files=None, folders=None):
@@ -402,19 +514,89 @@ class MapFactory(BaseMapFactory):
         """
         return cls.identify(txt).deserialise(txt)
 
+    @classmethod
+    def deserialise_arrays(cls, header, arrays):
+        """
+        Makes a Map of the type given in a binary map file's header.
+        :param header: the file's header
+        :param arrays: a dict of name: array, as from BaseMap.to_arrays()
+        :return: Map
+        """
+        return cls._factory(header).deserialise_arrays(header, arrays)
+
+    @classmethod
+    def read(cls, f):
+        """
+        Deserialises JSON from a file a chunk at a time and returns a Map object.
+        Guesses the type of Map to return from the first record.
+        :param f: a file opened in text mode
+        :return: Map
+        """
+        records = _json.records(f)
+        first = next(records, None)
+        if first is None:
+            raise ValueError('The map is empty, so its type is unknown.')
+        return cls._identify_record(*first)._from_records(
+            itertools.chain([first], records))
+
     @classmethod
     def identify(cls, txt):
         """
         Guesses the type of Map represented by the input JSON-formatted text
-        string. Returns the relevant MapFactory.
+        string. Returns the relevant MapFactory. Only the first record (the header,
+        for maps saved by this version) is parsed.
         :param txt: JSON-formatted text string
         :return: MapFactory subtype
         """
-        content = json.loads(txt)
-        first_key = list(content.items())[0]
-        if '|' in first_key[0] and len(first_key[0].split('|')) == 2:
+        first = next(_json.records(io.StringIO(txt)), None)
+        if first is None:
+            raise ValueError('The map is empty, so its type is unknown.')
+        return cls._identify_record(*first)
+
+    @classmethod
+    def identify_file(cls, filepath):
+        """
+        Finds the type of Map saved in a file from its header (or its first record,
+        for JSON maps saved by older versions) without loading the rest of the file.
+        :param filepath: the path to the file
+        :return: MapFactory subtype
+        """
+        if _binary.is_binary(filepath):
+            return cls._factory(_binary.header(filepath))
+        with open(filepath, 'r') as f:
+            first = next(_json.records(f), None)
+        if first is None:
+            raise ValueError('The map is empty, so its type is unknown.')
+        return cls._identify_record(*first)
+
+    @classmethod
+    def _factory(cls, header):
+        """
+        The MapFactory for the type of Map given in a header.
+        :param header: a map file's header
+        :return: MapFactory subtype
+        """
+        factories = {k.__name__: v for k, v in cls.factories.items()}
+        map_type = header.get('type') if isinstance(header, dict) else None
+        if map_type not in factories:
+            raise TypeError(f'Unknown map type: {map_type}.')
+        return factories[map_type]
+
+    @classmethod
+    def _identify_record(cls, key, value):
+        """
+        Guesses the type of Map a serialised record is from.
+        :param key: the serialised key
+        :param value: the serialised value
+        :return: MapFactory subtype
+        """
+        if key == BaseMap.header_key:
+            return cls._factory(value)
+        elif key == SolutionMap.components_key:
+            return cls.solution()
+        elif '|' in key and len(key.split('|')) == 2:
             # either ref or solution
-            if isinstance(first_key[1], dict):
+            if isinstance(value, dict):
                 return cls.solution()
             else:
                 return cls.reference()
@@ -443,6 +625,18 @@ class MapFactory(BaseMapFactory):
         with open(filepath, 'r') as f:
             return f.read()
 
+    @classmethod
+    def save(cls, filepath, saved_map):
+        """
+        Saves a map to a file: binary if the file name ends in .npz, otherwise JSON.
+        :param filepath: the path to the file
+        :param saved_map: the Map to save
+        """
+        if filepath.endswith(_binary.extension):
+            _binary.save(filepath, saved_map.header(), saved_map.to_arrays())
+        else:
+            cls.save_text(filepath, saved_map.serialise())
+
     @classmethod
     def save_text(cls, filepath, txt):
         """
@@ -1,5 +1,3 @@
-import math
-
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
@@ -8,7 +6,7 @@ from linnaeus.config import ProgressLogger
 
 
 def cleaner(path, records, commit=False, block_size=30):
-    m = MapFactory.component().deserialise(MapFactory.load_text(path))
+    m = MapFactory.component().load(path)
     print(f'{len(records)}/{len(m)} matching items.')
     while not commit:
         n_start = len(records)
@@ -52,29 +50,24 @@ def cleaner(path, records, commit=False, block_size=30):
         commit = n_start == n_end
     if commit:
         print('deleting from map.')
-        MapFactory.save_text(path + '.dirty', m.serialise())
-        c = 0
+        MapFactory.save(path + '.dirty', m)
+        for c, r in enumerate(records):
+            print(f'{c}: {r}')
         with m:
-            for r in records:
-                m.remove(r)
-                print(f'{c}: {r}')
-                c += 1
-        MapFactory.save_text(path, m.serialise())
+            m.remove_many(records)
+        MapFactory.save(path, m)
 
 
 def clean_colour(path, commit=False, block_size=30, h=None, s=None, v=None, ht=5, st=5,
                  vt=5):
-    m = MapFactory.component().deserialise(MapFactory.load_text(path))
-    matches = []
-    for r in m.records:
-        h_pass = (h is not None and math.isclose(r.value.h, h,
-                                                 abs_tol=ht)) or h is None
-        s_pass = (s is not None and math.isclose(r.value.s, s,
-                                                 abs_tol=st)) or s is None
-        v_pass = (v is not None and math.isclose(r.value.v, v,
-                                                 abs_tol=vt)) or v is None
-        if h_pass and s_pass and v_pass:
-            matches.append(r)
+    m = MapFactory.component().load(path)
+    colours = m.column('hsv').astype(int)
+    matched = np.ones(len(m), dtype=bool)
+    for i, (target, tolerance) in enumerate([(h, ht), (s, st), (v, vt)]):
+        if target is not None:
+            matched &= np.abs(colours[:, i] - target) <= tolerance
+    records = m.records
+    matches = [records[i] for i in np.flatnonzero(matched)]
     if len(matches) > 0:
         cleaner(path, matches, commit, block_size)
     else:
@@ -82,11 +75,10 @@ def clean_colour(path, commit=False, block_size=30, h=None, s=None, v=None, ht=5
 
 
 def clean_similar_to(solution_path, component_path, row, col, commit=True):
-    solution = MapFactory.solution().deserialise(MapFactory.load_text(solution_path))
-    components = MapFactory.component().deserialise(MapFactory.load_text(component_path))
-    pixel = next(i for i in solution.records if i.key.x == col and i.key.y == row)
-    comp = next(
-        i for i in components.records if i.key.path == pixel.value.entry['path'])
+    solution = MapFactory.solution().load(solution_path)
+    components = MapFactory.component().load(component_path)
+    pixel = solution[[col, row]]
+    comp = components[pixel.value.entries['path']]
     print(f'hsv: {comp.value.h}, {comp.value.s}, {comp.value.v}')
     clean_colour(component_path, commit, h=comp.value.h, s=comp.value.s, v=comp.value.v)
 
@@ -97,7 +89,7 @@ def angle_cos(p0, p1, p2):
 
 
 def clean_squares(path, commit=False, block_size=80):
-    m = MapFactory.component().deserialise(MapFactory.load_text(path))
+    m = MapFactory.component().load(path)
     matches = []
     max_batch = block_size * 3
     with ProgressLogger(max_batch, 20) as p, open('/home/ginger/logs/sq.log', 'w') as f:
@@ -132,7 +124,7 @@ def clean_squares(path, commit=False, block_size=80):
 
 
 def clean_by_histogram(path, input_img_path, commit=False, block_size=320):
-    m = MapFactory.component().deserialise(MapFactory.load_text(path))
+    m = MapFactory.component().load(path)
     matches = []
     input_img = cv2.imread(input_img_path)
     input_hist = cv2.calcHist([input_img], [0, 1, 2], None, [8, 8, 8], [0, 256, 0, 256, 0, 256])
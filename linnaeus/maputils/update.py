@@ -1,19 +1,22 @@
-from linnaeus.config import ProgressLogger
-from linnaeus.models import CombinedEntry, SolutionMap
+import numpy as np
+
+from linnaeus.models import SolutionMap
 from linnaeus import MapFactory
 
 
 def add_src(solution_map, component_map, save_as):
-    with SolutionMap() as new_solution, ProgressLogger(len(solution_map), 10) as p:
-        for record in solution_map.records:
-            if 'src' in record.value.entries:
-                new_solution.add(record.key, record.value)
-                p.next()
-                continue
-            component = component_map[record.value.entries['path']]
-            new_solution.add(record.key, CombinedEntry(path=component.key,
-                                                       target=record.value.entries[
-                                                           'target'],
-                                                       src=component.value))
-            p.next()
-    MapFactory.save_text(save_as, new_solution.serialise())
+    paths = solution_map.paths
+    src = solution_map.column('src')
+    has_src = solution_map.column('has_src')
+    comp_rows = {p: i for i, p in enumerate(component_map.paths)}
+    comp_colours = component_map.column('hsv')
+    missing = np.flatnonzero(~has_src)
+    src[missing] = comp_colours[[comp_rows[paths[i]] for i in missing]]
+    new_solution = SolutionMap._from_columns({
+        'xy': solution_map.column('xy'),
+        'path': solution_map.column('path'),
+        'target': solution_map.column('target'),
+        'src': src,
+        'has_src': np.ones(len(solution_map), dtype=bool)
+        }, paths=solution_map._paths)
+    MapFactory.save(save_as, new_solution)
@@ -1,14 +1,18 @@
 import os
 import re
+import weakref
 from io import BytesIO
 
 import requests
 from PIL import Image
 import numpy as np
-from cached_property import cached_property
 
 
 class BaseEntry(object):
+    # entries are compared and hashed by _key, which subclasses set to a tuple (or
+    # another hashable, orderable value) when they're made
+    __slots__ = ('_key',)
+
     def __init__(self, key):
         self._key = key
 
@@ -23,18 +27,20 @@ class BaseEntry(object):
         return True
 
     def __ge__(self, other):
-        return str(self) >= str(other)
+        return self._key >= other._key
 
     def __le__(self, other):
-        return str(self) <= str(other)
+        return self._key <= other._key
 
     def __gt__(self, other):
-        return str(self) > str(other)
+        return self._key > other._key
 
     def __lt__(self, other):
-        return str(self) < str(other)
+        return self._key < other._key
 
     def __eq__(self, other):
+        if isinstance(other, BaseEntry):
+            return self._key == other._key
         return str(self) == str(other)
 
     def __hash__(self):
@@ -42,8 +48,10 @@ class BaseEntry(object):
 
 
 class CoordinateEntry(BaseEntry):
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
-        super(CoordinateEntry, self).__init__(x * y)
+        super(CoordinateEntry, self).__init__((x, y))
         self.x = x
         self.y = y
 
@@ -55,11 +63,12 @@ class CoordinateEntry(BaseEntry):
         return f'{self.x}|{self.y}'
 
     def validate(self):
-        return isinstance(self.x, int) and isinstance(self.y, int) and self._key == (
-                self.x * self.y)
+        return isinstance(self.x, int) and isinstance(self.y, int)
 
 
 class LocationEntry(BaseEntry):
+    __slots__ = ('path', '_type')
+
     def __init__(self, path, path_type=None):
         super(LocationEntry, self).__init__(path)
         self.path = path
@@ -79,12 +88,12 @@ class LocationEntry(BaseEntry):
             except requests.ReadTimeout:
                 raise AttributeError(f'Unable to retrieve content: {self.path}')
         elif self._type == 'local':
-            if prefix is not None:
-                self.path = os.path.join(prefix, self.path)
-            if os.path.exists(self.path):
-                return Image.open(self.path)
+            # entries are shared between records, so don't change self.path
+            path = os.path.join(prefix, self.path) if prefix is not None else self.path
+            if os.path.exists(path):
+                return Image.open(path)
             else:
-                raise AttributeError(f'File does not exist: {self.path}')
+                raise AttributeError(f'File does not exist: {path}')
         else:
             raise AttributeError(f'No type found: {self.path}')
 
@@ -93,62 +102,99 @@ class LocationEntry(BaseEntry):
 
 
 class HsvEntry(BaseEntry):
+    """
+    A colour. There's only ever one HsvEntry for each colour, shared by everything
+    that uses it, so they shouldn't be changed.
+    """
+    __slots__ = ('h', 's', 'v', '__weakref__')
+    _instances = weakref.WeakValueDictionary()
+
+    def __new__(cls, hue, saturation, value):
+        # converted first so that e.g. numpy integers (which can overflow when added)
+        # and whole floats share the same entry as the equivalent ints
+        hue, saturation, value = hsv = tuple(cls._channel(i) for i in
+                                             (hue, saturation, value))
+        entry = cls._instances.get(hsv)
+        if entry is None:
+            entry = super(HsvEntry, cls).__new__(cls)
+            entry.h = hue
+            entry.s = saturation
+            entry.v = value
+            # ordered by the total of the components (roughly, brightness) first
+            total = hue + saturation + value if None not in hsv else -1
+            entry._key = (total, hue, saturation, value)
+            cls._instances[hsv] = entry
+        return entry
+
     def __init__(self, hue, saturation, value):
-        super(HsvEntry, self).__init__((hue, saturation, value))
-        self.h = hue
-        self.s = saturation
-        self.v = value
-        self.array = np.array(self.entry)
+        # everything is set up in __new__
+        pass
+
+    @staticmethod
+    def _channel(value):
+        """
+        Converts one component of a colour to an int.
+        :param value: a number (or None)
+        :return: int, or None
+        """
+        if value is None:
+            return None
+        try:
+            converted = int(value)
+        except (OverflowError, TypeError, ValueError):
+            raise ValueError(f'Invalid colour value: {value}')
+        if converted != value:
+            raise ValueError(f'Invalid colour value: {value}')
+        return converted
+
+    def __reduce__(self):
+        return HsvEntry, self.entry
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     @property
     def entry(self):
         return self.h, self.s, self.v
 
+    @property
+    def array(self):
+        return np.array(self.entry)
+
     def validate(self):
         return 0 <= self.h <= 255 and 0 <= self.s <= 255 and 0 <= self.v <= 255
 
-    def _diff(self, other):
-        h = (self.h - other.h) if other.h is not None else 0
-        s = (self.s - other.s) if other.s is not None else 0
-        v = (self.v - other.v) if other.v is not None else 0
-        if h == s:
-            s *= 0.99
-        if h == v:
-            v *= 0.99
-        if s == v:
-            v *= 0.99
-        return h + s + v
-
-    def __ge__(self, other):
-        return self._diff(other) >= 0
-
-    def __le__(self, other):
-        return self._diff(other) <= 0
-
-    def __gt__(self, other):
-        return self._diff(other) > 0
-
-    def __lt__(self, other):
-        return self._diff(other) < 0
-
     def __eq__(self, other):
-        return (self.h == other.h) and (self.s == other.s) and (self.v == other.v)
+        return self is other or (isinstance(other, HsvEntry) and self._key == other._key)
 
     def __hash__(self):
-        return (self.h, self.s, self.v).__hash__()
+        return self._key.__hash__()
 
     def __str__(self):
         return f'{self.h},{self.s},{self.v}'
 
     def __sub__(self, other):
-        return abs(self.array - other.array).sum()
+        return abs(self.h - other.h) + abs(self.s - other.s) + abs(self.v - other.v)
 
 
 class CombinedEntry(BaseEntry):
+    __slots__ = ('entries',)
+
     def __init__(self, **entries):
-        super(CombinedEntry, self).__init__({k: e.entry for k, e in entries.items()})
+        super(CombinedEntry, self).__init__(
+            tuple((k, e._key) for k, e in entries.items()))
         self.entries = entries
 
+    @property
+    def entry(self):
+        return {k: e.entry for k, e in self.entries.items()}
+
+    def __str__(self):
+        return str(self.entry)
+
     def validate(self):
         if all([issubclass(type(e), BaseEntry) for k, e in self.entries.items()]):
             return all([e.validate() for k, e in self.entries.items()])
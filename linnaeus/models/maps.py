@@ -1,14 +1,66 @@
 import abc
+import hashlib
 import json
 import numpy as np
+import os
+from scipy.spatial import cKDTree
 
+from linnaeus.config import constants
 from .entries import BaseEntry, CombinedEntry, CoordinateEntry, HsvEntry, LocationEntry
 
 
+def hsv_keys(hsv):
+    """
+    Sort keys for an array of HSV values, in the same order as sorting HsvEntries:
+    by the total of the components, then by H, S and V.
+    :param hsv: an (n, 3) array
+    :return: list of arrays, most significant first
+    """
+    hsv = hsv.astype(np.int64)
+    return [hsv.sum(axis=1), hsv[:, 0], hsv[:, 1], hsv[:, 2]]
+
+
 class MapRecord(object):
-    def __init__(self, key, value):
-        self.key = key
-        self.value = value
+    """
+    A key and value pair. The records returned by a map are views over its arrays:
+    the key and value entries are only made when they're first accessed.
+    """
+    __slots__ = ('_key', '_value', '_map', '_store', '_row')
+
+    def __init__(self, key=None, value=None):
+        self._key = key
+        self._value = value
+        self._map = None
+        self._store = None
+        self._row = None
+
+    @classmethod
+    def view(cls, source, store, row):
+        """
+        A record for a row of a map's columns.
+        :param source: the map
+        :param store: the map's Columns (which are replaced, not changed, when rows
+                      are removed, so the view stays valid)
+        :param row: the index of the row in the columns
+        :return: MapRecord
+        """
+        record = cls()
+        record._map = source
+        record._store = store
+        record._row = row
+        return record
+
+    @property
+    def key(self):
+        if self._key is None:
+            self._key = self._map._key_at(self._store, self._row)
+        return self._key
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = self._map._value_at(self._store, self._row)
+        return self._value
 
     def __ge__(self, other):
         return self.value >= other.value
@@ -35,27 +87,166 @@ class MapRecord(object):
         return f'{str(self.key)}: {str(self.value)}'
 
 
+class Columns(object):
+    def __init__(self, spec, n=0, arrays=None):
+        """
+        Fixed-width NumPy columns with spare capacity for appending rows. Removing
+        rows makes a new Columns (see take()) rather than changing this one.
+        :param spec: a dict of column name: (dtype, shape of each row)
+        :param n: the number of rows in use
+        :param arrays: a dict of column name: array with at least n rows
+        """
+        self.spec = spec
+        self.n = n
+        self.arrays = arrays if arrays is not None else {
+            name: np.empty((0,) + shape, dtype) for name, (dtype, shape) in
+            spec.items()}
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.n]
+
+    def __len__(self):
+        return self.n
+
+    def append(self, values):
+        """
+        Adds a row, doubling the capacity of the columns if they're full.
+        :param values: a dict of column name: row value
+        """
+        capacity = len(next(iter(self.arrays.values())))
+        if self.n == capacity:
+            for name, (dtype, shape) in self.spec.items():
+                grown = np.zeros((max(16, capacity * 2),) + shape, dtype)
+                grown[:self.n] = self.arrays[name][:self.n]
+                self.arrays[name] = grown
+        self.set(self.n, values)
+        self.n += 1
+
+    def set(self, row, values):
+        for name, value in values.items():
+            self.arrays[name][row] = value
+
+    def take(self, rows):
+        """
+        A copy of some of the rows.
+        :param rows: an array of row indices or a boolean mask
+        :return: Columns
+        """
+        arrays = {name: a[:self.n][rows] for name, a in self.arrays.items()}
+        return Columns(self.spec, len(next(iter(arrays.values()))), arrays)
+
+    @classmethod
+    def from_arrays(cls, spec, arrays):
+        """
+        Makes columns from whole arrays, converting them to the column types.
+        :param spec: a dict of column name: (dtype, shape of each row)
+        :param arrays: a dict of column name: array, all the same length
+        :return: Columns
+        """
+        n = len(next(iter(arrays.values())))
+        return cls(spec, n, {
+            name: np.ascontiguousarray(arrays[name], dtype=dtype).reshape((n,) + shape)
+            for name, (dtype, shape) in spec.items()})
+
+
+class PathTable(object):
+    """
+    Each distinct component path, stored once so that maps can refer to them by
+    index. Only ever added to, so indices stay valid and tables can be shared between
+    maps.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self._ids = {}
+        self._entries = []
+        self._ranks = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def id(self, location):
+        """
+        The index of a path, adding it if it isn't already in the table.
+        :param location: a LocationEntry
+        :return: int
+        """
+        ix = self._ids.get(location.path)
+        if ix is None:
+            ix = len(self.paths)
+            self._ids[location.path] = ix
+            self.paths.append(location.path)
+            self._entries.append(location)
+        return ix
+
+    def ids(self, paths):
+        """
+        The indices of several paths, adding any that aren't already in the table.
+        :param paths: an iterable of path strings
+        :return: an array of ints
+        """
+        ids = []
+        for path in paths:
+            ix = self._ids.get(path)
+            if ix is None:
+                ix = len(self.paths)
+                self._ids[path] = ix
+                self.paths.append(path)
+                self._entries.append(None)
+            ids.append(ix)
+        return np.array(ids, dtype=np.int32)
+
+    def ranks(self):
+        """
+        The position of each path when they're sorted, for sorting by path without
+        comparing strings. Cached until a path is added.
+        :return: an array of ints
+        """
+        if self._ranks is None or len(self._ranks) != len(self.paths):
+            order = sorted(range(len(self.paths)), key=self.paths.__getitem__)
+            self._ranks = np.empty(len(order), dtype=np.int64)
+            self._ranks[order] = np.arange(len(order))
+        return self._ranks
+
+    def entry(self, ix):
+        """
+        The LocationEntry for a path, shared by every record that uses it.
+        :param ix: the index of the path
+        :return: LocationEntry
+        """
+        location = self._entries[ix]
+        if location is None:
+            location = LocationEntry(self.paths[ix])
+            self._entries[ix] = location
+        return location
+
+
 class BaseMap(abc.ABC):
     key_type = BaseEntry
     value_type = HsvEntry
+    # column name: (dtype, shape of each row)
+    columns = {}
+    # the column(s) that hold the keys; the rest hold the values
+    key_columns = ()
+    # the key of the header in a serialised map
+    header_key = '__header__'
 
     def __init__(self):
-        self._records = []
-        self._keys = set()
-        self._cache = True
+        self._store = Columns(self.columns)
+        # index key: row, for finding records by key without searching
+        self._row_index = {}
         self._lock = True
         self._sortedrecords = None
+        self._order = None
 
     def __len__(self):
-        return len(self._records)
+        return len(self._store)
 
     def __enter__(self):
-        self._cache = False
         self._lock = False
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._cache = True
         self._lock = True
 
     def __getitem__(self, item):
@@ -83,10 +274,10 @@ class BaseMap(abc.ABC):
                         f'type.')
         else:
             k = item
-        try:
-            return next(r for r in self._records if r.key == k)
-        except StopIteration:
+        row = self._row_of(k)
+        if row is None:
             raise KeyError(f'Key {str(k)} does not exist in this map.')
+        return MapRecord.view(self, self._store, row)
 
     def __setitem__(self, key, value):
         if self._lock:
@@ -94,24 +285,113 @@ class BaseMap(abc.ABC):
         try:
             self.add(key, value)
         except KeyError:
-            # for some reason self._records.index does not work, so this is a workaround
-            ix = next(i for i, r in enumerate(self._records) if r.key == key)
-            self._records[ix] = MapRecord(key, value)
+            row = self._row_of(key)
+            if row is None:
+                raise
+            self._store.set(row, self._encode(key, value))
+            self._changed()
 
     @property
     def records(self):
-        # cached to avoid repeating expensive sorts
+        """
+        Every record, sorted by value. Cached until the map changes.
+        :return: list of MapRecords
+        """
         if self._sortedrecords is None:
-            sorted_records = sorted(self._records)
-            if self._cache:
-                self._sortedrecords = sorted_records
-            else:
-                return sorted_records
+            store = self._store
+            self._sortedrecords = [MapRecord.view(self, store, i) for i in
+                                   self.order.tolist()]
         return self._sortedrecords
 
+    @property
+    def order(self):
+        """
+        The row of each record in the map's columns, in the same order as records.
+        Sorted with np.lexsort over the map's sort keys rather than by comparing
+        records, and cached until the map changes.
+        :return: an array of row indices
+        """
+        if self._order is None:
+            keys = self._sort_keys()
+            # lexsort sorts by the last key first
+            self._order = np.lexsort(keys[::-1]) if len(self) > 0 else np.zeros(
+                0, dtype=np.int64)
+        return self._order
+
+    def iter_records(self):
+        """
+        Every record in the order they're stored, for when the order doesn't matter;
+        this skips sorting the records.
+        :return: a generator of MapRecords
+        """
+        store = self._store
+        for i in range(len(store)):
+            yield MapRecord.view(self, store, i)
+
+    def column(self, name):
+        """
+        The values of one of the map's columns for every record, without making any
+        records.
+        :param name: the column name, e.g. 'hsv'
+        :return: an array in the same order as records
+        """
+        return self._store[name][self.order]
+
     def serialise(self):
-        record_dump = {str(r.key): r.value.entry for r in self._records}
-        return json.dumps(record_dump)
+        content = {self.header_key: self.header()}
+        content.update(zip(self._serialised_keys(), self._serialised_values()))
+        return json.dumps(content)
+
+    def header(self):
+        """
+        Details about the map, saved at the start of a map file so that they can be
+        read without loading the rest of it.
+        :return: a dict of the map type, number of records, the pixel size and
+                 fingerprint of the config it was saved with, and a hash of its contents
+        """
+        return {
+            'type': type(self).__name__,
+            'records': len(self),
+            'pixel_size': constants.pixel_size,
+            'config': constants.fingerprint,
+            'hash': self.content_hash()
+            }
+
+    def content_hash(self):
+        """
+        A hash of the map's records in the order they're stored, for checking that a
+        map file hasn't changed. Paths are hashed as strings, so it doesn't matter how
+        they're numbered.
+        :return: str
+        """
+        arrays = self.to_arrays()
+        if 'paths' in arrays:
+            # renumber the paths in sorted order rather than the order they were added
+            order = np.argsort(arrays['paths'])
+            ranks = np.empty(len(order), dtype=np.int64)
+            ranks[order] = np.arange(len(order))
+            arrays['path'] = ranks[arrays['path']]
+            arrays['paths'] = arrays['paths'][order]
+        content_hash = hashlib.sha1()
+        for name in sorted(arrays):
+            content_hash.update(name.encode())
+            content_hash.update(np.ascontiguousarray(arrays[name]).tobytes())
+        return content_hash.hexdigest()
+
+    def to_arrays(self):
+        """
+        The map's columns, in the order they're stored, for saving in a binary format.
+        A 'path' column is renumbered to index into a 'paths' array of just the paths
+        it uses (as UTF-8 bytes).
+        :return: a dict of name: array
+        """
+        arrays = {name: self._store[name] for name in self.columns}
+        if 'path' in arrays:
+            used, ids = np.unique(arrays['path'], return_inverse=True)
+            arrays['path'] = ids.astype(self.columns['path'][0])
+            arrays['paths'] = np.array(
+                [self._paths.paths[i].encode() for i in used.tolist()], dtype=bytes)
+        return arrays
 
     @abc.abstractmethod
     def validate(self, record):
@@ -126,15 +406,238 @@ class BaseMap(abc.ABC):
             raise IOError('Locked.')
         record = MapRecord(key, value)
         if self.validate(record):
-            self._records.append(record)
-            self._keys.add(str(record.key))
+            row = self._encode(key, value)
+            self._check_row(row)
+            self._store.append(row)
+            self._index[self._index_key(key)] = len(self) - 1
+            self._changed()
 
     def remove(self, record: MapRecord):
+        self.remove_many([record])
+
+    def remove_many(self, records):
+        """
+        Removes several records at once, which is much quicker than removing them
+        one at a time.
+        :param records: an iterable of MapRecords (or anything else with a key)
+        """
+        if self._lock:
+            raise IOError('Locked.')
+        keep = np.ones(len(self), dtype=bool)
+        for record in records:
+            row = self._row_of(record.key)
+            if row is None:
+                raise KeyError(f'Key {str(record.key)} does not exist in this map.')
+            keep[row] = False
+        self._store = self._store.take(keep)
+        self._reindex()
+        self._changed()
+
+    @classmethod
+    def from_arrays(cls, arrays, paths=None):
+        """
+        Makes a map from arrays of column values, validating them all at once. Much
+        quicker than adding records one at a time.
+        :param arrays: a dict of column name: array (or list), as in cls.columns; a
+                       'path' column can be path strings or indices into paths
+        :param paths: the PathTable that a 'path' column of indices refers to
+        :return: a map of this type
+        """
+        with cls() as new_map:
+            new_map.extend(arrays, paths)
+        return new_map
+
+    def extend(self, arrays, paths=None):
+        """
+        Adds several records from arrays of column values, validating them all at
+        once. Raises a KeyError or ValueError (as add() does) and adds nothing if any
+        of them are invalid.
+        :param arrays: a dict of column name: array (or list), as in self.columns; a
+                       'path' column can be path strings or indices into paths
+        :param paths: the PathTable that a 'path' column of indices refers to
+        """
         if self._lock:
             raise IOError('Locked.')
-        self._records = [r for r in self._records if r != record]
-        self._keys.remove(str(record.key))
+        arrays = self._check_arrays(arrays, paths)
+        arrays = {name: np.concatenate([self._store[name], arrays[name]]) for name in
+                  self.columns}
+        codes = self._key_codes(arrays)
+        if len(np.unique(codes)) != len(codes):
+            raise KeyError('Duplicate key')
+        self._store = Columns.from_arrays(self.columns, arrays)
+        self._reindex()
+        self._changed()
+
+    def _check_arrays(self, arrays, paths=None):
+        """
+        Validates arrays of column values and converts them to the column types.
+        :return: a dict of column name: array
+        """
+        arrays = dict(arrays)
+        if 'path' in self.columns and 'path' in arrays:
+            arrays['path'] = self._path_ids(arrays['path'], paths)
+        checked = {}
+        n = None
+        for name, (dtype, shape) in self.columns.items():
+            error = KeyError if name in self.key_columns else ValueError
+            if name not in arrays:
+                raise error(f'No values for the {name} column.')
+            a = np.asarray(arrays[name])
+            if len(a) == 0:
+                a = a.reshape((0,) + shape)
+            n = len(a) if n is None else n
+            if a.shape != (n,) + shape:
+                raise error(f'Expected the {name} column to have shape '
+                            f'{(n,) + shape}, not {a.shape}.')
+            if dtype is np.bool_:
+                a = a.astype(bool)
+            elif len(a) > 0:
+                if not (np.issubdtype(a.dtype, np.integer) or (
+                        name not in self.key_columns and np.issubdtype(a.dtype,
+                                                                      np.floating))):
+                    raise error(f'Invalid values in the {name} column.')
+                if np.issubdtype(a.dtype, np.floating) and not (
+                        np.isfinite(a).all() and (a == np.round(a)).all()):
+                    # NaN would pass the range check and fractions would be truncated
+                    raise error(f'Values in the {name} column must be whole numbers.')
+                info = np.iinfo(dtype)
+                if a.min() < info.min or a.max() > info.max:
+                    raise error(f'Values in the {name} column are out of range.')
+            checked[name] = a
+        return checked
+
+    def _check_row(self, row):
+        """
+        Checks that the values of a new row fit in the column types, which NumPy
+        would otherwise silently wrap (e.g. coordinates outside the int16 range).
+        :param row: a dict of column name: row value, as returned by _encode()
+        """
+        for name, value in row.items():
+            dtype = self.columns[name][0]
+            if dtype is np.bool_:
+                continue
+            info = np.iinfo(dtype)
+            if any(v < info.min or v > info.max for v in np.ravel(value).tolist()):
+                error = KeyError if name in self.key_columns else ValueError
+                raise error(f'Values in the {name} column are out of range.')
+
+    def _path_ids(self, path, paths=None):
+        """
+        Converts a column of paths to indices into this map's PathTable.
+        :param path: path strings (or LocationEntries), or indices into paths
+        :param paths: the PathTable that indices refer to
+        :return: an array of ints
+        """
+        path = np.asarray(path) if paths is not None else path
+        if paths is None:
+            return self._paths.ids(p.path if isinstance(p, LocationEntry) else str(p)
+                                   for p in path)
+        if paths is self._paths:
+            return path
+        if len(self) == 0 and len(self._paths) == 0:
+            self._paths = paths
+            return path
+        return self._paths.ids(paths.paths[i] for i in path.tolist())
+
+    def _row_of(self, key):
+        """
+        Finds the row for a key.
+        :return: the row index, or None if the key isn't in the map
+        """
+        return self._index.get(self._index_key(key))
+
+    @property
+    def _index(self):
+        """
+        A dict of index key: row. Built on first use, because maps made in bulk
+        often aren't looked up by key at all.
+        """
+        if self._row_index is None:
+            self._row_index = {k: i for i, k in enumerate(self._index_keys())}
+        return self._row_index
+
+    def _reindex(self):
+        self._row_index = None
+
+    def _changed(self):
+        """
+        Clears anything cached from the records. Called whenever the records change.
+        """
         self._sortedrecords = None
+        self._order = None
+
+    @classmethod
+    def _from_columns(cls, arrays, paths=None):
+        """
+        Makes a map straight from arrays of column values, without validating them.
+        :param arrays: a dict of column name: array, as in cls.columns
+        :param paths: the PathTable that any 'path' column refers to
+        :return: a map of this type
+        """
+        new_map = cls()
+        new_map._store = Columns.from_arrays(cls.columns, arrays)
+        if paths is not None:
+            new_map._paths = paths
+        new_map._reindex()
+        return new_map
+
+    @abc.abstractmethod
+    def _encode(self, key, value):
+        """
+        The column values for a key and value.
+        :return: a dict of column name: row value
+        """
+        pass
+
+    @abc.abstractmethod
+    def _key_at(self, store, row):
+        pass
+
+    @abc.abstractmethod
+    def _value_at(self, store, row):
+        pass
+
+    @abc.abstractmethod
+    def _key_codes(self, arrays):
+        """
+        A distinct number for each key, for checking keys are unique without making
+        any entries.
+        :param arrays: a dict of column name: array
+        :return: an array of ints
+        """
+        pass
+
+    @abc.abstractmethod
+    def _sort_keys(self):
+        """
+        Arrays to sort the rows by, most significant first, giving the same order as
+        sorting the records' values.
+        :return: list of arrays
+        """
+        pass
+
+    @abc.abstractmethod
+    def _index_key(self, key):
+        """
+        The hashable value a key entry is indexed by.
+        """
+        pass
+
+    @abc.abstractmethod
+    def _index_keys(self):
+        """
+        The index key of every row.
+        :return: list
+        """
+        pass
+
+    @abc.abstractmethod
+    def _serialised_keys(self):
+        pass
+
+    @abc.abstractmethod
+    def _serialised_values(self):
+        pass
 
     def worker(self, i):
         return self.records[i - 1]
@@ -147,43 +650,225 @@ class BaseMap(abc.ABC):
             raise IndexError
 
     def check(self):
-        recordkeys = sorted([str(r.key) for r in self._records])
-        keys = sorted(list(self._keys))
-        if not recordkeys == keys:
-            print(list(set(recordkeys) - set(keys)))
-            print(list(set(keys) - set(recordkeys)))
-        return recordkeys == keys
+        recordkeys = self._index_keys()
+        ok = len(recordkeys) == len(self._index) and all(
+            self._index.get(k) == i for i, k in enumerate(recordkeys))
+        if not ok:
+            print(list(set(recordkeys) - set(self._index)))
+            print(list(set(self._index) - set(recordkeys)))
+        return ok
 
 
 class ReferenceMap(BaseMap):
     key_type = CoordinateEntry
     value_type = HsvEntry
+    columns = {
+        'xy': (np.int16, (2,)),
+        'hsv': (np.uint8, (3,))
+        }
+    key_columns = ('xy',)
 
     def validate(self, record):
-        if str(record.key) in self._keys:
+        if isinstance(record.key, self.key_type) and self._row_of(
+                record.key) is not None:
             raise KeyError('Duplicate key')
         return super(ReferenceMap, self).validate(record)
 
     @property
     def bounds(self):
-        w = max(self._records, key=lambda x: x.key.x).key.x + 1
-        h = max(self._records, key=lambda x: x.key.y).key.y + 1
+        w, h = (self._store['xy'].max(axis=0) + 1).tolist()
         return [w, h]
 
+    def header(self):
+        header = super(ReferenceMap, self).header()
+        header['bounds'] = self.bounds if len(self) > 0 else [0, 0]
+        return header
+
+    def _encode(self, key, value):
+        return {
+            'xy': (key.x, key.y),
+            'hsv': value.entry
+            }
+
+    def _key_at(self, store, row):
+        return CoordinateEntry(*store['xy'][row].tolist())
+
+    def _value_at(self, store, row):
+        return HsvEntry(*store['hsv'][row].tolist())
+
+    def _key_codes(self, arrays):
+        xy = arrays['xy'].astype(np.int64)
+        if len(xy) == 0:
+            return np.zeros(0, dtype=np.int64)
+        xy -= xy.min(axis=0)
+        return xy[:, 0] * (xy[:, 1].max() + 1) + xy[:, 1]
+
+    def _sort_keys(self):
+        return hsv_keys(self._store['hsv'])
+
+    def _index_key(self, key):
+        return key.x, key.y
+
+    def _index_keys(self):
+        return list(map(tuple, self._store['xy'].tolist()))
+
+    def _serialised_keys(self):
+        store = self._store
+        return [f'{x}|{y}' for x, y in store['xy'].tolist()]
+
+    def _serialised_values(self):
+        store = self._store
+        return store['hsv'].tolist()
+
 
 class ComponentMap(BaseMap):
     key_type = LocationEntry
     value_type = HsvEntry
+    columns = {
+        'path': (np.int32, ()),
+        'hsv': (np.uint8, (3,))
+        }
+    key_columns = ('path',)
 
     def validate(self, record):
-        if str(record.key) in self._keys:
+        if isinstance(record.key, self.key_type) and self._row_of(
+                record.key) is not None:
             raise KeyError('Duplicate key')
         return super(ComponentMap, self).validate(record)
 
-    def reduce(self, target):
-        self._sortedrecords = None
-        self._records = np.random.choice(self._records, target, replace=False).tolist()
-        self._keys = [str(r.key) for r in self._records]
+    def __init__(self):
+        super(ComponentMap, self).__init__()
+        self._paths = PathTable()
+        self._colour_index = None
+
+    def _changed(self):
+        super(ComponentMap, self)._changed()
+        self._colour_index = None
+
+    @property
+    def paths(self):
+        """
+        The path of every component, in the same order as records.
+        :return: list of str
+        """
+        return [self._paths.paths[i] for i in self.column('path').tolist()]
+
+    @property
+    def colour_index(self):
+        """
+        A KD-tree of the component HSV values, in the same order as records. Built on
+        first access and cached until the map changes.
+        :return: scipy.spatial.cKDTree
+        """
+        if self._colour_index is None:
+            self._colour_index = cKDTree(self.column('hsv'))
+        return self._colour_index
+
+    def _encode(self, key, value):
+        return {
+            'path': self._paths.id(key),
+            'hsv': value.entry
+            }
+
+    def _key_at(self, store, row):
+        return self._paths.entry(store['path'][row].item())
+
+    def _value_at(self, store, row):
+        return HsvEntry(*store['hsv'][row].tolist())
+
+    def _key_codes(self, arrays):
+        return arrays['path']
+
+    def _sort_keys(self):
+        return hsv_keys(self._store['hsv'])
+
+    def _index_key(self, key):
+        return key.path
+
+    def _index_keys(self):
+        return self._serialised_keys()
+
+    def _serialised_keys(self):
+        store = self._store
+        return [self._paths.paths[i] for i in store['path'].tolist()]
+
+    def _serialised_values(self):
+        store = self._store
+        return store['hsv'].tolist()
+
+    @staticmethod
+    def _bin(colours, bins):
+        """
+        The index of the HSV histogram bin each colour falls into.
+        :param colours: an (n, 3) array of HSV values from 0-255
+        :param bins: the number of bins along each axis
+        :return: an array of n bin indices
+        """
+        b = np.minimum(np.asarray(colours, dtype=int) * bins // 256, bins - 1)
+        return (b[:, 0] * bins + b[:, 1]) * bins + b[:, 2]
+
+    @staticmethod
+    def _apportion(weights, total):
+        """
+        Splits total into whole numbers in proportion to weights, using the largest
+        remainders so that they add up to total exactly.
+        """
+        shares = weights * (total / weights.sum())
+        counts = np.floor(shares).astype(int)
+        remainder = total - counts.sum()
+        if remainder > 0:
+            counts[np.argsort(counts - shares, kind='stable')[:remainder]] += 1
+        return counts
+
+    def reduce(self, target, reference=None, seed=None, bins=8):
+        """
+        Reduces the map to the target number of components. If a reference map is
+        given, the components closest to the colours it needs are kept first (in
+        proportion to the number of pixels of each colour), and the rest of the
+        target is made up by sampling the remaining components evenly across the
+        colour space; otherwise they are all sampled this way.
+        :param target: the number of components to keep
+        :param reference: a ReferenceMap to keep the components for
+        :param seed: a seed for the random sampling, for reproducible results
+        :param bins: the number of histogram bins along each of the H, S and V axes
+        """
+        if target >= len(self):
+            return
+        rng = np.random.default_rng(seed)
+        colours = self.column('hsv')
+        keep = np.zeros(len(colours), dtype=bool)
+
+        if reference is not None and len(reference) > 0:
+            ref_colours = reference.column('hsv')
+            demand_bins, groups, demand = np.unique(self._bin(ref_colours, bins),
+                                                    return_inverse=True,
+                                                    return_counts=True)
+            quotas = self._apportion(demand, min(target, len(ref_colours)))
+            centres = np.zeros((len(demand_bins), 3))
+            np.add.at(centres, groups.ravel(), ref_colours)
+            centres /= demand[:, None]
+            # the most-used colours first, so they get their closest components
+            for b in np.argsort(-demand, kind='stable'):
+                distances = ((colours - centres[b]) ** 2).sum(axis=1)
+                distances[keep] = np.inf
+                nearest = np.argpartition(distances, quotas[b] - 1)[:quotas[b]]
+                keep[nearest] = True
+
+        remaining = np.flatnonzero(~keep)
+        fill = target - keep.sum()
+        if fill > 0:
+            # stratified: each colour bin gets a share of the fill in proportion to
+            # the number of components left in it
+            _, groups, counts = np.unique(self._bin(colours[remaining], bins),
+                                          return_inverse=True, return_counts=True)
+            groups = groups.ravel()
+            for g, n in enumerate(self._apportion(counts, fill)):
+                if n > 0:
+                    keep[rng.choice(remaining[groups == g], n, replace=False)] = True
+
+        self._store = self._store.take(np.sort(self.order[keep]))
+        self._reindex()
+        self._changed()
 
 
 class SolutionMap(ReferenceMap):
@@ -194,10 +879,122 @@ class SolutionMap(ReferenceMap):
         'target': HsvEntry,
         'src': HsvEntry
         }
+    columns = {
+        'xy': (np.int16, (2,)),
+        'path': (np.int32, ()),
+        'target': (np.uint8, (3,)),
+        'src': (np.uint8, (3,)),
+        # older solution maps don't have the component colours
+        'has_src': (np.bool_, ())
+        }
+    key_columns = ('xy',)
+    # the key of the component table in a serialised map
+    components_key = '__components__'
+
+    def __init__(self):
+        super(SolutionMap, self).__init__()
+        self._paths = PathTable()
 
     def validate(self, record):
         for k, e in record.value.entries.items():
             entry_type = self.combined_types.get(k, None)
             if entry_type is None or not isinstance(e, entry_type):
                 return False
+        if 'path' not in record.value.entries or 'target' not in record.value.entries:
+            return False
         return super(SolutionMap, self).validate(record)
+
+    @property
+    def paths(self):
+        """
+        The component path of every record, in the same order as records.
+        :return: list of str
+        """
+        return [self._paths.paths[i] for i in self.column('path').tolist()]
+
+    def _encode(self, key, value):
+        src = value.entries.get('src')
+        return {
+            'xy': (key.x, key.y),
+            'path': self._paths.id(value.entries['path']),
+            'target': value.entries['target'].entry,
+            'src': src.entry if src is not None else (0, 0, 0),
+            'has_src': src is not None
+            }
+
+    def _value_at(self, store, row):
+        entries = {
+            'path': self._paths.entry(store['path'][row].item()),
+            'target': HsvEntry(*store['target'][row].tolist())
+            }
+        if store['has_src'][row]:
+            entries['src'] = HsvEntry(*store['src'][row].tolist())
+        return CombinedEntry(**entries)
+
+    def _check_arrays(self, arrays, paths=None):
+        arrays = dict(arrays)
+        n = len(arrays.get('xy', []))
+        if arrays.get('src') is None:
+            arrays['src'] = np.zeros((n, 3), dtype=np.uint8)
+            arrays['has_src'] = np.zeros(n, dtype=bool)
+        elif arrays.get('has_src') is None:
+            arrays['has_src'] = np.ones(n, dtype=bool)
+        return super(SolutionMap, self)._check_arrays(arrays, paths)
+
+    def _sort_keys(self):
+        # the same order as comparing CombinedEntry keys: path, target, then src,
+        # with records without a src first
+        store = self._store
+        has_src = store['has_src']
+        src = np.where(has_src[:, None], store['src'], 0)
+        return [self._paths.ranks()[store['path']]] + hsv_keys(store['target']) + \
+               [has_src] + hsv_keys(src)
+
+    def serialise(self):
+        """
+        Serialises the map with a table of its components (each distinct path and src
+        colour) as the first record, so each one is only stored once; each pixel's
+        value is the index of its component in the table followed by its target
+        colour. The prefix and suffix shared by every path (e.g. './specimens/' and
+        '.jpg') are also only stored once.
+        :return: str
+        """
+        store = self._store
+        has_src = store['has_src'].astype(np.int64)
+        src = np.where(has_src[:, None], store['src'], 0).astype(np.int64)
+        codes = (store['path'].astype(np.int64) << 25) | (has_src << 24) | (
+                src[:, 0] << 16) | (src[:, 1] << 8) | src[:, 2]
+        used, ix = np.unique(codes, return_inverse=True)
+        paths = [self._paths.paths[i] for i in (used >> 25).tolist()]
+        prefix = os.path.commonprefix(paths)
+        suffix = os.path.commonprefix([p[len(prefix):][::-1] for p in paths])[::-1]
+        components = {
+            'prefix': prefix,
+            'suffix': suffix,
+            'path': [p[len(prefix):len(p) - len(suffix)] for p in paths],
+            'src': [[(c >> 16) & 255, (c >> 8) & 255, c & 255] if (c >> 24) & 1
+                    else None for c in used.tolist()]
+            }
+        content = {
+            self.header_key: self.header(),
+            self.components_key: components
+            }
+        values = np.c_[ix, store['target']].tolist()
+        content.update(zip(self._serialised_keys(), values))
+        return json.dumps(content)
+
+    def _serialised_values(self):
+        store = self._store
+        values = []
+        for path, target, src, has_src in zip(store['path'].tolist(),
+                                              store['target'].tolist(),
+                                              store['src'].tolist(),
+                                              store['has_src'].tolist()):
+            value = {
+                'path': self._paths.paths[path],
+                'target': target
+                }
+            if has_src:
+                value['src'] = src
+            values.append(value)
+        return values
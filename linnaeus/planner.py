@@ -0,0 +1,249 @@
+import math
+import os
+
+import yaml
+
+from .config import constants
+
+
+class Plan(object):
+    def __init__(self, strategy, pool, memory, seconds, top_k=None, tiles=None,
+                 fits=True, solver=None):
+        """
+        An estimate of the resources needed to solve with a given strategy.
+        :param strategy: one of Planner.strategies
+        :param pool: the number of components to use
+        :param memory: estimated peak memory in bytes
+        :param seconds: estimated wall-clock time in seconds
+        :param top_k: the top_k to solve with (top_k strategy only)
+        :param tiles: the number of tiles to solve with (tiled strategy only)
+        :param fits: False if even the smallest usable pool doesn't fit the budget
+        :param solver: the solver backend the estimate is for (dense strategy only)
+        """
+        self.strategy = strategy
+        self.pool = pool
+        self.memory = memory
+        self.seconds = seconds
+        self.top_k = top_k
+        self.tiles = tiles
+        self.fits = fits
+        self.solver = solver
+
+    def __str__(self):
+        options = ''
+        if self.top_k:
+            options = f' (top_k={self.top_k})'
+        elif self.tiles:
+            options = f' (tiles={self.tiles})'
+        elif self.solver and self.solver != self.strategy:
+            options = f' ({self.solver} solver)'
+        return f'{self.strategy}{options}: {self.pool} components, ' \
+               f'~{self.memory / 2 ** 20:.0f} MB, ~{self.seconds:.1f}s'
+
+
+class Planner(object):
+    """
+    Estimates the peak memory and time taken to solve with each strategy, and picks
+    the largest component pool and the best strategy that fit in a memory budget.
+    Estimates are linear in the amount of work each strategy does (e.g. the number of
+    cells in the cost matrix), scaled by calibration data from benchmarks/calibrate.py.
+    """
+    strategies = ['dense', 'masked', 'top_k', 'tiled']
+    # an unmasked ('dense') solve only uses the dense solver up to
+    # constants.dense_solver_limit cells; these are calibrated separately
+    solvers = ['sparse', 'flow']
+
+    # bytes and seconds per unit of work for each strategy (and the solvers above),
+    # plus a fixed amount for each, measured by benchmarks/calibrate.py on a single core
+    defaults = {
+        'dense': {
+            'base_bytes': 34e6,
+            'bytes': 12.0,
+            'base_seconds': 0.33,
+            'seconds': 1.7e-8
+            },
+        'masked': {
+            'base_bytes': 34e6,
+            'bytes': 46.0,
+            'base_seconds': 0.3,
+            'seconds': 1.2e-7
+            },
+        'top_k': {
+            'base_bytes': 35e6,
+            'bytes': 100.0,
+            'base_seconds': 0.09,
+            'seconds': 5.2e-6
+            },
+        'tiled': {
+            'base_bytes': 36e6,
+            'bytes': 13.0,
+            'base_seconds': 0.3,
+            'seconds': 2.9e-8
+            },
+        'sparse': {
+            'base_bytes': 35e6,
+            'bytes': 43.0,
+            'base_seconds': 0.61,
+            'seconds': 5.7e-8
+            },
+        'flow': {
+            'base_bytes': 34e6,
+            'bytes': 90.0,
+            'base_seconds': 0.0,
+            'seconds': 1.1e-6
+            }
+        }
+
+    def __init__(self, calibration=None):
+        """
+        :param calibration: a dict like Planner.defaults; missing values are taken
+                            from the defaults
+        """
+        self.calibration = {k: dict(v, **(calibration or {}).get(k, {})) for k, v in
+                            self.defaults.items()}
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Loads calibration data from a YAML file (as written by dump()), if it exists.
+        :param path: defaults to .calibration in the current working directory
+        :return: Planner
+        """
+        path = path or os.path.join(os.getcwd(), '.calibration')
+        if os.path.exists(path) and os.path.isfile(path):
+            with open(path, 'r') as f:
+                return cls(yaml.safe_load(f))
+        return cls()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            yaml.dump(self.calibration, f, default_flow_style=False)
+
+    @staticmethod
+    def units(strategy, rows, pool, top_k=20, tiles=4, workers=1):
+        """
+        The amount of work a strategy does, in the units used for calibration.
+        :param strategy: one of Planner.strategies
+        :param rows: the number of reference pixels
+        :param pool: the number of components
+        :param top_k: the number of candidates per pixel (top_k strategy only)
+        :param tiles: the number of tiles (tiled strategy only)
+        :param workers: the number of worker processes (tiled strategy only)
+        :return: the units of memory held at once, and the units of time taken
+        """
+        if strategy in ('dense', 'masked', 'sparse', 'flow'):
+            return rows * pool, rows * pool
+        if strategy == 'top_k':
+            arcs = rows * min(top_k, pool)
+            return arcs, arcs
+        if strategy == 'tiled':
+            workers = min(workers, tiles)
+            tile_cells = (rows / tiles) * (pool / tiles)
+            return tile_cells * workers, tile_cells * tiles / workers
+        raise ValueError(f'Unknown strategy: {strategy}')
+
+    @staticmethod
+    def solver(strategy, rows, pool, backend=None, reuse=1):
+        """
+        The calibration to use for a strategy. An unmasked ('dense') solve uses
+        whichever backend Solver.choose() picks for its size (or the flow solver, to
+        reuse components), and they use very different amounts of memory.
+        :param backend: the solver backend to use; chosen as Solver.choose() would if
+                        None or 'auto'
+        :param reuse: the number of times each component can be used
+        :return: a key of Planner.defaults
+        """
+        if strategy != 'dense':
+            return strategy
+        if reuse > 1:
+            return 'flow'
+        if backend is None or backend == 'auto':
+            from linnaeus.solvers import Solver
+            backend = Solver.choose(rows, pool, rows * pool).name
+        return backend if backend in ('dense', 'flow') else 'sparse'
+
+    def estimate(self, strategy, rows, pool, top_k=20, tiles=4, workers=1,
+                 backend=None, reuse=1):
+        """
+        Estimates the peak memory and time taken to solve with a strategy.
+        :return: Plan
+        """
+        memory_units, time_units = self.units(strategy, rows, pool, top_k, tiles,
+                                              workers)
+        solver = self.solver(strategy, rows, pool, backend, reuse)
+        calibration = self.calibration[solver]
+        return Plan(strategy, pool,
+                    calibration['base_bytes'] + calibration['bytes'] * memory_units,
+                    calibration['base_seconds'] + calibration['seconds'] * time_units,
+                    top_k=top_k if strategy == 'top_k' else None,
+                    tiles=tiles if strategy == 'tiled' else None,
+                    solver=solver if strategy == 'dense' else None)
+
+    @staticmethod
+    def smallest_pool(rows, reuse=1):
+        """
+        The fewest components that can fill the reference.
+        :param rows: the number of reference pixels
+        :param reuse: the number of times each component can be used
+        :return: int
+        """
+        return math.ceil(rows / reuse)
+
+    def largest_pool(self, strategy, rows, comps, memory_budget, **kwargs):
+        """
+        Finds the largest pool of components (no larger than comps, no smaller than
+        smallest_pool()) that can be solved with a strategy within the memory budget.
+        :return: the pool size, or None if even the smallest pool doesn't fit
+        """
+        lo, hi = self.smallest_pool(rows, kwargs.get('reuse', 1)), comps
+        if lo > hi:
+            return None
+        if self.estimate(strategy, rows, hi, **kwargs).memory <= memory_budget:
+            return hi
+        if self.estimate(strategy, rows, lo, **kwargs).memory > memory_budget:
+            return None
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.estimate(strategy, rows, mid, **kwargs).memory <= memory_budget:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def plan(self, rows, comps, memory_budget=None, top_k=None, tiles=None,
+             workers=None, backend=None, reuse=None):
+        """
+        Plans a solve for every strategy, best first: the largest pool that fits in
+        the memory budget, then the quickest. Tiled solves can't reuse components, so
+        they aren't planned if reuse is more than 1.
+        :param rows: the number of reference pixels
+        :param comps: the number of components available
+        :param memory_budget: the maximum bytes to use; defaults to
+                              constants.memory_budget (in MB)
+        :param top_k: for the top_k strategy; defaults to 20
+        :param tiles: for the tiled strategy; defaults to 4
+        :param workers: for the tiled strategy; defaults to the number of CPUs
+        :param backend: the solver backend for the dense strategy; chosen
+                        automatically if None
+        :param reuse: the number of times each component can be used; defaults to
+                      constants.reuse_limit
+        :return: a list of Plans
+        """
+        memory_budget = memory_budget or constants.memory_budget * 2 ** 20
+        kwargs = {
+            'top_k': top_k or 20,
+            'tiles': tiles or 4,
+            'workers': workers or os.cpu_count() or 1,
+            'backend': backend,
+            'reuse': reuse or constants.reuse_limit
+            }
+        smallest = min(self.smallest_pool(rows, kwargs['reuse']), comps)
+        plans = []
+        for strategy in self.strategies:
+            if strategy == 'tiled' and kwargs['reuse'] > 1:
+                continue
+            pool = self.largest_pool(strategy, rows, comps, memory_budget, **kwargs)
+            plan = self.estimate(strategy, rows, pool or smallest, **kwargs)
+            plan.fits = pool is not None
+            plans.append(plan)
+        return sorted(plans, key=lambda p: (not p.fits, -p.pool, p.seconds))
@@ -0,0 +1,2 @@
+from ._base import BaseSolver, SolveError
+from .backends import AuctionSolver, DenseSolver, FlowSolver, Solver, SparseSolver
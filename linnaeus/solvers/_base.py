@@ -0,0 +1,64 @@
+import abc
+
+import numpy as np
+from ortools.graph.python import min_cost_flow
+
+
+class BaseSolver(abc.ABC):
+    # the name used to select this backend, e.g. from the CLI
+    name = None
+
+    @classmethod
+    @abc.abstractmethod
+    def assign(cls, cost_matrix, rows, cols, use_mask=True):
+        """
+        Finds the lowest cost assignment of every row to a different column.
+        :param cost_matrix: the cost matrix, either a masked list of (row, col, cost)
+                           arcs with node offsets (as returned by
+                           Builder.cost_matrix(use_mask=True)) or a flattened array of
+                           every cost (as returned by Builder.cost_matrix(use_mask=False))
+        :param rows: the number of rows (reference pixels)
+        :param cols: the number of columns (components)
+        :param use_mask: True if the cost matrix is a masked list of arcs
+        :return: an array of row indices and an array of the column assigned to each
+        """
+        pass
+
+    @classmethod
+    def triplets(cls, cost_matrix, rows, cols, use_mask=True):
+        """
+        Converts either cost matrix format to zero-indexed arrays of rows, columns and
+        costs.
+        :return: rows, cols, costs
+        """
+        if use_mask:
+            return cost_matrix[:, 0] - 1, cost_matrix[:, 1] - rows - 1, cost_matrix[:, 2]
+        else:
+            r, c = np.divmod(np.arange(rows * cols), cols)
+            return r, c, cost_matrix[:, 0]
+
+
+class SolveError(Exception):
+    def __init__(self, error_code, masked, msg=None):
+        self.error_code = error_code
+        self.reason = self.codes(error_code)
+        self.masked = masked
+        if msg is None:
+            msg = f'Failed to solve: {self.reason}.'
+            if self.masked:
+                msg += ' Try passing "use_mask=False" into the build method, ' \
+                       'or increase "mask_tolerance".'
+        super(SolveError, self).__init__(msg)
+
+    def __reduce__(self):
+        # so errors raised in worker processes can be sent back
+        return self.__class__, (self.error_code, self.masked, str(self))
+
+    # the status used by backends other than the flow solver when there's no solution
+    infeasible = min_cost_flow.SimpleMinCostFlow.INFEASIBLE
+
+    @staticmethod
+    def codes(error_code):
+        statuses = min_cost_flow.SimpleMinCostFlow.Status.__members__
+        codes = {v: k for k, v in statuses.items()}
+        return codes.get(error_code, 'UNKNOWN ERROR')
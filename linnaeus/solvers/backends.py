@@ -0,0 +1,352 @@
+import numpy as np
+from numba import njit
+from ortools.graph.python import min_cost_flow
+from scipy import sparse
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+
+from linnaeus.config import ProgressLogger, TimeLogger, constants, logger
+from ._base import BaseSolver, SolveError
+
+
+class FlowSolver(BaseSolver):
+    """
+    Solves the assignment as a min cost flow with OR-tools. Handles any shape and
+    density, and is the only backend that supports supplies and capacities other
+    than 1.
+    """
+    name = 'flow'
+
+    @classmethod
+    def add_arcs(cls, solver, tails, heads, costs, capacity=1):
+        """
+        Adds a block of arcs to the solver in a single call rather than one at a time.
+        :param solver: a SimpleMinCostFlow instance
+        :param tails: array of tail node indices
+        :param heads: array of head node indices
+        :param costs: array of unit costs, one for each arc
+        :param capacity: the capacity of every arc in the block, or an array of
+                         capacities, one for each arc
+        :return: array of the new arc indices
+        """
+        return solver.add_arcs_with_capacity_and_unit_cost(
+            np.asarray(tails, dtype=np.int32),
+            np.asarray(heads, dtype=np.int32),
+            np.broadcast_to(np.asarray(capacity, dtype=np.int64), len(tails)),
+            np.asarray(costs, dtype=np.int64))
+
+    @classmethod
+    def network(cls, cost_matrix, rows, cols, use_mask=True, supply=None,
+                capacity=None):
+        """
+        Builds the min cost flow network from a cost matrix. Arcs are added in blocks
+        of constants.arc_chunk_size using the solver's array methods.
+        :param cost_matrix: the cost matrix as returned by Builder.cost_matrix()
+        :param rows: the number of reference pixels
+        :param cols: the number of components
+        :param use_mask: True if the cost matrix is a masked (row, col, cost) list
+        :param supply: array of the number of units each row must send; defaults to 1
+                       for every row
+        :param capacity: array of the number of units each column can take; defaults
+                         to 1 for every column
+        :return: SimpleMinCostFlow
+        """
+        supply = np.ones(rows, dtype=np.int64) if supply is None else supply
+        capacity = np.ones(cols, dtype=np.int64) if capacity is None else capacity
+        total = int(supply.sum())
+        cost_arcs = cost_matrix.shape[0]
+        arc_count = rows + cols + cost_arcs
+        last_node = rows + cols + 1
+        pixel_nodes = np.arange(1, rows + 1, dtype=np.int32)
+        comp_nodes = np.arange(rows + 1, last_node, dtype=np.int32)
+        logger.debug(f'adding {arc_count} arcs to solver ')
+        solver = min_cost_flow.SimpleMinCostFlow()
+        logger.debug(f'section 1: {rows} items')
+        # section one
+        cls.add_arcs(solver, np.zeros(rows, dtype=np.int32), pixel_nodes,
+                     np.zeros(rows, dtype=np.int64), supply)
+        logger.debug(f'section 2: {cost_arcs} items')
+        chunk_size = constants.arc_chunk_size
+        # section two
+        if use_mask:
+            chunks = range(0, cost_arcs, chunk_size)
+            with ProgressLogger(len(chunks), 20) as p:
+                for start in chunks:
+                    block = cost_matrix[start:start + chunk_size]
+                    cls.add_arcs(solver, block[:, 0], block[:, 1], block[:, 2],
+                                 supply[block[:, 0] - 1])
+                    p.next()
+        else:
+            # whole rows per chunk so the head indices can just be tiled
+            chunk_rows = max(chunk_size // cols, 1)
+            chunks = range(0, rows, chunk_rows)
+            with ProgressLogger(len(chunks), 20) as p:
+                for start in chunks:
+                    block_rows = pixel_nodes[start:start + chunk_rows]
+                    block = cost_matrix[start * cols:(start + block_rows.size) * cols]
+                    cls.add_arcs(solver, np.repeat(block_rows, cols),
+                                 np.tile(comp_nodes, block_rows.size), block[:, 0],
+                                 np.repeat(supply[block_rows - 1], cols))
+                    p.next()
+        logger.debug(f'section 3: {cols} items')
+        # section three
+        cls.add_arcs(solver, comp_nodes, np.full(cols, last_node, dtype=np.int32),
+                     np.zeros(cols, dtype=np.int64), capacity)
+        logger.debug('adding node supply')
+        supplies = np.zeros(last_node + 1, dtype=np.int64)
+        supplies[0] = total
+        supplies[-1] = -total
+        solver.set_nodes_supplies(np.arange(last_node + 1, dtype=np.int32), supplies)
+        return solver
+
+    @classmethod
+    def flows(cls, solver, cost_matrix, rows, cols, use_mask=True):
+        """
+        Reads the flows from a solved network. Only the flows of the
+        pixel -> component arcs (section two) are retrieved, in a single call.
+        :param solver: a solved SimpleMinCostFlow from network()
+        :param cost_matrix: the cost matrix the network was built from
+        :param rows: the number of reference pixels
+        :param cols: the number of components
+        :param use_mask: True if the cost matrix is a masked (row, col, cost) list
+        :return: arrays of the row index, column index and flow of each arc with flow
+        """
+        cost_arcs = cost_matrix.shape[0]
+        logger.debug(f'reading flows for {cost_arcs} arcs')
+        flows = solver.flows(np.arange(rows, rows + cost_arcs, dtype=np.int32))
+        assigned = np.flatnonzero(flows > 0)
+        if use_mask:
+            arc_rows = cost_matrix[assigned, 0] - 1
+            arc_cols = cost_matrix[assigned, 1] - rows - 1
+        else:
+            arc_rows, arc_cols = np.divmod(assigned, cols)
+        return arc_rows, arc_cols, flows[assigned]
+
+    @classmethod
+    def solve(cls, cost_matrix, rows, cols, use_mask=True, supply=None, capacity=None):
+        """
+        Builds and solves the network, returning the flows.
+        :return: see flows()
+        """
+        solver = cls.network(cost_matrix, rows, cols, use_mask, supply, capacity)
+        logger.debug('solving')
+        with TimeLogger():
+            status = solver.solve()
+        if status != solver.OPTIMAL:
+            raise SolveError(status, use_mask)
+        return cls.flows(solver, cost_matrix, rows, cols, use_mask)
+
+    @classmethod
+    def assign(cls, cost_matrix, rows, cols, use_mask=True):
+        arc_rows, arc_cols, _ = cls.solve(cost_matrix, rows, cols, use_mask)
+        return arc_rows, arc_cols
+
+
+class DenseSolver(BaseSolver):
+    """
+    Uses scipy's linear_sum_assignment (a shortest augmenting path method) on the full
+    cost matrix. Fastest for small problems, but needs the whole rows x cols matrix.
+    """
+    name = 'dense'
+
+    @classmethod
+    def assign(cls, cost_matrix, rows, cols, use_mask=True):
+        if use_mask:
+            costs = np.full((rows, cols), np.inf)
+            r, c, cost = cls.triplets(cost_matrix, rows, cols)
+            costs[r, c] = cost
+        else:
+            costs = cost_matrix.reshape(rows, cols)
+        logger.debug('solving')
+        try:
+            with TimeLogger():
+                return linear_sum_assignment(costs)
+        except ValueError:
+            raise SolveError(SolveError.infeasible, use_mask)
+
+
+class SparseSolver(BaseSolver):
+    """
+    Uses scipy's min_weight_full_bipartite_matching (LAPJVsp) on a sparse matrix of
+    candidate arcs. Suited to masked or top-k cost matrices.
+    """
+    name = 'sparse'
+
+    @classmethod
+    def assign(cls, cost_matrix, rows, cols, use_mask=True):
+        r, c, cost = cls.triplets(cost_matrix, rows, cols, use_mask)
+        # missing entries are treated as missing arcs, so shift every cost above zero;
+        # every row is assigned exactly once so this doesn't change the solution
+        graph = sparse.csr_matrix((cost + 1, (r, c)), shape=(rows, cols))
+        logger.debug('solving')
+        try:
+            with TimeLogger():
+                return min_weight_full_bipartite_matching(graph)
+        except ValueError:
+            raise SolveError(SolveError.infeasible, use_mask)
+
+
+@njit(cache=True)
+def _auction_phase(indptr, indices, benefits, prices, eps, spread, limit):
+    """
+    One forward auction round: every row bids for its most valuable column until
+    every row is assigned. Prices are updated in place.
+    :return: the column assigned to each row, and False if a row has no candidates
+             or a price went over the limit (i.e. the problem is infeasible)
+    """
+    rows = indptr.size - 1
+    owner = np.full(prices.size, -1, np.int64)
+    assignment = np.full(rows, -1, np.int64)
+    unassigned = np.arange(rows)
+    n = rows
+    while n > 0:
+        n -= 1
+        i = unassigned[n]
+        if indptr[i] == indptr[i + 1]:
+            return assignment, False
+        best_col = -1
+        best = 0
+        second = 0
+        has_second = False
+        for ix in range(indptr[i], indptr[i + 1]):
+            value = benefits[ix] - prices[indices[ix]]
+            if best_col < 0:
+                best = value
+                best_col = indices[ix]
+            elif value > best:
+                second = best
+                best = value
+                best_col = indices[ix]
+                has_second = True
+            elif not has_second or value > second:
+                second = value
+                has_second = True
+        if not has_second:
+            # only one candidate: bid as if the alternative was the worst possible
+            second = best - spread
+        prices[best_col] += best - second + eps
+        if prices[best_col] >= limit:
+            return assignment, False
+        previous = owner[best_col]
+        owner[best_col] = i
+        assignment[i] = best_col
+        if previous >= 0:
+            assignment[previous] = -1
+            unassigned[n] = previous
+            n += 1
+    return assignment, True
+
+
+@njit(cache=True)
+def _auction(indptr, indices, benefits, cols, theta):
+    """
+    Forward auction with epsilon scaling on integer benefits.
+    :return: the column assigned to each row, and False if the problem is infeasible
+    """
+    rows = indptr.size - 1
+    spread = benefits.max() - benefits.min() + 1
+    eps = max(spread // theta, 1)
+    # prices can't rise this far in any round of a feasible problem
+    rounds = int(np.log(eps) / np.log(theta)) + 2
+    limit = 4 * (rows + 1) * spread * rounds
+    prices = np.zeros(cols, np.int64)
+    while True:
+        assignment, feasible = _auction_phase(indptr, indices, benefits, prices, eps,
+                                              spread, limit)
+        if not feasible or eps == 1:
+            break
+        eps = max(eps // theta, 1)
+    if feasible and rows < cols:
+        # with fewer rows than columns the result is only optimal if every unassigned
+        # column is no more expensive than the assigned ones; prices carried over from
+        # earlier rounds can break that, so fall back to a single round from zero
+        used = np.zeros(cols, np.bool_)
+        used[assignment] = True
+        if prices[~used].max() > prices[used].min():
+            prices[:] = 0
+            assignment, feasible = _auction_phase(indptr, indices, benefits, prices, 1,
+                                                  spread, limit)
+    return assignment, feasible
+
+
+class AuctionSolver(BaseSolver):
+    """
+    A numba-compiled forward auction with epsilon scaling. Costs are scaled so that
+    the final round (epsilon = 1) gives an exact solution. Works on sparse candidate
+    arcs, and suits problems with many rows and few candidates for each.
+    """
+    name = 'auction'
+    # the factor epsilon is reduced by between rounds
+    theta = 5
+
+    @classmethod
+    def assign(cls, cost_matrix, rows, cols, use_mask=True):
+        r, c, cost = cls.triplets(cost_matrix, rows, cols, use_mask)
+        if len(cost) == 0:
+            # no candidates to bid on
+            raise SolveError(SolveError.infeasible, use_mask)
+        # shifted above zero so that zero costs aren't dropped as missing entries
+        graph = sparse.csr_matrix((cost + 1, (r, c)), shape=(rows, cols))
+        # maximise benefit rather than minimise cost; scaling means the rows x epsilon
+        # error of the final round is less than one unit of the original cost
+        benefits = -graph.data.astype(np.int64) * (rows + 1)
+        logger.debug('solving')
+        with TimeLogger():
+            assignment, feasible = _auction(graph.indptr.astype(np.int64),
+                                            graph.indices.astype(np.int64), benefits,
+                                            cols, cls.theta)
+        if not feasible:
+            raise SolveError(SolveError.infeasible, use_mask)
+        return np.arange(rows), assignment
+
+
+class Solver(object):
+    """
+    A controller, not a backend. Picks a backend for the problem based on its shape
+    and density (or uses the one it's told to), and delegates to it.
+    """
+
+    backends = {b.name: b for b in [FlowSolver, DenseSolver, SparseSolver,
+                                    AuctionSolver]}
+
+    @classmethod
+    def choose(cls, rows, cols, arcs):
+        """
+        Picks the most suitable backend for a problem.
+        :param rows: the number of rows (reference pixels)
+        :param cols: the number of columns (components)
+        :param arcs: the number of candidate arcs (rows * cols if not masked)
+        :return: BaseSolver subclass
+        """
+        cells = rows * cols
+        if arcs == cells:
+            return DenseSolver if cells <= constants.dense_solver_limit else SparseSolver
+        if arcs / cells <= constants.auction_solver_density:
+            return AuctionSolver
+        return SparseSolver
+
+    @classmethod
+    def get(cls, name, rows, cols, arcs):
+        """
+        Gets a backend by name, or picks one if name is None or 'auto'.
+        :return: BaseSolver subclass
+        """
+        if name is None or name == 'auto':
+            return cls.choose(rows, cols, arcs)
+        try:
+            return cls.backends[name]
+        except KeyError:
+            raise ValueError(f'Unknown solver backend: {name}.')
+
+    @classmethod
+    def assign(cls, cost_matrix, rows, cols, use_mask=True, backend=None):
+        """
+        Assigns every row to a different column using the given or chosen backend.
+        :param backend: the name of the backend to use; chosen automatically if None
+        :return: an array of row indices and an array of the column assigned to each
+        """
+        if rows > cols:
+            raise SolveError(None, use_mask, msg='Not enough components.')
+        solver = cls.get(backend, rows, cols, cost_matrix.shape[0])
+        logger.debug(f'using the {solver.name} solver')
+        return solver.assign(cost_matrix, rows, cols, use_mask)
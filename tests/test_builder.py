@@ -0,0 +1,256 @@
+import nose.tools as nosetools
+import numpy as np
+
+from linnaeus import Builder
+from linnaeus.models import (ComponentMap, CoordinateEntry, HsvEntry, LocationEntry,
+                             ReferenceMap, SolutionMap)
+from linnaeus.solvers import FlowSolver, SolveError, Solver
+
+
+class TestBuilder:
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.ref_map = ReferenceMap()
+        with self.ref_map as m:
+            for i, hsv in enumerate(rng.integers(0, 256, (30, 3)).tolist()):
+                m.add(CoordinateEntry(i % 6, i // 6), HsvEntry(*hsv))
+        self.comp_map = ComponentMap()
+        with self.comp_map as m:
+            for i, hsv in enumerate(rng.integers(0, 256, (60, 3)).tolist()):
+                m.add(LocationEntry(f'specimens/{i}.jpg'), HsvEntry(*hsv))
+
+    def _posterise(self):
+        rng = np.random.default_rng(7)
+        with self.ref_map as m:
+            for r in m.records:
+                m[r.key] = HsvEntry(*(rng.integers(0, 4, 3) * 80).tolist())
+        with self.comp_map as m:
+            for r in m.records:
+                m[r.key] = HsvEntry(*(rng.integers(0, 3, 3) * 120 + 10).tolist())
+
+    def _cost(self, solution):
+        cost_matrix, rows, cols = Builder.cost_matrix(self.ref_map, self.comp_map,
+                                                      use_mask=False)
+        cost_matrix = cost_matrix.reshape(rows, cols)
+        ref_ix = {str(r.key): i for i, r in enumerate(self.ref_map.records)}
+        comp_ix = {str(r.key): i for i, r in enumerate(self.comp_map.records)}
+        return sum(cost_matrix[ref_ix[str(r.key)],
+                               comp_ix[str(r.value.entries['path'])]]
+                   for r in solution.records)
+
+    def test_network(self):
+        cost_matrix, rows, cols = Builder.cost_matrix(self.ref_map, self.comp_map,
+                                                      use_mask=False)
+        solver = FlowSolver.network(cost_matrix, rows, cols, use_mask=False)
+        nosetools.assert_equal(solver.num_arcs(), rows + cols + rows * cols)
+        nosetools.assert_equal(solver.num_nodes(), rows + cols + 2)
+        nosetools.assert_equal(solver.supply(0), rows)
+        nosetools.assert_equal(solver.supply(rows + cols + 1), -rows)
+
+    def test_solve(self):
+        for use_mask in (True, False):
+            solution = Builder.solve(self.ref_map, self.comp_map, use_mask=use_mask,
+                                     mask_tolerance=-1)
+            nosetools.assert_is_instance(solution, SolutionMap)
+            nosetools.assert_equal(len(solution), len(self.ref_map))
+            paths = [r.value.entries['path'].path for r in solution.records]
+            nosetools.assert_equal(len(set(paths)), len(paths))
+
+    def test_stream_cost_matrix(self):
+        k = 5
+        arcs, rows, cols = Builder.stream_cost_matrix(self.ref_map, self.comp_map, k,
+                                                      memory_budget=1000)
+        full, _, _ = Builder.cost_matrix(self.ref_map, self.comp_map, use_mask=False)
+        full = full.reshape(rows, cols)
+        nosetools.assert_equal(arcs.shape, (rows * k, 3))
+        for r in range(rows):
+            row_arcs = arcs[arcs[:, 0] == r + 1]
+            nosetools.assert_equal(len(row_arcs), k)
+            # every kept cost is no worse than any dropped cost
+            kept = row_arcs[:, 1] - rows - 1
+            dropped = np.setdiff1d(np.arange(cols), kept)
+            nosetools.assert_less_equal(full[r, kept].max(), full[r, dropped].min())
+
+    def test_solve_top_k(self):
+        solution = Builder.solve(self.ref_map, self.comp_map, top_k=10)
+        nosetools.assert_equal(len(solution), len(self.ref_map))
+        paths = [r.value.entries['path'].path for r in solution.records]
+        nosetools.assert_equal(len(set(paths)), len(paths))
+
+    def test_nearest_cost_matrix(self):
+        k = 5
+        nearest, _, _ = Builder.nearest_cost_matrix(self.ref_map, self.comp_map, k)
+        streamed, _, _ = Builder.stream_cost_matrix(self.ref_map, self.comp_map, k)
+        nosetools.assert_equal(nearest.shape, streamed.shape)
+        # components with the same integer cost can be chosen in a different order,
+        # but the costs for each pixel should be the same
+        for arcs in (nearest, streamed):
+            arcs[:] = arcs[np.lexsort((arcs[:, 2], arcs[:, 0]))]
+        np.testing.assert_array_equal(nearest[:, [0, 2]], streamed[:, [0, 2]])
+
+    def test_solve_grouped(self):
+        self._posterise()
+        grouped = Builder.solve_grouped(self.ref_map, self.comp_map)
+        nosetools.assert_equal(len(grouped), len(self.ref_map))
+        paths = [r.value.entries['path'].path for r in grouped.records]
+        nosetools.assert_equal(len(set(paths)), len(paths))
+        for r in grouped.records:
+            nosetools.assert_equal(r.value.entries['target'],
+                                   self.ref_map[r.key].value)
+        full = Builder.solve(self.ref_map, self.comp_map, use_mask=False)
+        nosetools.assert_equal(self._cost(grouped), self._cost(full))
+
+    def test_backends(self):
+        for use_mask in (True, False):
+            cost_matrix, rows, cols = Builder.cost_matrix(self.ref_map, self.comp_map,
+                                                          use_mask, mask_tolerance=-1)
+            r, c, cost = FlowSolver.triplets(cost_matrix, rows, cols, use_mask)
+            costs = dict(zip(zip(r.tolist(), c.tolist()), cost.tolist()))
+            totals = []
+            for name in Solver.backends:
+                pixels, comps = Solver.assign(cost_matrix, rows, cols, use_mask, name)
+                nosetools.assert_equal(sorted(pixels.tolist()), list(range(rows)))
+                nosetools.assert_equal(len(set(comps.tolist())), rows)
+                totals.append(sum(costs[p, c] for p, c in zip(pixels.tolist(),
+                                                              comps.tolist())))
+            nosetools.assert_equal(len(set(totals)), 1)
+
+    def test_no_arcs(self):
+        empty = np.zeros((0, 3), dtype=np.int64)
+        for name in Solver.backends:
+            with nosetools.assert_raises(SolveError):
+                Solver.assign(empty, 2, 3, True, name)
+
+    def test_choose_backend(self):
+        nosetools.assert_equal(Solver.choose(100, 1000, 100000).name, 'dense')
+        nosetools.assert_equal(Solver.choose(10000, 100000, 10 ** 9).name, 'sparse')
+        nosetools.assert_equal(Solver.choose(10000, 100000, 200000).name, 'auction')
+        nosetools.assert_equal(Solver.choose(10000, 100000, 10 ** 8).name, 'sparse')
+        nosetools.assert_equal(Solver.get('flow', 10, 10, 100).name, 'flow')
+        with nosetools.assert_raises(ValueError):
+            Solver.get('simplex', 10, 10, 100)
+
+    def test_solve_fast(self):
+        solution = Builder.solve_fast(self.ref_map, self.comp_map, top_k=4, seed=1)
+        nosetools.assert_equal(len(solution), len(self.ref_map))
+        paths = [str(r.value.entries['path']) for r in solution.records]
+        nosetools.assert_equal(len(set(paths)), len(paths))
+        optimal = Builder.total_cost(
+            Builder.solve(self.ref_map, self.comp_map, use_mask=False))
+        # about 4% above the optimum on this fixture
+        nosetools.assert_less_equal(Builder.total_cost(solution), optimal * 1.1)
+        nosetools.assert_greater_equal(Builder.total_cost(solution), optimal - 1e-6)
+        nosetools.assert_less_equal(Builder.lower_bound(self.ref_map, self.comp_map),
+                                    optimal)
+
+    def test_tiles(self):
+        tile_ids = Builder.tiles(self.ref_map, 4)
+        nosetools.assert_equal(len(tile_ids), len(self.ref_map))
+        nosetools.assert_equal(sorted(set(tile_ids.tolist())), [0, 1, 2, 3])
+
+    def test_solve_tiled(self):
+        solution = Builder.solve_tiled(self.ref_map, self.comp_map, tiles=4,
+                                       workers=1)
+        nosetools.assert_equal(len(solution), len(self.ref_map))
+        paths = [str(r.value.entries['path']) for r in solution.records]
+        nosetools.assert_equal(len(set(paths)), len(paths))
+        parallel = Builder.solve_tiled(self.ref_map, self.comp_map, tiles=4,
+                                       workers=2)
+        nosetools.assert_equal(Builder.total_cost(parallel),
+                               Builder.total_cost(solution))
+        # with few colours, a single candidate per pixel has no solution, so the
+        # tiles are solved without a mask instead
+        self._posterise()
+        solution = Builder.solve_tiled(self.ref_map, self.comp_map, tiles=4, workers=1,
+                                       top_k=1)
+        paths = [str(r.value.entries['path']) for r in solution.records]
+        nosetools.assert_equal(len(set(paths)), len(self.ref_map))
+
+    def test_solve_hierarchical(self):
+        solution = Builder.solve_hierarchical(self.ref_map, self.comp_map,
+                                              fraction=1 / 4, groups=8, top_k=2, seed=0)
+        nosetools.assert_equal(len(solution), len(self.ref_map))
+        paths = [str(r.value.entries['path']) for r in solution.records]
+        nosetools.assert_equal(len(set(paths)), len(paths))
+
+    def test_solve_quantised(self):
+        solution = Builder.solve(self.ref_map, self.comp_map, clusters=4)
+        nosetools.assert_equal(len(solution), len(self.ref_map))
+        paths = [str(r.value.entries['path']) for r in solution.records]
+        nosetools.assert_equal(len(set(paths)), len(paths))
+        # with as many clusters as colours, it's the same as solving exactly
+        self._posterise()
+        exact = Builder.solve(self.ref_map, self.comp_map, use_mask=False)
+        quantised = Builder.solve_quantised(self.ref_map, self.comp_map, clusters=64)
+        nosetools.assert_equal(self._cost(quantised), self._cost(exact))
+
+    def test_distances(self):
+        ref_colours = np.array([[250, 100, 100], [10, 0, 255]])
+        comp_colours = np.array([[5, 100, 100], [240, 100, 100], [10, 0, 250]])
+        costs = Builder.distances(ref_colours, comp_colours)
+        nosetools.assert_equal(costs.dtype, np.int32)
+        np.testing.assert_array_equal(costs, [[235, 0, 290], [179, 289, 0]])
+        costs = Builder.distances(ref_colours.astype(np.uint8),
+                                  comp_colours.astype(np.uint8), circular_hue=True)
+        np.testing.assert_array_equal(costs, [[1, 0, 170], [179, 181, 0]])
+
+    def test_solve_circular_hue(self):
+        # hue 250 is closer to 5 than to 200 when hue wraps around
+        ref_map = ReferenceMap.from_arrays({
+            'xy': [(0, 0)],
+            'hsv': [(250, 100, 100)]
+            })
+        comp_map = ComponentMap.from_arrays({
+            'path': ['specimens/5.jpg', 'specimens/200.jpg'],
+            'hsv': [(5, 100, 100), (200, 100, 100)]
+            })
+        for kwargs in ({'use_mask': False}, {'top_k': 1}):
+            solution = Builder.solve(ref_map, comp_map, **kwargs)
+            nosetools.assert_equal(solution.paths, ['specimens/200.jpg'])
+            solution = Builder.solve(ref_map, comp_map, circular_hue=True, **kwargs)
+            nosetools.assert_equal(solution.paths, ['specimens/5.jpg'])
+
+    def test_feasible(self):
+        # three pixels that can only use the same two components
+        cost_matrix = np.array([[1, 4, 0], [1, 5, 0], [2, 4, 0], [3, 5, 0]])
+        nosetools.assert_false(Builder.feasible(cost_matrix, 3, 3))
+        cost_matrix = np.r_[cost_matrix, [[3, 6, 0]]]
+        nosetools.assert_true(Builder.feasible(cost_matrix, 3, 3))
+        arcs, rows, cols = Builder.nearest_cost_matrix(self.ref_map, self.comp_map, 1)
+        nosetools.assert_equal(Builder.feasible(arcs, rows, cols),
+                               len(np.unique(arcs[:, 1])) == rows)
+
+    def test_solve_cached_costs(self):
+        Builder.limit(self.comp_map)
+        costs = Builder.costs(self.ref_map, self.comp_map)
+        with nosetools.assert_raises(SolveError):
+            Builder.solve(self.ref_map, self.comp_map, mask_tolerance=-100,
+                          costs=costs)
+        solution = Builder.solve(self.ref_map, self.comp_map, use_mask=False,
+                                 costs=costs)
+        nosetools.assert_equal(self._cost(solution),
+                               self._cost(Builder.solve(self.ref_map, self.comp_map,
+                                                        use_mask=False)))
+
+    def test_solve_reuse(self):
+        with self.comp_map as m:
+            for r in m.records[10:]:
+                m.remove(r)
+        with nosetools.assert_raises(SolveError):
+            Builder.solve(self.ref_map, self.comp_map, use_mask=False)
+        solution = Builder.solve(self.ref_map, self.comp_map, use_mask=False, reuse=3)
+        nosetools.assert_equal(len(solution), len(self.ref_map))
+        paths = [str(r.value.entries['path']) for r in solution.records]
+        nosetools.assert_true(max(paths.count(p) for p in paths) <= 3)
+
+        spaced = Builder.solve(self.ref_map, self.comp_map, use_mask=False, reuse=3,
+                               reuse_distance=2)
+        nosetools.assert_equal(len(spaced), len(self.ref_map))
+        used = {}
+        for r in spaced.records:
+            used.setdefault(str(r.value.entries['path']), []).append(r.key.entry)
+        for positions in used.values():
+            nosetools.assert_true(len(positions) <= 3)
+            for i, (x1, y1) in enumerate(positions):
+                for x2, y2 in positions[i + 1:]:
+                    nosetools.assert_greater_equal(np.hypot(x1 - x2, y1 - y2), 2)
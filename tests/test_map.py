@@ -1,6 +1,9 @@
+import copy
+import json
 from datetime import datetime as dt
 
 import nose.tools as nosetools
+import numpy as np
 
 from linnaeus.models import (ComponentMap, CoordinateEntry, HsvEntry, LocationEntry,
                              MapRecord, ReferenceMap)
@@ -25,8 +28,21 @@ class TestMapValue:
         nosetools.assert_equal(str(self.white), '0,0,255')
 
     def test_hash(self):
-        nosetools.assert_equal(hash(self.black), 1267304713960822739)
-        nosetools.assert_equal(hash(self.white), 1267304713903735338)
+        nosetools.assert_equal(hash(self.black), hash(HsvEntry(0, 0, 0)))
+        nosetools.assert_not_equal(hash(self.black), hash(self.white))
+        nosetools.assert_is(HsvEntry(0, 0, 0), self.black)
+        nosetools.assert_is(copy.deepcopy(self.white), self.white)
+
+    def test_numpy_values(self):
+        numpy_entry = HsvEntry(np.uint8(200), np.uint8(100), np.uint8(50))
+        nosetools.assert_is(numpy_entry, HsvEntry(200, 100, 50))
+        nosetools.assert_is(HsvEntry(200.0, 100.0, 50.0), numpy_entry)
+        nosetools.assert_equal(type(numpy_entry.h), int)
+        nosetools.assert_equal(str(numpy_entry), '200,100,50')
+        nosetools.assert_greater(numpy_entry, HsvEntry(0, 0, 255))
+        for invalid in (254.7, float('nan'), float('inf')):
+            with nosetools.assert_raises(ValueError):
+                HsvEntry(invalid, 0, 0)
 
     def test_subtract(self):
         nosetools.assert_equal(self.white - self.black, self.black - self.white)
@@ -42,6 +58,12 @@ class TestCoordinateEntry:
         nosetools.assert_true(self.key.validate())
         nosetools.assert_false(self.bad_key.validate())
 
+    def test_hash(self):
+        keys = [CoordinateEntry(x, y) for x in range(10) for y in range(10)]
+        nosetools.assert_equal(len({hash(k) for k in keys}), len(keys))
+        nosetools.assert_equal(hash(CoordinateEntry(2, 3)), hash(CoordinateEntry(2, 3)))
+        nosetools.assert_less(CoordinateEntry(2, 3), CoordinateEntry(3, 2))
+
 
 class TestMapRecord:
     def setUp(self):
@@ -71,6 +93,12 @@ class TestComponentMap:
         self.serialised = '{"a": [0, 0, 0], "b": [1, 1, 1], "c": [2, 2, 2], ' \
                           '"d": [0, 2, 1]}'
 
+    def _arrays(self):
+        return {
+            'path': list('abcd'),
+            'hsv': [(0, 0, 0), (1, 1, 1), (2, 2, 2), (0, 2, 1)]
+            }
+
     def test_add_records(self):
         with self.map as m:
             m.add(LocationEntry('random key'), HsvEntry(0, 0, 0))
@@ -96,10 +124,123 @@ class TestComponentMap:
         nosetools.assert_is_not_none(self.map.records)
         nosetools.assert_equal(str(self.map.records[-1].key), 'c')
 
+    def test_records_cache(self):
+        self._add_records()
+        stored = [str(r.key) for r in self.map.iter_records()]
+        with self.map as m:
+            records = m.records
+            nosetools.assert_is(m.records, records)
+            nosetools.assert_equal([str(r.key) for r in records],
+                                   [str(r.key) for r in sorted(m.iter_records())])
+            m.add(*self._extra_record())
+            nosetools.assert_is_not(m.records, records)
+            nosetools.assert_equal(len(m.records), len(records) + 1)
+            nosetools.assert_equal(m.records[0].value, HsvEntry(0, 0, 0))
+        nosetools.assert_equal([str(r.key) for r in self.map.iter_records()][:-1],
+                               stored)
+
+    def _extra_record(self):
+        return LocationEntry('e'), HsvEntry(0, 0, 0)
+
     def test_serialise(self):
         self._add_records()
-        s = self.map.serialise()
-        nosetools.assert_equal(s, self.serialised)
+        content = json.loads(self.map.serialise())
+        header = content.pop(self.map.header_key)
+        nosetools.assert_equal(json.dumps(content), self.serialised)
+        nosetools.assert_equal(header, self.map.header())
+        nosetools.assert_equal(header['type'], type(self.map).__name__)
+        nosetools.assert_equal(header['records'], len(self.map))
+
+    def test_from_arrays(self):
+        self._add_records()
+        map_type = type(self.map)
+        arrays = self._arrays()
+        new_map = map_type.from_arrays(arrays)
+        nosetools.assert_equal(new_map.serialise(), self.map.serialise())
+        nosetools.assert_true(new_map.check())
+        key = map_type.key_columns[0]
+        duplicated = dict(arrays, **{key: arrays[key][:1] * 4})
+        with nosetools.assert_raises(KeyError):
+            map_type.from_arrays(duplicated)
+        with nosetools.assert_raises(ValueError):
+            map_type.from_arrays(dict(arrays, hsv=[(0, 0, 256)] * 4))
+        for invalid in (np.nan, np.inf, 254.7):
+            with nosetools.assert_raises(ValueError):
+                map_type.from_arrays(dict(arrays, hsv=[(invalid, 0, 0)] * 4))
+        whole = map_type.from_arrays(dict(arrays, hsv=np.asarray(arrays['hsv'], float)))
+        nosetools.assert_equal(whole.serialise(), self.map.serialise())
+        with nosetools.assert_raises(ValueError):
+            map_type.from_arrays(dict(arrays, hsv=[(0, 0)] * 4))
+        with new_map as m:
+            with nosetools.assert_raises(KeyError):
+                m.extend(arrays)
+            nosetools.assert_equal(len(m), 4)
+        with nosetools.assert_raises(IOError):
+            new_map.extend(arrays)
+
+    def test_columns(self):
+        self._add_records()
+        colours = self.map.column('hsv')
+        nosetools.assert_equal(colours.dtype, np.uint8)
+        nosetools.assert_equal(colours.tolist(),
+                               [list(r.value.entry) for r in self.map.records])
+        records = self.map.records
+        with self.map as m:
+            m.remove(records[0])
+        # records are views, but removing rows doesn't change the ones already made
+        nosetools.assert_equal(str(records[1]), str(self.map.records[0]))
+        nosetools.assert_equal(len(self.map.column('hsv')), 3)
+        nosetools.assert_true(self.map.check())
+
+    def test_lookup(self):
+        self._add_records()
+        for r in self.map.records:
+            nosetools.assert_equal(str(self.map[r.key]), str(r))
+        records = self.map.records
+        with self.map as m:
+            m.remove_many(records[1:3])
+            nosetools.assert_true(m.check())
+            nosetools.assert_equal(len(m), 2)
+            with nosetools.assert_raises(KeyError):
+                m[records[1].key]
+            nosetools.assert_equal(str(m[records[3].key]), str(records[3]))
+            m.add(records[1].key, records[1].value)
+        nosetools.assert_equal(str(self.map[records[1].key]), str(records[1]))
+        nosetools.assert_true(self.map.check())
+
+    def test_colour_index(self):
+        self._add_records()
+        index = self.map.colour_index
+        nosetools.assert_equal(index.n, len(self.map))
+        nosetools.assert_is(self.map.colour_index, index)
+        _, ix = index.query([2, 2, 2])
+        nosetools.assert_equal(str(self.map.records[ix].value), '2,2,2')
+        with self.map as m:
+            m.add(LocationEntry('e'), HsvEntry(9, 9, 9))
+        nosetools.assert_equal(self.map.colour_index.n, len(self.map))
+
+    def test_reduce(self):
+        rng = np.random.default_rng(0)
+        with self.map as m:
+            # mostly dark components, and a few bright ones
+            for i, v in enumerate(rng.integers(0, 64, 200).tolist() +
+                                  rng.integers(200, 256, 10).tolist()):
+                m.add(LocationEntry(str(i)), HsvEntry(0, 0, v))
+        reference = ReferenceMap()
+        with reference as m:
+            for i in range(10):
+                m.add(CoordinateEntry(i, 0), HsvEntry(0, 0, 220 + i))
+        reduced = copy.deepcopy(self.map)
+        reduced.reduce(20, reference, seed=1)
+        nosetools.assert_equal(len(reduced), 20)
+        nosetools.assert_true(reduced.check())
+        bright = [r for r in reduced.records if r.value.entry[2] >= 200]
+        nosetools.assert_equal(len(bright), 10)
+        again = copy.deepcopy(self.map)
+        again.reduce(20, reference, seed=1)
+        nosetools.assert_equal(again.serialise(), reduced.serialise())
+        self.map.reduce(20, seed=1)
+        nosetools.assert_equal(len(self.map), 20)
 
 
 class TestReferenceMap(TestComponentMap):
@@ -115,6 +256,15 @@ class TestReferenceMap(TestComponentMap):
         self.serialised = '{"0|0": [0, 0, 0], "1|1": [1, 1, 1], "0|1": [2, 2, 2], ' \
                           '"2|2": [0, 2, 1]}'
 
+    def _arrays(self):
+        return {
+            'xy': [(0, 0), (1, 1), (0, 1), (2, 2)],
+            'hsv': [(0, 0, 0), (1, 1, 1), (2, 2, 2), (0, 2, 1)]
+            }
+
+    def _extra_record(self):
+        return CoordinateEntry(3, 3), HsvEntry(0, 0, 0)
+
     def test_add_records(self):
         with self.map as m:
             m.add(CoordinateEntry(0, 0), HsvEntry(0, 0, 0))
@@ -126,12 +276,21 @@ class TestReferenceMap(TestComponentMap):
                 m.add(CoordinateEntry(0, 0), HsvEntry(1, 1, 1))
             with nosetools.assert_raises(KeyError):
                 m.add(CoordinateEntry(1.2, 3), HsvEntry(0, 0, 0))
+            # coordinates are stored as int16, so these would wrap around
+            with nosetools.assert_raises(KeyError):
+                m.add(CoordinateEntry(40000, 3), HsvEntry(0, 0, 0))
+        nosetools.assert_equal(len(self.map), 1)
+        with nosetools.assert_raises(KeyError):
+            ReferenceMap.from_arrays({
+                'xy': [(0, -40000)],
+                'hsv': [(0, 0, 0)]
+                })
 
     def test_add_many_records(self):
         start = dt.now()
         with self.map as m:
             for i in range(100000):
-                m.add(CoordinateEntry(i, i), HsvEntry(0, 0, 0))
+                m.add(CoordinateEntry(i % 1000, i // 1000), HsvEntry(0, 0, 0))
         elapsed = (dt.now() - start).total_seconds()
         nosetools.assert_less(elapsed, 10)
 
@@ -139,3 +298,9 @@ class TestReferenceMap(TestComponentMap):
         self._add_records()
         nosetools.assert_is_not_none(self.map.records)
         nosetools.assert_equal(str(self.map.records[-1].key), '0|1')
+
+    def test_colour_index(self):
+        nosetools.assert_false(hasattr(self.map, 'colour_index'))
+
+    def test_reduce(self):
+        nosetools.assert_false(hasattr(self.map, 'reduce'))
@@ -1,11 +1,18 @@
+import io
+import json
+import os
+import tempfile
+
 import nose.tools as nosetools
+import numpy as np
 import requests
 import requests_mock
+from PIL import Image
 from unittest.mock import patch
 import re
 
-from linnaeus.factories import MapFactory
-from linnaeus.models import ComponentMap, ReferenceMap, SolutionMap
+from linnaeus.factories import MapFactory, _json
+from linnaeus.models import ComponentMap, HsvEntry, ReferenceMap, SolutionMap
 from . import helpers
 
 
@@ -30,6 +37,75 @@ class TestMapFactory:
         nosetools.assert_equal(len(ref_map), 1)
         nosetools.assert_equal(len(comp_map), 1)
 
+    def test_binary(self):
+        with tempfile.TemporaryDirectory() as d:
+            for txt in (helpers.serialised.ref, helpers.serialised.comp,
+                        helpers.serialised.sol):
+                saved_map = MapFactory.deserialise(txt)
+                for ext in ('.npz', '.json'):
+                    path = os.path.join(d, 'map' + ext)
+                    MapFactory.save(path, saved_map)
+                    loaded_map = MapFactory.load(path)
+                    nosetools.assert_is_instance(loaded_map, type(saved_map))
+                    nosetools.assert_equal(loaded_map.serialise(),
+                                           saved_map.serialise())
+            path = os.path.join(d, 'map.npz')
+            with nosetools.assert_raises(TypeError):
+                MapFactory.reference().load(path)
+
+    def test_read_in_chunks(self):
+        for txt in (helpers.serialised.ref, helpers.serialised.comp,
+                    helpers.serialised.sol):
+            nosetools.assert_equal(list(_json.records(io.StringIO(txt), chunk_size=7)),
+                                   list(json.loads(txt).items()))
+            loaded_map = MapFactory.read(io.StringIO(txt))
+            map_class = MapFactory.identify(txt).product_class
+            nosetools.assert_is_instance(loaded_map, map_class)
+            nosetools.assert_equal(loaded_map.serialise(),
+                                   MapFactory.deserialise(txt).serialise())
+        with nosetools.assert_raises(json.JSONDecodeError):
+            MapFactory.read(io.StringIO(helpers.serialised.ref + ' trailing'))
+
+    def test_header(self):
+        with tempfile.TemporaryDirectory() as d:
+            for txt in (helpers.serialised.ref, helpers.serialised.comp,
+                        helpers.serialised.sol):
+                saved_map = MapFactory.deserialise(txt)
+                old_path = os.path.join(d, 'old.json')
+                MapFactory.save_text(old_path, txt)
+                nosetools.assert_is_none(MapFactory.read_header(old_path))
+                nosetools.assert_is(MapFactory.identify_file(old_path),
+                                    MapFactory.identify(txt))
+                for ext in ('.npz', '.json'):
+                    path = os.path.join(d, 'map' + ext)
+                    MapFactory.save(path, saved_map)
+                    header = MapFactory.read_header(path)
+                    nosetools.assert_equal(header, saved_map.header())
+                    nosetools.assert_is(MapFactory.identify_file(path),
+                                        MapFactory.identify(txt))
+                    nosetools.assert_equal(MapFactory.load(path).content_hash(),
+                                           header['hash'])
+            with nosetools.assert_raises(TypeError):
+                MapFactory.reference().load(os.path.join(d, 'map.json'))
+
+    def test_solution_components(self):
+        sol_map = SolutionMap.from_arrays({
+            'xy': [(0, 0), (0, 1), (1, 0)],
+            'path': ['specimens/a.jpg', 'specimens/a.jpg', 'specimens/b.jpg'],
+            'target': [(0, 0, 0), (1, 1, 1), (2, 2, 2)]
+            })
+        txt = sol_map.serialise()
+        components = json.loads(txt)[SolutionMap.components_key]
+        nosetools.assert_equal(components['path'], ['a', 'b'])
+        nosetools.assert_is(MapFactory.identify(txt), MapFactory.solution())
+        for loaded_map in (MapFactory.deserialise(txt),
+                           MapFactory.read(io.StringIO(txt))):
+            nosetools.assert_equal(loaded_map.serialise(), txt)
+            paths = [loaded_map[k].value.entries['path'] for k in ([0, 0], [0, 1])]
+            nosetools.assert_is(paths[0], paths[1])
+        with nosetools.assert_raises(ValueError):
+            MapFactory.deserialise(txt.replace('[1, 2, 2, 2]', '[2, 2, 2, 2]'))
+
 
 class TestReferenceMapFactory:
     def test_from_local(self):
@@ -56,6 +132,19 @@ class TestReferenceMapFactory:
         nosetools.assert_is_instance(ref_map, ReferenceMap)
         nosetools.assert_greater(len(ref_map), 0)
 
+    def test_from_pil(self):
+        pixels = np.zeros((3, 4, 4), dtype=np.uint8)
+        pixels[..., 3] = 255
+        pixels[1, 2] = (255, 255, 255, 255)
+        pixels[0, 1, 3] = 0
+        ref_map = MapFactory.reference().from_image_pil(
+            Image.fromarray(pixels, 'RGBA'), resize=False)
+        nosetools.assert_equal(len(ref_map), 11)
+        nosetools.assert_equal(ref_map.bounds, [4, 3])
+        nosetools.assert_equal(ref_map[[2, 1]].value, HsvEntry(0, 0, 255))
+        with nosetools.assert_raises(KeyError):
+            ref_map[[1, 0]]
+
 
 class TestComponentMapFactory:
     def test_from_local_files(self):
@@ -0,0 +1,88 @@
+import os
+import tempfile
+
+import nose.tools as nosetools
+
+from linnaeus.planner import Planner
+
+
+class TestPlanner:
+    def setUp(self):
+        self.planner = Planner()
+
+    def test_largest_pool(self):
+        rows, comps = 10000, 100000
+        budget = 512 * 2 ** 20
+        for strategy in Planner.strategies:
+            pool = self.planner.largest_pool(strategy, rows, comps, budget)
+            if pool is None:
+                continue
+            nosetools.assert_true(rows <= pool <= comps)
+            nosetools.assert_less_equal(
+                self.planner.estimate(strategy, rows, pool).memory, budget)
+            if pool < comps:
+                nosetools.assert_greater(
+                    self.planner.estimate(strategy, rows, pool + 1).memory, budget)
+        nosetools.assert_is_none(
+            self.planner.largest_pool('dense', comps, rows, budget))
+
+    def test_plan(self):
+        plans = self.planner.plan(20000, 100000, 256 * 2 ** 20, top_k=10)
+        nosetools.assert_equal(sorted(p.strategy for p in plans),
+                               sorted(Planner.strategies))
+        best = plans[0]
+        nosetools.assert_true(best.fits)
+        nosetools.assert_equal(best.strategy, 'top_k')
+        nosetools.assert_equal(best.top_k, 10)
+        nosetools.assert_equal(best.pool, 100000)
+        # a dense cost matrix for 20k pixels can't fit in 256 MB
+        dense = [p for p in plans if p.strategy == 'dense'][0]
+        nosetools.assert_false(dense.fits)
+
+    def test_plan_reuse(self):
+        # 5000 components used up to 4 times each are enough for 20000 pixels
+        plans = self.planner.plan(20000, 5000, 4 * 2 ** 30, reuse=4)
+        nosetools.assert_true(plans[0].fits)
+        nosetools.assert_equal(plans[0].pool, 5000)
+        # tiled solves can't reuse components
+        nosetools.assert_not_in('tiled', [p.strategy for p in plans])
+        nosetools.assert_equal(
+            self.planner.largest_pool('top_k', 20001, 5001, 4 * 2 ** 30, reuse=4), 5001)
+        nosetools.assert_is_none(
+            self.planner.largest_pool('top_k', 20001, 5000, 4 * 2 ** 30, reuse=4))
+
+    def test_solver(self):
+        # an unmasked solve above dense_solver_limit uses the sparse solver, which
+        # needs more memory for each cell
+        rows = 10000
+        small, large = 5000, 20000
+        dense = self.planner.estimate('dense', rows, small)
+        sparse = self.planner.estimate('dense', rows, large)
+        nosetools.assert_equal(dense.solver, 'dense')
+        nosetools.assert_equal(sparse.solver, 'sparse')
+        nosetools.assert_greater(sparse.memory, rows * large *
+                                 Planner.defaults['sparse']['bytes'])
+        forced = self.planner.estimate('dense', rows, large, backend='dense')
+        nosetools.assert_equal(forced.solver, 'dense')
+        reused = self.planner.estimate('dense', rows, small, reuse=2)
+        nosetools.assert_equal(reused.solver, 'flow')
+        nosetools.assert_is_none(self.planner.estimate('masked', rows, large).solver)
+        budget = 4 * 2 ** 30
+        pool = self.planner.largest_pool('dense', rows, 100000, budget)
+        nosetools.assert_less_equal(self.planner.estimate('dense', rows, pool).memory,
+                                    budget)
+
+    def test_calibration(self):
+        calibration = {
+            'dense': {
+                'bytes': 1.0
+                }
+            }
+        planner = Planner(calibration)
+        nosetools.assert_equal(planner.calibration['dense']['bytes'], 1.0)
+        nosetools.assert_equal(planner.calibration['dense']['seconds'],
+                               Planner.defaults['dense']['seconds'])
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, '.calibration')
+            planner.dump(path)
+            nosetools.assert_equal(Planner.load(path).calibration, planner.calibration)